@@ -4,6 +4,7 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_migrate import Migrate
 from dotenv import load_dotenv
+from .database import engine_options, install_sqlite_pragmas, install_query_counter
 
 # Load environment variables
 load_dotenv()
@@ -21,9 +22,110 @@ def create_app():
 
     # Configuration
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'a_very_secret_key_for_development')
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(app.instance_path, 'database.db')
+    app.config['SQLALCHEMY_DATABASE_URI'] = (os.environ.get('SQLALCHEMY_DATABASE_URI') or os.environ.get('DATABASE_URL')
+                                             or 'sqlite:///' + os.path.join(app.instance_path, 'database.db'))
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+    # SQLite connection tuning (busy timeout in milliseconds, mmap size in bytes), and the
+    # connection pool used for other databases (e.g. Postgres).
+    app.config['SQLITE_BUSY_TIMEOUT'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))
+    app.config['SQLITE_SYNCHRONOUS'] = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    app.config['SQLITE_MMAP_SIZE'] = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(
+        app.config['SQLALCHEMY_DATABASE_URI'], app.config['SQLITE_BUSY_TIMEOUT'],
+        int(os.environ.get('DB_POOL_SIZE', 5)), int(os.environ.get('DB_MAX_OVERFLOW', 10)))
+    # Send the number of SQL statements each request ran in an X-DB-Queries header.
+    app.config['DB_QUERY_COUNT'] = os.environ.get('DB_QUERY_COUNT', '0').lower() in ('1', 'true', 'yes')
+
+    # Prometheus metrics at /metrics. METRICS_DIR lets every Gunicorn worker write its values there, so
+    # /metrics reports all workers; METRICS_TOKEN requires "Authorization: Bearer <token>" to read them.
+    # Without a token /metrics is off, unless METRICS_PUBLIC opens it to anyone who can reach the server;
+    # METRICS_SERVER_TIMING adds a Server-Timing header with each request's stage timings.
+    app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR', '')
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN', '')
+    app.config['METRICS_PUBLIC'] = os.environ.get('METRICS_PUBLIC', '0').lower() in ('1', 'true', 'yes')
+    app.config['METRICS_SERVER_TIMING'] = os.environ.get('METRICS_SERVER_TIMING', '0').lower() in ('1', 'true', 'yes')
+
+    # Logged-in users are cached per worker for USER_CACHE_TTL seconds (0 disables),
+    # so authenticating a request does not need a database query.
+    app.config['USER_CACHE_TTL'] = float(os.environ.get('USER_CACHE_TTL', 60))
+    app.config['USER_CACHE_SIZE'] = int(os.environ.get('USER_CACHE_SIZE', 1024))
+
+    # SpaCy models: SPACY_MODEL serves medium/high, SPACY_MODEL_LOW (e.g. en_core_web_sm) the 'low' level.
+    # With SPACY_PRELOAD set the models are loaded here instead of on first request,
+    # which lets a Gunicorn master (preload_app = True) share them with its workers.
+    app.config['SPACY_MODEL'] = os.environ.get('SPACY_MODEL', 'en_core_web_lg')
+    app.config['SPACY_MODEL_LOW'] = os.environ.get('SPACY_MODEL_LOW', app.config['SPACY_MODEL'])
+    app.config['SPACY_PRELOAD'] = os.environ.get('SPACY_PRELOAD', '0').lower() in ('1', 'true', 'yes')
+
+    # Gazetteer of organisation-specific terms (JSON file, disabled if unset). Its tokenized terms are cached
+    # in GAZETTEER_CACHE_DIR, and every worker reloads a changed file after at most GAZETTEER_RELOAD_INTERVAL seconds.
+    app.config['GAZETTEER_PATH'] = os.environ.get('GAZETTEER_PATH', '')
+    app.config['GAZETTEER_CACHE_DIR'] = os.environ.get('GAZETTEER_CACHE_DIR',
+                                                       os.path.join(app.instance_path, 'gazetteer'))
+    app.config['GAZETTEER_RELOAD_INTERVAL'] = float(os.environ.get('GAZETTEER_RELOAD_INTERVAL', 30))
+
+    # Faker suggestion pools: comma-separated locales (the first is the default), buffer size per
+    # label, and whether each document gets reproducible suggestions seeded from its content.
+    app.config['SUGGESTION_LOCALES'] = os.environ.get('SUGGESTION_LOCALES', 'en_US').split(',')
+    app.config['SUGGESTION_POOL_SIZE'] = int(os.environ.get('SUGGESTION_POOL_SIZE', 2000))
+    app.config['SUGGESTION_DETERMINISTIC'] = os.environ.get('SUGGESTION_DETERMINISTIC', '0').lower() in ('1', 'true', 'yes')
+
+    # NER result cache (one entry per paragraph): in-memory LRU entries, plus an optional SQLite file shared by all workers.
+    app.config['NER_CACHE_SIZE'] = int(os.environ.get('NER_CACHE_SIZE', 20000))
+    app.config['NER_CACHE_PATH'] = os.environ.get('NER_CACHE_PATH', '')
+
+    # Levels whose paragraphs are pre-filtered by rules and skip SpaCy if they cannot contain a name or age
+    # (off by default: lower-case names are missed), and an optional file of extra names, one per line, for
+    # the pre-filter's gazetteer.
+    app.config['NER_PREFILTER_LEVELS'] = [level for level in os.environ.get('NER_PREFILTER_LEVELS', '').split(',')
+                                          if level]
+    app.config['NER_PREFILTER_NAMES'] = os.environ.get('NER_PREFILTER_NAMES', '')
+
+    # Background GPT jobs. They run in the worker that accepted them and are lost if it exits; only their
+    # status is shared, through GPT_JOB_STATUS_STORE (an SQLite file, or 'memory' for a single-process
+    # deployment; GPT_JOB_STORE is the old name). OPENAI_BASE_URL points the client at any
+    # OpenAI-compatible server (e.g. a local stub).
+    app.config['GPT_JOB_CONCURRENCY'] = int(os.environ.get('GPT_JOB_CONCURRENCY', 4))
+    app.config['GPT_JOB_TIMEOUT'] = float(os.environ.get('GPT_JOB_TIMEOUT', 300))
+    app.config['GPT_JOB_TTL'] = int(os.environ.get('GPT_JOB_TTL', 3600))
+    app.config['GPT_JOB_POLL_INTERVAL'] = float(os.environ.get('GPT_JOB_POLL_INTERVAL', 0.5))
+    app.config['GPT_JOB_STATUS_STORE'] = (os.environ.get('GPT_JOB_STATUS_STORE') or os.environ.get('GPT_JOB_STORE')
+                                          or os.path.join(app.instance_path, 'jobs.db'))
+    app.config['OPENAI_BASE_URL'] = os.environ.get('OPENAI_BASE_URL') or None
+
+    # Reports longer than GPT_CHUNK_CHARS (0 disables) are split at paragraph boundaries and the
+    # chunks are sent concurrently, at most GPT_CHUNK_CONCURRENCY at a time per job.
+    app.config['GPT_CHUNK_CHARS'] = int(os.environ.get('GPT_CHUNK_CHARS', 12000))
+    app.config['GPT_CHUNK_CONCURRENCY'] = int(os.environ.get('GPT_CHUNK_CONCURRENCY', 4))
+    app.config['GPT_MAX_RETRIES'] = int(os.environ.get('GPT_MAX_RETRIES', 5))
+
+    # Anonymization wizard sessions: the uploaded text, entities and result of a pass through the
+    # wizard, kept server-side for WIZARD_SESSION_TTL seconds. WIZARD_SESSION_STORE is an SQLite
+    # file shared by all workers, or 'memory' for a single-process deployment.
+    app.config['WIZARD_SESSION_TTL'] = int(os.environ.get('WIZARD_SESSION_TTL', 3600))
+    app.config['WIZARD_SESSION_STORE'] = os.environ.get('WIZARD_SESSION_STORE',
+                                                        os.path.join(app.instance_path, 'sessions.db'))
+
+    # Batch processing (/process-batch) defaults; requests may lower but not exceed them
+    app.config['NLP_BATCH_SIZE'] = int(os.environ.get('NLP_BATCH_SIZE', 32))
+    app.config['NLP_N_PROCESS'] = int(os.environ.get('NLP_N_PROCESS', 1))
+    app.config['NLP_MAX_PROCESSES'] = int(os.environ.get('NLP_MAX_PROCESSES', os.cpu_count() or 1))
+    app.config['BATCH_MAX_DOCUMENTS'] = int(os.environ.get('BATCH_MAX_DOCUMENTS', 1000))
+
+    # Uploaded file limits (per file), and the process pool that extracts text from large PDFs
+    # page-parallel (PDFs with fewer than EXTRACT_PARALLEL_MIN_PAGES pages are read in-process).
+    app.config['EXTRACT_MAX_BYTES'] = int(os.environ.get('EXTRACT_MAX_BYTES', 50 * 1024 * 1024))
+    app.config['EXTRACT_MAX_PAGES'] = int(os.environ.get('EXTRACT_MAX_PAGES', 1000))
+    app.config['EXTRACT_PDF_WORKERS'] = int(os.environ.get('EXTRACT_PDF_WORKERS', min(4, os.cpu_count() or 1)))
+    app.config['EXTRACT_PARALLEL_MIN_PAGES'] = int(os.environ.get('EXTRACT_PARALLEL_MIN_PAGES', 20))
+
+    # Rendered PDF/DOCX downloads are cached here, one sub-directory per report.
+    app.config['RENDER_CACHE_DIR'] = os.environ.get('RENDER_CACHE_DIR', os.path.join(app.instance_path, 'renders'))
+    # Variants rendered in the background after /save-report, e.g. 'pdf:highlighted,docx:clean' or 'all' (empty disables).
+    app.config['RENDER_PRERENDER'] = os.environ.get('RENDER_PRERENDER', '')
+    app.config['RENDER_WORKERS'] = int(os.environ.get('RENDER_WORKERS', 2))
+
     # Ensure the instance folder exists
     try:
         os.makedirs(app.instance_path)
@@ -36,18 +138,79 @@ def create_app():
     login_manager.init_app(app)
 
     from .models import User
+    from .user_cache import user_cache
+    user_cache.configure(app.config['USER_CACHE_TTL'], app.config['USER_CACHE_SIZE'])
+
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return user_cache.load(db.session, User, int(user_id))
 
     # Register blueprints
     from .auth import auth as auth_blueprint
     app.register_blueprint(auth_blueprint, url_prefix='/')
 
+    from .metrics import metrics, install_request_metrics
+    metrics.configure(app.config['METRICS_DIR'] or None)
+    install_request_metrics(app, app.config['METRICS_SERVER_TIMING'])
+
     from .main import main as main_blueprint
     app.register_blueprint(main_blueprint, url_prefix='/')
 
     with app.app_context():
+        install_sqlite_pragmas(db.engine, app.config['SQLITE_BUSY_TIMEOUT'], app.config['SQLITE_SYNCHRONOUS'],
+                               app.config['SQLITE_MMAP_SIZE'])
+        if app.config['DB_QUERY_COUNT']:
+            install_query_counter(app, db.engine)
         db.create_all()
+        from .search import create_search_index
+        create_search_index()
+        # Connections opened here must not be inherited by forked (e.g. Gunicorn) workers.
+        db.engine.dispose()
+
+    from .gazetteer import gazetteer
+    gazetteer.configure(app.config['GAZETTEER_PATH'] or None, app.config['GAZETTEER_CACHE_DIR'] or None,
+                        app.config['GAZETTEER_RELOAD_INTERVAL'])
+
+    from .helpers import configure_pipelines, preload_pipelines
+    configure_pipelines(app.config['SPACY_MODEL'], app.config['SPACY_MODEL_LOW'])
+    if app.config['SPACY_PRELOAD']:
+        preload_pipelines()
+
+    from .extraction import configure_extraction
+    configure_extraction(max_bytes=app.config['EXTRACT_MAX_BYTES'], max_pages=app.config['EXTRACT_MAX_PAGES'],
+                         pdf_workers=app.config['EXTRACT_PDF_WORKERS'],
+                         pdf_parallel_min_pages=app.config['EXTRACT_PARALLEL_MIN_PAGES'])
+
+    from .renders import render_cache, parse_variants
+    render_cache.configure(app.config['RENDER_CACHE_DIR'], parse_variants(app.config['RENDER_PRERENDER']),
+                           app.config['RENDER_WORKERS'])
+
+    from .ner_cache import ner_cache
+    ner_cache.configure(app.config['NER_CACHE_SIZE'], app.config['NER_CACHE_PATH'] or None)
+
+    from .helpers import LEVEL_LABELS
+    from .prefilter import ner_prefilter, TARGET_LABELS
+    for level in app.config['NER_PREFILTER_LEVELS']:
+        if not LEVEL_LABELS.get(level, TARGET_LABELS | {None}) <= TARGET_LABELS:
+            raise ValueError(f"NER_PREFILTER_LEVELS: the pre-filter only finds {', '.join(sorted(TARGET_LABELS))}, "
+                             f"which does not cover level '{level}'.")
+    ner_prefilter.configure(app.config['NER_PREFILTER_LEVELS'], app.config['NER_PREFILTER_NAMES'] or None)
+
+    from .jobs import job_queue
+    job_queue.configure(app.config['GPT_JOB_CONCURRENCY'], app.config['GPT_JOB_TIMEOUT'], app.config['GPT_JOB_TTL'],
+                        None if app.config['GPT_JOB_STATUS_STORE'] == 'memory' else app.config['GPT_JOB_STATUS_STORE'])
+
+    from .sessions import wizard_sessions
+    wizard_sessions.configure(app.config['WIZARD_SESSION_TTL'],
+                              None if app.config['WIZARD_SESSION_STORE'] == 'memory' else app.config['WIZARD_SESSION_STORE'])
+
+    from .suggestions import suggestion_pool
+    suggestion_pool.configure(app.config['SUGGESTION_LOCALES'], app.config['SUGGESTION_POOL_SIZE'],
+                              deterministic=app.config['SUGGESTION_DETERMINISTIC'])
+    suggestion_pool.start()
+
+    # `flask anonymize`: bulk anonymization of a directory, outside the web app.
+    from .bulk import anonymize_command
+    app.cli.add_command(anonymize_command)
 
     return app
\ No newline at end of file
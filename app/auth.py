@@ -1,6 +1,7 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, login_required, current_user
 from .models import User
+from .user_cache import user_cache
 from . import db
 
 auth = Blueprint('auth', __name__)
@@ -95,6 +96,7 @@ def profile():
             flash('No changes were detected.', 'info')
         else:
             db.session.commit()
+            user_cache.invalidate(current_user.id)
             # Construct a dynamic success message
             success_message = f"Your {' and '.join(changes_made)} has been updated successfully!"
             flash(success_message, 'success')
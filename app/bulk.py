@@ -0,0 +1,311 @@
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from werkzeug.datastructures import FileStorage
+
+from .extraction import SUPPORTED_EXTENSIONS
+
+OUTPUT_FORMATS = ('txt', 'docx', 'pdf')
+CHECKPOINT_NAME = '.anonymize-checkpoint.jsonl'
+
+# App settings the pool workers are configured from.
+WORKER_SETTINGS = ['SPACY_MODEL', 'SPACY_MODEL_LOW', 'GAZETTEER_PATH', 'GAZETTEER_CACHE_DIR', 'GAZETTEER_RELOAD_INTERVAL',
+                   'NER_CACHE_SIZE', 'NER_CACHE_PATH', 'NER_PREFILTER_LEVELS', 'NER_PREFILTER_NAMES',
+                   'SUGGESTION_LOCALES', 'SUGGESTION_POOL_SIZE', 'EXTRACT_MAX_BYTES', 'EXTRACT_MAX_PAGES']
+
+
+# --- Choices ---
+def review_choices(entities, mapping=None, keep_unmapped=False):
+    """
+    The choices a reviewer would make for every entity: the replacement from
+    `mapping` (looked up by the displayed text, then by each variation), or
+    else the first suggestion (or, with `keep_unmapped`, the original text).
+    """
+    choices = []
+    for entity in entities:
+        replacement = None
+        if mapping:
+            replacement = next((mapping[text] for text in [entity['display_text'], *entity['text_to_replace']]
+                                if text in mapping), None)
+        if replacement is None:
+            suggestions = [] if keep_unmapped else entity['suggestions']
+            replacement = suggestions[0] if suggestions else entity['display_text']
+        choices.append({
+            'original': entity['display_text'],
+            'original_list': entity['text_to_replace'],
+            'replacement': replacement,
+        })
+    return choices
+
+
+def load_mapping(path):
+    """A JSON object of {original: replacement} strings."""
+    with open(path, encoding='utf-8') as file:
+        mapping = json.load(file)
+    if not isinstance(mapping, dict) or not all(isinstance(key, str) and isinstance(value, str)
+                                                for key, value in mapping.items()):
+        raise ValueError('The mapping file must be a JSON object of {"original": "replacement"} strings.')
+    return mapping
+
+
+# --- Input and Output Files ---
+def iter_input_files(directory, exclude=None):
+    """Relative paths of the supported files under `directory`, in a stable order, skipping `exclude`."""
+    exclude = os.path.realpath(exclude) if exclude else None
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(name for name in dirs if os.path.realpath(os.path.join(root, name)) != exclude)
+        for name in sorted(files):
+            if name.lower().endswith(SUPPORTED_EXTENSIONS) and not name.startswith('.'):
+                yield os.path.relpath(os.path.join(root, name), directory)
+
+
+def output_paths(relative, formats):
+    """
+    {format: relative output path}. An output keeps the input's name if it is
+    of the same type and adds the format's extension otherwise
+    ('a.pdf' -> 'a.pdf', 'a.pdf.txt'), so inputs never share an output.
+    """
+    extension = os.path.splitext(relative)[1].lower()
+    return {file_format: relative if extension == f'.{file_format}' else f'{relative}.{file_format}'
+            for file_format in formats}
+
+
+def write_output(path, file_format, text, highlighted):
+    from .helpers import generate_pdf_report, generate_docx_report
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    # Written to a temporary name and renamed, so an interrupted run never leaves a partial output.
+    handle, temp_path = tempfile.mkstemp(dir=directory, prefix='.anonymize-')
+    try:
+        with os.fdopen(handle, 'wb') as output:
+            if file_format == 'pdf':
+                generate_pdf_report(text, highlighted, output)
+            elif file_format == 'docx':
+                generate_docx_report(text, highlighted, output)
+            else:
+                output.write(text.encode('utf-8'))
+        os.replace(temp_path, path)
+    except Exception:
+        os.unlink(temp_path)
+        raise
+
+
+# --- Checkpoint ---
+class Checkpoint:
+    """
+    An append-only log (JSON lines) of the files a run has finished, so an
+    interrupted run continues where it stopped. The first line records the
+    run's options; a file is skipped when it is logged as done with the size
+    and modification time it still has. Failed files are tried again.
+    """
+
+    def __init__(self, path, options, restart=False):
+        self.path = path
+        self.done = {}
+        if restart and os.path.exists(path):
+            os.remove(path)
+        content = ''
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as file:
+                content = file.read()
+        records = []
+        for line in content.splitlines():
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue  # The last line of a killed run may be incomplete.
+        if records and records[0].get('options') != options:
+            raise click.UsageError(f"{path} was written by a run with different options "
+                                   f"({records[0].get('options')}); pass --restart to start over.")
+        for record in records[1:]:
+            if record.get('status') == 'done':
+                self.done[record['path']] = record['stamp']
+            else:
+                self.done.pop(record.get('path'), None)
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+        if content and not content.endswith('\n'):
+            self._file.write('\n')
+        if not records:
+            self._write({'options': options})
+
+    def is_done(self, relative, stamp):
+        return self.done.get(relative) == list(stamp)
+
+    def record(self, relative, stamp, **fields):
+        self._write({'path': relative, 'stamp': list(stamp), **fields})
+        if fields.get('status') == 'done':
+            self.done[relative] = list(stamp)
+
+    def _write(self, record):
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+# --- Pool Workers ---
+_worker = {}
+
+
+def _init_worker(settings, level, mapping, keep_unmapped, highlighted):
+    """Process pool initializer: configures this worker like the app and loads the model once."""
+    from .extraction import configure_extraction
+    from .gazetteer import gazetteer
+    from .helpers import configure_pipelines, get_nlp
+    from .ner_cache import ner_cache
+    from .prefilter import ner_prefilter
+    from .suggestions import suggestion_pool
+    gazetteer.configure(settings['GAZETTEER_PATH'] or None, settings['GAZETTEER_CACHE_DIR'] or None,
+                        settings['GAZETTEER_RELOAD_INTERVAL'])
+    configure_pipelines(settings['SPACY_MODEL'], settings['SPACY_MODEL_LOW'])
+    # Every CPU already runs a worker, so PDFs are read page by page in-process.
+    configure_extraction(max_bytes=settings['EXTRACT_MAX_BYTES'], max_pages=settings['EXTRACT_MAX_PAGES'],
+                         pdf_workers=1)
+    ner_cache.configure(settings['NER_CACHE_SIZE'], settings['NER_CACHE_PATH'] or None)
+    ner_prefilter.configure(settings['NER_PREFILTER_LEVELS'], settings['NER_PREFILTER_NAMES'] or None)
+    # Suggestions are seeded from each document, so a file processed again gets the same replacements.
+    suggestion_pool.configure(settings['SUGGESTION_LOCALES'], settings['SUGGESTION_POOL_SIZE'], deterministic=True)
+    get_nlp(level)
+    _worker.update(level=level, mapping=mapping, keep_unmapped=keep_unmapped, highlighted=highlighted)
+
+
+def anonymize_file(source, destinations):
+    """Process pool task: anonymizes the file at `source` into each {format: path} of `destinations`."""
+    from .helpers import extract_text_from_file, process_text_spacy, finalize_anonymization_text
+    with open(source, 'rb') as stream:
+        text = extract_text_from_file(FileStorage(stream=stream, filename=source))
+    entities = process_text_spacy(text, _worker['level'])
+    choices = review_choices(entities, _worker['mapping'], _worker['keep_unmapped'])
+    result = finalize_anonymization_text(text, choices, entities)
+    output = result['anonymized_text_highlighted' if _worker['highlighted'] else 'anonymized_text_clean']
+    for file_format, path in destinations.items():
+        write_output(path, file_format, output, _worker['highlighted'])
+    return {
+        'chars': len(text),
+        'entities': len(entities),
+        'replaced': sum(choice['replacement'] != choice['original'] for choice in choices),
+    }
+
+
+# --- Command ---
+@click.command('anonymize')
+@click.argument('input_dir', type=click.Path(exists=True, file_okay=False))
+@click.argument('output_dir', type=click.Path(file_okay=False))
+@click.option('--level', type=click.Choice(['low', 'medium', 'high']), default='medium', show_default=True)
+@click.option('--format', 'formats', default='txt', show_default=True,
+              help='Comma-separated output formats: txt, docx, pdf.')
+@click.option('--mapping', type=click.Path(exists=True, dir_okay=False),
+              help='JSON file of {"original": "replacement"} applied instead of the suggestions.')
+@click.option('--keep-unmapped', is_flag=True, help='Leave entities that are not in the mapping unchanged.')
+@click.option('--highlight', is_flag=True, help='Mark the replacements (<mark> in txt, highlighted in docx/pdf).')
+@click.option('--workers', type=int, default=os.cpu_count() or 1, show_default=True,
+              help='Worker processes, each with its own copy of the model.')
+@click.option('--checkpoint', type=click.Path(dir_okay=False),
+              help=f'Progress log for resuming (default: OUTPUT_DIR/{CHECKPOINT_NAME}).')
+@click.option('--restart', is_flag=True, help='Ignore the checkpoint and process every file again.')
+@with_appcontext
+def anonymize_command(input_dir, output_dir, level, formats, mapping, keep_unmapped, highlight, workers,
+                      checkpoint, restart):
+    """
+    Anonymizes every .txt, .pdf and .docx file under INPUT_DIR with SpaCy and
+    writes the results to OUTPUT_DIR in the same layout. Each entity gets its
+    first suggestion, or its replacement from --mapping. Run the same command
+    again to continue an interrupted run.
+    """
+    # Outputs keep their input's name, so writing into the input tree would overwrite the originals.
+    real_input, real_output = os.path.realpath(input_dir), os.path.realpath(output_dir)
+    if os.path.commonpath([real_input, real_output]) == real_output:
+        raise click.UsageError('OUTPUT_DIR must not be INPUT_DIR or a directory containing it.')
+    formats = [file_format.strip().lower() for file_format in formats.split(',') if file_format.strip()]
+    unknown = set(formats) - set(OUTPUT_FORMATS)
+    if unknown or not formats:
+        raise click.BadParameter(f"expected some of {', '.join(OUTPUT_FORMATS)}", param_hint='--format')
+    try:
+        mapping_values = load_mapping(mapping) if mapping else None
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--mapping')
+
+    options = {'level': level, 'formats': formats, 'mapping': os.path.abspath(mapping) if mapping else None,
+               'keep_unmapped': keep_unmapped, 'highlight': highlight}
+    progress_log = Checkpoint(checkpoint or os.path.join(output_dir, CHECKPOINT_NAME), options, restart)
+
+    pending = []
+    skipped = 0
+    for relative in iter_input_files(input_dir, exclude=output_dir):
+        stat = os.stat(os.path.join(input_dir, relative))
+        stamp = (stat.st_size, stat.st_mtime_ns)
+        if progress_log.is_done(relative, stamp):
+            skipped += 1
+        else:
+            pending.append((relative, stamp))
+    click.echo(f"{len(pending)} files to anonymize ({skipped} already done), {workers} workers", err=True)
+
+    settings = {key: current_app.config[key] for key in WORKER_SETTINGS}
+    started = time.perf_counter()
+    counts = {'done': 0, 'failed': 0, 'entities': 0}
+    # Spawned (not forked) workers, like the PDF extraction pool: the app may already be running threads.
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=_init_worker,
+                                   initargs=(settings, level, mapping_values, keep_unmapped, highlight))
+    try:
+        with click.progressbar(length=len(pending), label='Anonymizing', show_pos=True, file=sys.stderr) as bar:
+            queue = iter(pending)
+            running = {}
+            while True:
+                # Only a few tasks per worker are queued at a time, however many files there are.
+                for relative, stamp in queue:
+                    destinations = {file_format: os.path.join(output_dir, path)
+                                    for file_format, path in output_paths(relative, formats).items()}
+                    future = executor.submit(anonymize_file, os.path.join(input_dir, relative), destinations)
+                    running[future] = (relative, stamp)
+                    if len(running) >= workers * 2:
+                        break
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    relative, stamp = running.pop(future)
+                    error = future.exception()
+                    if error is None:
+                        result = future.result()
+                        counts['done'] += 1
+                        counts['entities'] += result['entities']
+                        progress_log.record(relative, stamp, status='done', **result)
+                    else:
+                        counts['failed'] += 1
+                        progress_log.record(relative, stamp, status='failed', error=str(error))
+                        click.echo(f"\n{relative}: {error}", err=True)
+                    bar.update(1)
+    finally:
+        executor.shutdown(cancel_futures=True)
+        progress_log.close()
+
+    elapsed = time.perf_counter() - started
+    click.echo(f"{counts['done']} anonymized, {counts['failed']} failed, {skipped} skipped; "
+               f"{counts['entities']} entities in {elapsed:.1f} s "
+               f"({counts['done'] / elapsed if elapsed else 0:.1f} files/s)", err=True)
+    if counts['failed']:
+        sys.exit(1)
+
+
+def main():
+    """Runs the command without the flask CLI: python -m app.bulk INPUT_DIR OUTPUT_DIR [OPTIONS]"""
+    from app import create_app
+    from app.bulk import anonymize_command as command
+    with create_app().app_context():
+        command(prog_name='python -m app.bulk')
+
+
+if __name__ == '__main__':
+    main()
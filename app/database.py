@@ -0,0 +1,50 @@
+from flask import g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+
+def engine_options(uri, busy_timeout=5000, pool_size=5, max_overflow=10):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured database."""
+    if make_url(uri).get_backend_name() == 'sqlite':
+        # The driver-level timeout covers the connect itself; the pragma covers everything after.
+        return {'connect_args': {'timeout': busy_timeout / 1000}}
+    return {'pool_pre_ping': True, 'pool_size': pool_size, 'max_overflow': max_overflow, 'pool_recycle': 1800}
+
+
+def install_sqlite_pragmas(engine, busy_timeout=5000, synchronous='NORMAL', mmap_size=256 * 1024 * 1024):
+    """
+    Tunes every new SQLite connection of `engine` for several worker processes
+    sharing one file: WAL, so readers never wait for the writer and the writer
+    never waits for readers; synchronous=NORMAL, which is durable in WAL mode
+    except for the last transactions before a power loss; a busy timeout, so a
+    writer waits for the lock instead of failing with "database is locked";
+    and memory-mapped reads. Does nothing for other databases.
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+    if synchronous.upper() not in SYNCHRONOUS_MODES:
+        raise ValueError(f"SQLITE_SYNCHRONOUS must be one of {', '.join(SYNCHRONOUS_MODES)}.")
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute(f'PRAGMA synchronous={synchronous}')
+        cursor.execute(f'PRAGMA busy_timeout={int(busy_timeout)}')
+        cursor.execute(f'PRAGMA mmap_size={int(mmap_size)}')
+        cursor.close()
+
+
+def install_query_counter(app, engine):
+    """Counts the SQL statements each request runs and reports the count in an X-DB-Queries response header."""
+    @event.listens_for(engine, 'before_cursor_execute')
+    def count_query(connection, cursor, statement, parameters, context, executemany):
+        if has_request_context():
+            g.db_queries = g.get('db_queries', 0) + 1
+
+    @app.after_request
+    def add_query_count(response):
+        response.headers['X-DB-Queries'] = str(g.get('db_queries', 0))
+        return response
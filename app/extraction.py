@@ -0,0 +1,141 @@
+import codecs
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from PyPDF2 import PdfReader
+from docx import Document
+
+SUPPORTED_EXTENSIONS = ('.txt', '.pdf', '.docx')
+
+# Limits and parallelism; overridden from the app config by configure_extraction().
+EXTRACTION_SETTINGS = {
+    'max_bytes': 50 * 1024 * 1024,
+    'max_pages': 1000,
+    'pdf_workers': min(4, os.cpu_count() or 1),
+    'pdf_parallel_min_pages': 20,
+    'pdf_pages_per_task': 8,
+}
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def configure_extraction(**settings):
+    EXTRACTION_SETTINGS.update({key: value for key, value in settings.items() if value is not None})
+
+
+def _get_pool():
+    # Spawned (not forked) workers: the web process has threads and must not be forked mid-request.
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(max_workers=EXTRACTION_SETTINGS['pdf_workers'],
+                                        mp_context=multiprocessing.get_context('spawn'))
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _extract_pdf_pages(path, start, stop):
+    """Process pool task: the text of pages [start, stop) of the PDF at `path`."""
+    reader = PdfReader(path)
+    return [reader.pages[number].extract_text() or '' for number in range(start, stop)]
+
+
+def _file_size(file):
+    stream = getattr(file, 'stream', file)
+    position = stream.tell()
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(position)
+    return size
+
+
+# --- Streaming File Extraction ---
+def iter_text_from_file(file, max_bytes=None, max_pages=None):
+    """
+    Validates an uploaded file against the size/page limits and returns a
+    generator of its text in pieces: one per PDF page, DOCX paragraph or block
+    of TXT lines. Pieces carry their own separators, so ''.join() of them is
+    the full text.
+
+    Limit violations raise ValueError here, before any text is produced.
+    """
+    max_bytes = max_bytes or EXTRACTION_SETTINGS['max_bytes']
+    max_pages = max_pages or EXTRACTION_SETTINGS['max_pages']
+    filename = file.filename.lower()
+    if not filename.endswith(SUPPORTED_EXTENSIONS):
+        raise ValueError("Unsupported file type. Please upload a .txt, .pdf, or .docx file.")
+    if _file_size(file) > max_bytes:
+        raise ValueError(f"File is too large. The limit is {max_bytes // (1024 * 1024)} MB.")
+
+    if filename.endswith('.pdf'):
+        return _iter_pdf_text(file, max_pages)
+    elif filename.endswith('.docx'):
+        return _iter_docx_text(file)
+    return _iter_txt_text(file)
+
+
+def _iter_txt_text(file, block_size=64 * 1024):
+    # Pieces end on a line break, so no paragraph is cut between two of them.
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    stream = getattr(file, 'stream', file)
+    carry = ''
+    while True:
+        block = stream.read(block_size)
+        if not block:
+            break
+        text = carry + decoder.decode(block)
+        cut = text.rfind('\n') + 1
+        if cut:
+            yield text[:cut]
+        carry = text[cut:]
+    carry += decoder.decode(b'', final=True)
+    if carry:
+        yield carry
+
+
+def _iter_docx_text(file):
+    doc = Document(file)
+    for number, para in enumerate(doc.paragraphs):
+        yield ('\n' if number else '') + para.text
+
+
+def _iter_pdf_text(file, max_pages):
+    # Only the cross-reference table is parsed here; pages are read as they are iterated.
+    stream = getattr(file, 'stream', file)
+    stream.seek(0)
+    reader = PdfReader(stream)
+    page_count = len(reader.pages)
+    if page_count > max_pages:
+        raise ValueError(f"PDF has {page_count} pages. The limit is {max_pages}.")
+    return _iter_pdf_pages(reader, stream, page_count)
+
+
+def _iter_pdf_pages(reader, stream, page_count):
+    # Pages are concatenated without a separator, as the text was extracted before streaming.
+    if page_count < EXTRACTION_SETTINGS['pdf_parallel_min_pages'] or EXTRACTION_SETTINGS['pdf_workers'] < 2:
+        for number in range(page_count):
+            yield reader.pages[number].extract_text() or ''
+        return
+
+    # Spool the upload to disk, so page workers can open it by path. It is created
+    # here, inside the generator, so a generator that is never run leaves no file behind.
+    spooled = tempfile.NamedTemporaryFile(suffix='.pdf', delete=False)
+    try:
+        stream.seek(0)
+        shutil.copyfileobj(stream, spooled)
+        spooled.close()
+        step = EXTRACTION_SETTINGS['pdf_pages_per_task']
+        starts = range(0, page_count, step)
+        # map() keeps page order and hands back each batch as soon as it (and its predecessors) finish.
+        batches = _get_pool().map(_extract_pdf_pages, [spooled.name] * len(starts), starts,
+                                  [min(start + step, page_count) for start in starts])
+        for batch in batches:
+            yield from batch
+    finally:
+        spooled.close()
+        os.unlink(spooled.name)
@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+import numpy
+from spacy.attrs import LOWER
+from spacy.language import Language
+from spacy.matcher import PhraseMatcher
+from spacy.util import filter_spans
+
+_LABEL_RE = re.compile(r'^[A-Z][A-Z0-9_]*$')
+
+
+# --- Gazetteer Terms ---
+class Gazetteer:
+    """
+    Organisation-specific identifiers (GP surgeries, ward names, streets, NHS
+    numbers) tagged by case-insensitive phrase matching. The terms are read
+    from a JSON file:
+
+        {"version": "2025-07", "terms": {"ORG": ["Abbey Lane Surgery", ...], "NHS_NUMBER": [...]}}
+
+    Tokenizing a large list takes seconds. The PhraseMatcher keys (each
+    term's lower-cased token hashes) are therefore saved to `cache_dir` as
+    numpy arrays, keyed on the file's version and content hash, and read back
+    on later starts.
+
+    Each worker checks the file's modification time at most every
+    `reload_interval` seconds and reloads it when it changed. A new version is
+    picked up without restarting the workers.
+    """
+
+    def __init__(self, path=None, cache_dir=None, reload_interval=30):
+        self.configure(path, cache_dir, reload_interval)
+
+    def configure(self, path=None, cache_dir=None, reload_interval=30):
+        self.path = path
+        self.cache_dir = cache_dir
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._checked = 0.0
+        self._stamp = None  # (mtime_ns, size) of the file last read
+        self._current = (None, {})  # (version, {label: [term, ...]})
+        self.loads = 0
+        self.load_seconds = None
+
+    @property
+    def version(self):
+        """'<file version>-<content hash>' of the loaded terms, or None before the first load."""
+        return self._current[0]
+
+    def refresh(self):
+        """Reloads the file if it changed since it was last read. Returns the current version."""
+        if not self.path:
+            return None
+        if self._stamp is not None and time.monotonic() - self._checked < self.reload_interval:
+            return self.version
+        with self._lock:
+            if self._stamp is None or time.monotonic() - self._checked >= self.reload_interval:
+                self._checked = time.monotonic()
+                try:
+                    stat = os.stat(self.path)
+                    stamp = (stat.st_mtime_ns, stat.st_size)
+                    if stamp != self._stamp:
+                        self._load()
+                        self._stamp = stamp
+                except (OSError, ValueError):
+                    # A file being replaced may be missing or half-written; keep the loaded terms and retry later.
+                    if self.version is None:
+                        raise
+        return self.version
+
+    def _load(self):
+        start = time.perf_counter()
+        with open(self.path, 'rb') as file:
+            data = file.read()
+        content = json.loads(data)
+        version = f"{content.get('version', '0')}-{hashlib.sha256(data).hexdigest()[:12]}"
+        if version == self.version:
+            return
+        terms = {}
+        for label, label_terms in content.get('terms', {}).items():
+            if not _LABEL_RE.match(label):
+                raise ValueError(f"Gazetteer label '{label}' must be upper case letters, digits and underscores.")
+            terms[label] = list(dict.fromkeys(term.strip() for term in label_terms if term.strip()))
+        self._current = (version, terms)
+        self.loads += 1
+        self.load_seconds = round(time.perf_counter() - start, 4)
+
+    def phrase_keys(self, nlp):
+        """
+        The current terms as PhraseMatcher keys for `nlp`: (version, {label: [key, ...]}),
+        where a key is the sequence of a term's lower-cased token hashes.
+        Read from the cache if it has this version, else tokenized and cached.
+        """
+        version, terms = self._current
+        content_hash = version.rsplit('-', 1)[-1]
+        path = os.path.join(self.cache_dir, f'{nlp.lang}-{content_hash}.npz') if self.cache_dir else None
+        if path and os.path.exists(path):
+            with numpy.load(path) as arrays:
+                return version, {label: _split_keys(arrays[f'{label}.hashes'], arrays[f'{label}.lengths'])
+                                 for label in terms}
+
+        keys = {label: [doc.to_array(LOWER) for doc in nlp.tokenizer.pipe(label_terms)]
+                for label, label_terms in terms.items()}
+        if path:
+            self._write_cache(path, keys)
+        return version, {label: [key.tolist() for key in label_keys] for label, label_keys in keys.items()}
+
+    def _write_cache(self, path, keys):
+        arrays = {}
+        for label, label_keys in keys.items():
+            arrays[f'{label}.hashes'] = numpy.concatenate(label_keys or [numpy.empty(0)]).astype(numpy.uint64)
+            arrays[f'{label}.lengths'] = numpy.array([len(key) for key in label_keys], dtype=numpy.uint32)
+        # Written under a temporary name and renamed, so a worker never reads a partial file.
+        os.makedirs(self.cache_dir, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(descriptor, 'wb') as file:
+            numpy.savez(file, **arrays)
+        os.replace(temporary, path)
+        prefix = os.path.basename(path).split('-', 1)[0] + '-'
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(prefix) and name.endswith('.npz') and name != os.path.basename(path):
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+
+    def stats(self):
+        version, terms = self._current
+        return {
+            'path': self.path,
+            'version': version,
+            'terms': {label: len(label_terms) for label, label_terms in terms.items()},
+            'loads': self.loads,
+            'load_seconds': self.load_seconds,
+        }
+
+
+def _split_keys(hashes, lengths):
+    hashes = hashes.tolist()
+    keys = []
+    position = 0
+    for length in lengths.tolist():
+        keys.append(hashes[position:position + length])
+        position += length
+    return keys
+
+
+gazetteer = Gazetteer()
+
+
+# --- Pipeline Component ---
+class GazetteerMatcher:
+    """
+    Tags gazetteer terms in doc.ents ahead of the statistical NER, which keeps
+    them. The PhraseMatcher matches on lower-cased tokens and is rebuilt the
+    first time a document is processed after the terms were reloaded.
+    """
+
+    def __init__(self, nlp):
+        self.nlp = nlp
+        self.version = None
+        self.matcher = None
+        self._lock = threading.Lock()
+
+    def _current_matcher(self):
+        if self.version != gazetteer.version:
+            with self._lock:
+                if self.version != gazetteer.version:
+                    version, keys = gazetteer.phrase_keys(self.nlp)
+                    matcher = PhraseMatcher(self.nlp.vocab, attr='LOWER')
+                    for label, label_keys in keys.items():
+                        matcher.add(label, label_keys)
+                    self.matcher, self.version = matcher, version
+        return self.matcher
+
+    def __call__(self, doc):
+        matcher = self._current_matcher()
+        if matcher is not None:
+            spans = matcher(doc, as_spans=True)
+            if spans:
+                doc.ents = filter_spans(list(doc.ents) + spans)
+        return doc
+
+
+@Language.factory('gazetteer')
+def create_gazetteer_matcher(nlp, name):
+    return GazetteerMatcher(nlp)
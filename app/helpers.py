@@ -1,26 +1,115 @@
 import spacy
-from faker import Faker
+import asyncio
 import re
 import openai
 import json
 import random
-from PyPDF2 import PdfReader
+import bisect
+import itertools
+import hashlib
+import threading
+import zipfile
 from docx import Document
 from io import BytesIO
+from werkzeug.datastructures import FileStorage
 from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Flowable
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.colors import HexColor
 from reportlab.lib.enums import TA_JUSTIFY
-from collections import defaultdict
+from collections import defaultdict, Counter, OrderedDict, namedtuple
+from .replacement import compile_words, compile_replacements, apply_replacements, apply_span_replacements
+from .suggestions import suggestion_pool, document_seed
+from .ner_cache import ner_cache, EntitySpan
+from .prefilter import ner_prefilter
+from .gazetteer import gazetteer
+from .metrics import metrics, stage, timed_stage
+from .extraction import SUPPORTED_EXTENSIONS, iter_text_from_file
+
+# --- SpaCy Models (loaded lazily, one shared pipeline per model) ---
+# Only doc.ents is read, so components that do not feed NER are never loaded.
+UNUSED_COMPONENTS = ['parser', 'tagger', 'morphologizer', 'senter', 'attribute_ruler', 'lemmatizer']
+
+DEFAULT_SPACY_MODEL = 'en_core_web_lg'
+LEVEL_MODELS = {
+    'low': DEFAULT_SPACY_MODEL,
+    'medium': DEFAULT_SPACY_MODEL,
+    'high': DEFAULT_SPACY_MODEL
+}
+
+# Bump whenever the EntityRuler patterns change, so cached NER results are not reused.
+PIPELINE_RULES_VERSION = 1
+
+_pipelines = {}
+_pipelines_lock = threading.Lock()
+
+
+def configure_pipelines(default_model=None, low_model=None):
+    """Sets which SpaCy model serves each anonymization level. Call before first use."""
+    default_model = default_model or DEFAULT_SPACY_MODEL
+    LEVEL_MODELS['medium'] = default_model
+    LEVEL_MODELS['high'] = default_model
+    LEVEL_MODELS['low'] = low_model or default_model
+
+
+def load_pipeline(model_name):
+    """Loads a SpaCy model with only the components needed for NER plus our EntityRuler."""
+    try:
+        nlp = spacy.load(model_name, exclude=UNUSED_COMPONENTS)
+    except OSError:
+        print(f"Downloading '{model_name}' model...")
+        spacy.cli.download(model_name)
+        nlp = spacy.load(model_name, exclude=UNUSED_COMPONENTS)
+
+    # The en_core_web_* NER has its own tok2vec; keep the shared one only if something listens to it.
+    if 'tok2vec' in nlp.pipe_names and not nlp.get_pipe('tok2vec').listening_components:
+        nlp.remove_pipe('tok2vec')
+
+    # Add EntityRuler to the pipeline before the standard "ner" component
+    ruler = nlp.add_pipe("entity_ruler", before="ner")
+    ruler.add_patterns(age_patterns)
+    ruler.add_patterns(money_patterns)
+
+    # Organisation-specific terms (surgeries, wards, streets, NHS numbers) from the gazetteer file.
+    if gazetteer.path:
+        gazetteer.refresh()
+        nlp.add_pipe('gazetteer', after='entity_ruler')
+    return nlp
+
+
+def pipeline_fingerprint(nlp):
+    """
+    Identifies the model, our custom patterns and the gazetteer version, for
+    keying cached NER results. Also picks up a changed gazetteer file.
+    """
+    meta = nlp.meta
+    fingerprint = f"{meta.get('lang')}_{meta.get('name')}-{meta.get('version')}+rules{PIPELINE_RULES_VERSION}"
+    if 'gazetteer' in nlp.pipe_names:
+        fingerprint += f"+gazetteer{gazetteer.refresh()}"
+    return fingerprint
+
+
+def get_nlp(level=None):
+    """Returns the pipeline for an anonymization level, loading it on first use."""
+    model_name = LEVEL_MODELS.get(level, LEVEL_MODELS['medium'])
+    nlp = _pipelines.get(model_name)
+    if nlp is None:
+        with _pipelines_lock:
+            nlp = _pipelines.get(model_name)
+            if nlp is None:
+                nlp = _pipelines[model_name] = load_pipeline(model_name)
+    return nlp
+
+
+def preload_pipelines():
+    """
+    Loads every configured model up front. Called from create_app when
+    SPACY_PRELOAD is set so a Gunicorn master with preload_app shares the
+    loaded models with its workers through copy-on-write.
+    """
+    for level in LEVEL_MODELS:
+        get_nlp(level)
 
-# --- Load SpaCy Model and Add Custom EntityRuler ---
-try:
-    nlp = spacy.load("en_core_web_lg")
-except OSError:
-    print("Downloading 'en_core_web_lg' model...")
-    spacy.cli.download("en_core_web_lg")
-    nlp = spacy.load("en_core_web_lg")
 
 # Define more robust patterns
 age_patterns = [
@@ -38,30 +127,27 @@ money_patterns = [
     {"label": "MONEY", "pattern": [{"LIKE_NUM": True}, {"LOWER": {"IN": ["pounds", "dollars", "euros", "gbp", "usd"]}}]}
 ]
 
-# Add EntityRuler to the pipeline before the standard "ner" component
-ruler = nlp.add_pipe("entity_ruler", before="ner")
-ruler.add_patterns(age_patterns)
-ruler.add_patterns(money_patterns)
-
-fake = Faker()
+# --- File Extraction ---
+@timed_stage('extraction')
+def extract_text_from_file(file):
+    """The full text of an uploaded file (see iter_text_from_file for the streaming version)."""
+    return ''.join(iter_text_from_file(file))
 
 
-# --- File Extraction (no changes needed) ---
-def extract_text_from_file(file):
-    filename = file.filename
-    if filename.endswith('.pdf'):
-        reader = PdfReader(file)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text()
-        return text
-    elif filename.endswith('.docx'):
-        doc = Document(file)
-        return "\n".join([para.text for para in doc.paragraphs])
-    elif filename.endswith('.txt'):
-        return file.read().decode('utf-8')
-    else:
-        raise ValueError("Unsupported file type. Please upload a .txt, .pdf, or .docx file.")
+def iter_uploaded_files(files):
+    """
+    Expands a list of uploaded files for batch processing.
+    Zip archives are opened and every supported member is yielded as its own file.
+    """
+    for file in files:
+        if file.filename.endswith('.zip'):
+            with zipfile.ZipFile(file.stream) as archive:
+                for info in archive.infolist():
+                    if info.is_dir() or not info.filename.endswith(SUPPORTED_EXTENSIONS):
+                        continue
+                    yield FileStorage(stream=BytesIO(archive.read(info)), filename=info.filename)
+        else:
+            yield file
 
 
 # --- NEW: Smart Entity Grouping Function ---
@@ -71,33 +157,45 @@ def group_person_entities(ents):
     e.g., "Sarah" and "Malik" will be linked to "Sarah Malik".
     Returns a dictionary mapping the canonical name to all its variations.
     """
-    persons = sorted([ent for ent in ents if ent.label_ == 'PERSON'], key=lambda x: len(x.text), reverse=True)
+    persons = [ent for ent in ents if ent.label_ == 'PERSON']
     other_ents = [ent for ent in ents if ent.label_ != 'PERSON']
 
+    # Deduplicate mention texts first; the longest names become canonical first.
+    unique_texts = sorted(dict.fromkeys(ent.text for ent in persons), key=len, reverse=True)
+    parts_by_text = {text: frozenset(text.lower().split()) for text in unique_texts}
+
+    # Index every mention under its rarest lower-cased part. A mention can only
+    # belong to a name containing all of its parts, so the name only has to look
+    # up its own parts, and a common surname shared by many people never ends up
+    # in one huge bucket.
+    part_counts = Counter(part for parts in parts_by_text.values() for part in parts)
+    texts_by_part = defaultdict(list)
+    partless_texts = []
+    for text in unique_texts:
+        parts = parts_by_text[text]
+        if parts:
+            texts_by_part[min(parts, key=lambda part: (part_counts[part], part))].append(text)
+        else:
+            partless_texts.append(text)
+
     grouped_persons = {}
     processed_texts = set()
 
-    for p1 in persons:
-        if p1.text in processed_texts:
+    for canonical_name in unique_texts:
+        if canonical_name in processed_texts:
             continue
 
-        canonical_name = p1.text
-        variations = {p1.text}
-        processed_texts.add(p1.text)
+        variations = {canonical_name: None}
+        processed_texts.add(canonical_name)
+        name_parts = parts_by_text[canonical_name]
 
-        # Split full name into parts for matching
-        name_parts = set(canonical_name.lower().split())
-
-        for p2 in persons:
-            if p2.text in processed_texts:
-                continue
-
-            # Check if p2 is a substring of p1 (e.g., "Sarah" in "Sarah Malik")
-            # or if p2's parts are a subset of p1's parts.
-            p2_parts = set(p2.text.lower().split())
-            if p2_parts.issubset(name_parts):
-                variations.add(p2.text)
-                processed_texts.add(p2.text)
+        # A mention belongs to this name if its parts are a subset of the name's parts
+        # (e.g. "Sarah" or "Malik Sarah" for "Sarah Malik").
+        candidates = [text for part in name_parts for text in texts_by_part[part]]
+        for text in candidates + partless_texts:
+            if text not in processed_texts and parts_by_text[text] <= name_parts:
+                variations[text] = None
+                processed_texts.add(text)
 
         grouped_persons[canonical_name] = list(variations)
 
@@ -105,72 +203,336 @@ def group_person_entities(ents):
 
 
 # --- SpaCy Anonymization Logic (Upgraded) ---
-def process_text_spacy(text, level):
-    doc = nlp(text)
-
-    # Corrected level map: AGE is a direct identifier, moved to 'low'
-    level_map = {
-        'low': {'PERSON', 'AGE'},
-        'medium': {'PERSON', 'AGE', 'GPE', 'LOC', 'ORG', 'FAC'},
-        'high': {'PERSON', 'AGE', 'GPE', 'LOC', 'ORG', 'FAC', 'DATE', 'TIME', 'MONEY'}
-    }
-    target_labels = level_map.get(level, set())
+# Corrected level map: AGE is a direct identifier, moved to 'low'
+LEVEL_LABELS = {
+    'low': {'PERSON', 'AGE', 'NHS_NUMBER'},
+    'medium': {'PERSON', 'AGE', 'NHS_NUMBER', 'GPE', 'LOC', 'ORG', 'FAC'},
+    'high': {'PERSON', 'AGE', 'NHS_NUMBER', 'GPE', 'LOC', 'ORG', 'FAC', 'DATE', 'TIME', 'MONEY'}
+}
+
+
+def process_text_spacy(text, level, seed=None):
+    metrics.observe('anondev_document_chars', len(text))
+    with stage('ner'):
+        ents = extract_entities(text, level)
+    metrics.observe('anondev_document_entities', len(ents))
+    entities_to_review = build_entities_to_review(ents, level, _suggestion_rng(_text_digest(text), seed))
+    with stage('span_scan'):
+        add_unrecognized_spans(text, entities_to_review)
+    return entities_to_review
+
+
+def process_texts_spacy(documents, level, batch_size=32, n_process=1):
+    """
+    Batch version of process_text_spacy built on nlp.pipe.
+    `documents` is an iterable of (text, context) tuples, where text may also be
+    an iterable of text pieces; yields (context, entities_to_review, error)
+    triples in input order as each document completes. `error` is None unless
+    reading the document's pieces failed. The whole text is never held here, so
+    the entities' spans are only those the model found.
+    """
+    for result in iter_document_entities(documents, level, batch_size, n_process):
+        if result.error is not None:
+            yield result.context, None, result.error
+        else:
+            metrics.observe('anondev_document_entities', len(result.ents))
+            yield result.context, build_entities_to_review(result.ents, level, _suggestion_rng(result.digest)), None
+
+
+def extract_entities(text, level):
+    """Returns the entities the level's pipeline finds in `text` as EntitySpans."""
+    for result in iter_document_entities([(text, None)], level):
+        if result.error is not None:
+            raise result.error
+        return result.ents
+
+
+# --- Incremental (Paragraph-Level) Entity Extraction ---
+MAX_CHUNK_CHARS = 5000
+# Paragraphs end at a blank line. Single line breaks (e.g. PDF line wrapping) stay inside the
+# paragraph, so a name or age wrapped across lines reaches the pipeline in one piece.
+_PARAGRAPH_BREAK_RE = re.compile(r'\n\s*\n')
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?])\s+')
+_LINE_END_RE = re.compile(r'\n')
+
+# One document's result from iter_document_entities. `digest` is the SHA-256 of the full text.
+DocumentEntities = namedtuple('DocumentEntities', ['context', 'ents', 'digest', 'error'])
+
+
+def _text_digest(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _split_point(text, start, stop):
+    """The last sentence end in text[start:stop] (or, failing that, line end), or None."""
+    for boundary_re in (_SENTENCE_END_RE, _LINE_END_RE):
+        split_at = None
+        for boundary in boundary_re.finditer(text, start, stop):
+            split_at = boundary.end()
+        if split_at is not None and split_at > start:
+            return split_at
+    return None
+
+
+def _split_paragraph(text, start, end, max_chars, chunks):
+    """Appends the paragraph text[start:end] to chunks, split at sentences while longer than max_chars."""
+    while end - start > max_chars:
+        split_at = _split_point(text, start, start + max_chars)
+        if split_at is None:
+            break
+        chunks.append((start, split_at))
+        start = split_at
+    if text[start:end].strip():
+        chunks.append((start, end))
+
+
+def split_into_chunks(text, max_chars=MAX_CHUNK_CHARS):
+    """
+    Splits text into paragraph chunks (separated by blank lines), returned as
+    (start, end) offsets. Paragraphs longer than max_chars (e.g. PDF text
+    without blank lines) are further split at sentence boundaries.
+    """
+    chunks = []
+    start = 0
+    for paragraph_break in _PARAGRAPH_BREAK_RE.finditer(text):
+        if text[start:paragraph_break.start()].strip():
+            _split_paragraph(text, start, paragraph_break.start(), max_chars, chunks)
+        start = paragraph_break.end()
+    if text[start:].strip():
+        _split_paragraph(text, start, len(text), max_chars, chunks)
+    return chunks
+
+
+def _complete_chunks(text, max_chars=MAX_CHUNK_CHARS):
+    """
+    The chunks of `text` that more text cannot change, and how many characters
+    they cover: every paragraph up to the last blank line, then sentence-sized
+    pieces of the unfinished paragraph while it is longer than max_chars.
+    """
+    # Trailing whitespace may be (part of) a paragraph break that continues in the next piece.
+    stop = len(text.rstrip())
+    last_break = None
+    for last_break in _PARAGRAPH_BREAK_RE.finditer(text, 0, stop):
+        pass
+    consumed = last_break.end() if last_break else 0
+    chunks = split_into_chunks(text[:consumed], max_chars)
+    while stop - consumed > max_chars:
+        split_at = _split_point(text, consumed, consumed + max_chars)
+        if split_at is None:
+            break
+        chunks.append((consumed, split_at))
+        consumed = split_at
+    return chunks, consumed
+
+
+def iter_document_entities(documents, level, batch_size=32, n_process=1):
+    """
+    Finds entities for an iterable of (text, context) tuples and yields a
+    DocumentEntities per document, in input order.
+
+    `text` is a string or an iterable of pieces (e.g. the pages from
+    iter_text_from_file). Pieces are chunked as they arrive, so a long upload
+    is not held as one string: only the unfinished paragraph at the end of the
+    pieces so far, and chunks still waiting for the pipeline, are kept. A
+    paragraph that runs across two pieces (e.g. a PDF page break) is parsed
+    as one chunk.
+
+    Each document is split into paragraph chunks and every chunk's entities are
+    cached by the chunk's hash, so only new or edited paragraphs go through the
+    pipeline. Chunk results are stitched back into document offsets. For
+    levels with the NER pre-filter enabled, chunks that cannot contain a name
+    or an age skip the pipeline altogether.
+    """
+    nlp = get_nlp(level)
+    fingerprint = pipeline_fingerprint(nlp)
+    prefilter = ner_prefilter if ner_prefilter.applies_to(level) else None
+    pending = OrderedDict()  # document number -> [context, results, remaining, digest, error]
+    waiting = {}  # (document number, chunk index) -> (offset, chunk text, cache key)
+
+    def spans(offset, chunk, entities):
+        return [EntitySpan(chunk[start:end], label, offset + start, offset + end) for label, start, end in entities]
+
+    def chunks_to_parse():
+        for number, (text, context) in enumerate(documents):
+            state = pending[number] = [context, [], 0, None, None]
+            hasher = hashlib.sha256()
+            position = 0
+            buffer = ''
+            try:
+                pieces = [text] if isinstance(text, str) else text
+                for piece in itertools.chain(pieces, [None]):
+                    if piece is None:
+                        chunks, consumed = split_into_chunks(buffer), len(buffer)
+                    else:
+                        hasher.update(piece.encode('utf-8'))
+                        buffer += piece
+                        chunks, consumed = _complete_chunks(buffer)
+                    for start, end in chunks:
+                        chunk = buffer[start:end]
+                        if prefilter is not None and not prefilter.should_parse(chunk):
+                            state[1].append([])
+                            continue
+                        key = ner_cache.key(chunk, fingerprint)
+                        entities = ner_cache.get(key)
+                        index = len(state[1])
+                        if entities is None:
+                            state[1].append(None)
+                            state[2] += 1
+                            waiting[(number, index)] = (position + start, chunk, key)
+                            yield chunk, (number, index)
+                        else:
+                            state[1].append(spans(position + start, chunk, entities))
+                    buffer = buffer[consumed:]
+                    position += consumed
+            except Exception as e:
+                state[4] = e
+            state[3] = hasher.hexdigest()
+
+    def completed_documents():
+        while pending:
+            state = next(iter(pending.values()))
+            if state[3] is None or state[2] > 0:
+                break
+            pending.popitem(last=False)
+            context, results, _, digest, error = state
+            ents = None if error else [ent for chunk_ents in results for ent in chunk_ents]
+            yield DocumentEntities(context, ents, digest, error)
+
+    for doc, (number, index) in nlp.pipe(chunks_to_parse(), as_tuples=True, batch_size=batch_size,
+                                         n_process=n_process):
+        state = pending[number]
+        offset, chunk, key = waiting.pop((number, index))
+        entities = [(ent.label_, ent.start_char, ent.end_char) for ent in doc.ents]
+        ner_cache.set(key, entities)
+        state[1][index] = spans(offset, chunk, entities)
+        state[2] -= 1
+        yield from completed_documents()
+    yield from completed_documents()
+
+
+def _suggestion_rng(digest, seed=None):
+    """A seeded RNG when suggestions must be reproducible for this document, else None."""
+    if seed is None and suggestion_pool.deterministic:
+        seed = document_seed(digest)
+    return random.Random(seed) if seed is not None else None
+
+
+def build_entities_to_review(ents, level, rng=None):
+    target_labels = LEVEL_LABELS.get(level, set())
 
     # Filter entities based on the selected level
-    relevant_ents = [ent for ent in doc.ents if ent.label_ in target_labels]
+    relevant_ents = [ent for ent in ents if ent.label_ in target_labels]
 
     # Group PERSON entities intelligently
-    grouped_persons, other_ents = group_person_entities(relevant_ents)
+    with stage('grouping'):
+        grouped_persons, other_ents = group_person_entities(relevant_ents)
 
     entities_to_review = []
 
+    # Character offsets of every mention, so finalization can splice instead of searching.
+    spans_by_text = defaultdict(list)
+    for ent in relevant_ents:
+        spans_by_text[(ent.label_ == 'PERSON', ent.text)].append([ent.start_char, ent.end_char])
+
     # Add grouped persons to the review list
     for canonical_name, variations in grouped_persons.items():
         # The 'text' to be replaced is a list of all variations
         # The 'display_text' is what the user sees in the stepper
-        suggestions = get_entity_suggestions('PERSON', canonical_name)
+        suggestions = get_entity_suggestions('PERSON', canonical_name, rng=rng)
         entities_to_review.append({
             'text_to_replace': variations,
             'display_text': canonical_name,
             'label': 'PERSON',
-            'suggestions': suggestions
+            'suggestions': suggestions,
+            'spans': sorted(span for variation in variations for span in spans_by_text[(True, variation)])
         })
 
     # Add other entities to the review list, ensuring no duplicates
     processed_other_texts = set()
     for ent in other_ents:
         if ent.text not in processed_other_texts:
-            suggestions = get_entity_suggestions(ent.label_, ent.text)
+            suggestions = get_entity_suggestions(ent.label_, ent.text, rng=rng)
             entities_to_review.append({
                 'text_to_replace': [ent.text],
                 'display_text': ent.text,
                 'label': ent.label_,
-                'suggestions': suggestions
+                'suggestions': suggestions,
+                'spans': spans_by_text[(False, ent.text)]
             })
             processed_other_texts.add(ent.text)
 
     return entities_to_review
 
 
-def finalize_anonymization_text(original_text, user_choices):
-    anonymized_text = original_text
-    clean_text = original_text
-
-    # Sort choices to replace longer strings first, preventing substring issues
-    sorted_choices = sorted(user_choices, key=lambda x: len(x['original']), reverse=True)
-
-    for choice in sorted_choices:
-        replacement = choice['replacement']
+def add_unrecognized_spans(text, entities_to_review):
+    """
+    Adds spans for whole-word occurrences of an entity's variations that the
+    model did not tag itself (e.g. a second "Sarah" in another context), so
+    replacing by span covers everything a search for the variations would.
+    Occurrences overlapping a tagged entity are left alone.
+    """
+    owners = {}
+    for index, entity in enumerate(entities_to_review):
+        for variation in entity['text_to_replace']:
+            owners.setdefault(variation, index)
+    if not owners:
+        return
+
+    tagged = sorted(span for entity in entities_to_review for span in entity['spans'])
+    tagged_starts = [start for start, _ in tagged]
+    added = set()
+    for match in compile_words(owners).finditer(text):
+        start, end = match.span()
+        position = bisect.bisect_right(tagged_starts, start)
+        if position and tagged[position - 1][1] > start:
+            continue
+        if position < len(tagged) and tagged[position][0] < end:
+            continue
+        index = owners[match.group(0)]
+        entities_to_review[index]['spans'].append([start, end])
+        added.add(index)
+    for index in added:
+        entities_to_review[index]['spans'].sort()
 
-        # 'original_list' now contains all variations of an entity
-        original_list = sorted(choice['original_list'], key=len, reverse=True)
 
-        if replacement and original_list[0] != replacement:
-            for original_variation in original_list:
-                # Use regex word boundary to avoid partial matches
-                anonymized_text = re.sub(r'\b' + re.escape(original_variation) + r'\b', f'<mark>{replacement}</mark>',
-                                         anonymized_text)
-                clean_text = re.sub(r'\b' + re.escape(original_variation) + r'\b', replacement, clean_text)
+def _span_replacements(text, user_choices, entities):
+    """
+    (start, end, replacement) for every span of the chosen entities, sorted by
+    start, or None if the choices or spans do not match `text` (e.g. the text
+    was edited after it was analyzed).
+    """
+    if entities is None or len(entities) != len(user_choices):
+        return None
+    replacements = []
+    for choice, entity in zip(user_choices, entities):
+        if choice.get('original') != entity['display_text'] or 'spans' not in entity:
+            return None
+        replacement = choice.get('replacement')
+        variations = set(entity['text_to_replace'])
+        for start, end in entity['spans']:
+            if text[start:end] not in variations:
+                return None
+            if replacement and replacement != entity['display_text']:
+                replacements.append((start, end, replacement))
+    replacements.sort()
+    return replacements
+
+
+@timed_stage('finalize')
+def finalize_anonymization_text(original_text, user_choices, entities=None):
+    """
+    With the review `entities` the choices were made for (in the same order),
+    the output is spliced together from their span offsets in one pass.
+    Without them, or if the spans no longer fit the text, every variation is
+    searched for instead: all choices are compiled into one pattern (longest
+    match first), so the document is still scanned only once.
+    """
+    replacements = _span_replacements(original_text, user_choices, entities)
+    if replacements is not None:
+        anonymized_text, clean_text = apply_span_replacements(original_text, replacements)
+    else:
+        pattern, mapping = compile_replacements(user_choices)
+        anonymized_text, clean_text = apply_replacements(original_text, pattern, mapping)
 
     return {
         'anonymized_text_highlighted': anonymized_text,
@@ -178,60 +540,152 @@ def finalize_anonymization_text(original_text, user_choices):
     }
 
 
-# --- Suggestion Generator (Corrected Age Suggestions) ---
-def get_entity_suggestions(label, original_text=""):
-    """Generates realistic suggestions for a given SpaCy entity label."""
+# --- Age Parsing (tokenizer-free, no SpaCy pipeline run) ---
+NUMBER_UNITS = {
+    'zero': 0, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6, 'seven': 7, 'eight': 8,
+    'nine': 9, 'ten': 10, 'eleven': 11, 'twelve': 12, 'thirteen': 13, 'fourteen': 14, 'fifteen': 15,
+    'sixteen': 16, 'seventeen': 17, 'eighteen': 18, 'nineteen': 19
+}
+NUMBER_TENS = {
+    'twenty': 20, 'thirty': 30, 'forty': 40, 'fifty': 50, 'sixty': 60, 'seventy': 70, 'eighty': 80, 'ninety': 90
+}
+_AGE_TOKEN_RE = re.compile(r'\d+|[A-Za-z]+')
+_NUMBER_GAP_RE = re.compile(r'[\s-]*')
+
+
+def _is_number_word(word):
+    return word in NUMBER_UNITS or word in NUMBER_TENS or word == 'hundred'
+
+
+def parse_age(text):
+    """
+    Finds the first number in an age expression such as "45 years old",
+    "23-year-old" or "aged fifty-two" / "one hundred and one".
+    Returns (age, start, end) with the character offsets of the number, or None.
+    """
+    tokens = list(_AGE_TOKEN_RE.finditer(text))
+    for i, token in enumerate(tokens):
+        word = token.group().lower()
+        if word.isdigit():
+            return int(word), token.start(), token.end()
+        if not _is_number_word(word):
+            continue
+
+        value = 0
+        end = token.end()
+        starts_with_hundred = word == 'hundred'
+        for j in range(i, len(tokens)):
+            next_token = tokens[j]
+            word = next_token.group().lower()
+            if j > i and not _NUMBER_GAP_RE.fullmatch(text[end:next_token.start()]):
+                break
+            if word in NUMBER_UNITS:
+                value += NUMBER_UNITS[word]
+            elif word in NUMBER_TENS:
+                value += NUMBER_TENS[word]
+            elif word == 'hundred':
+                value = max(value, 1) * 100
+            elif word == 'and' and j + 1 < len(tokens) and _is_number_word(tokens[j + 1].group().lower()):
+                pass
+            else:
+                break
+            end = next_token.end()
+
+        start = token.start()
+        # "a hundred" / "an hundred": the article is part of the number
+        if starts_with_hundred and i > 0 and tokens[i - 1].group().lower() in ('a', 'an'):
+            start = tokens[i - 1].start()
+        return value, start, end
+    return None
+
+
+# --- Suggestion Generator ---
+def fake_nhs_number(rng):
+    """A random number in NHS number format ("943 476 5919") with a valid modulus 11 check digit."""
+    while True:
+        digits = [rng.randint(0, 9) for _ in range(9)]
+        check = 11 - sum(digit * weight for digit, weight in zip(digits, range(10, 1, -1))) % 11
+        if check == 11:
+            check = 0
+        if check != 10:
+            number = ''.join(map(str, digits)) + str(check)
+            return f"{number[:3]} {number[3:6]} {number[6:]}"
+
+
+@timed_stage('suggestions')
+def get_entity_suggestions(label, original_text="", locale=None, rng=None):
+    """
+    Generates realistic suggestions for a given SpaCy entity label.
+    Faker values come from the pre-generated suggestion pool; pass a seeded
+    `rng` for deterministic suggestions.
+    """
+    def take(kind, count=3):
+        return suggestion_pool.take(kind, count, locale=locale, rng=rng)
+
+    # Non-pooled values; `rng` itself must stay None for take() to use the pre-generated buffers.
+    value_rng = rng or random
     if label == 'PERSON':
-        return [fake.name() for _ in range(3)]
+        return take('name')
     if label in ['GPE', 'LOC']:
-        return [fake.city(), fake.country(), fake.address().split('\n')[0]]
+        return take('city', 1) + take('country', 1) + take('street_address', 1)
     if label == 'ORG':
-        return [fake.company() for _ in range(3)]
+        return take('company')
     if label == 'DATE':
-        return [fake.date_this_decade().strftime('%B %d, %Y') for _ in range(3)]
+        return take('date')
     if label == 'FAC':
-        facility_types = ['Centre', 'Building', 'Stadium', 'Clinic', 'Bridge', 'Plaza']
-        return [f"{fake.street_name()} {random.choice(facility_types)}" for _ in range(3)]
+        return take('facility')
     if label == 'MONEY':
-        return [f"£{random.randint(10, 500)}", f"${random.randint(10, 500)}", f"€{random.randint(10, 500)}"]
+        return [f"£{value_rng.randint(10, 500)}", f"${value_rng.randint(10, 500)}", f"€{value_rng.randint(10, 500)}"]
     if label == 'TIME':
-        return [fake.time(pattern="%I:%M %p") for _ in range(3)]
-    if label == 'AGE':  # <-- CORRECTED LOGIC FOR AGE
-        try:
-            # Extract number from text like "fifty-two" or "52"
-            num_part = [token.text for token in nlp(original_text) if token.like_num][0]
-            # Convert word to number if needed
-            if num_part.isalpha():
-                # Note: this requires a library like 'word2number' for full support,
-                # but for simplicity, we'll suggest random numbers as a robust fallback.
-                return [str(random.randint(20, 70)) for _ in range(3)]
-            else:
-                base_age = int(num_part)
-                return [str(base_age + random.randint(-5, 5)) for _ in range(3) if base_age > 5]
-        except:
-            return [str(random.randint(20, 70)) for _ in range(3)]
+        return take('time')
+    if label == 'NHS_NUMBER':
+        return [fake_nhs_number(value_rng) for _ in range(3)]
+    if label == 'AGE':
+        parsed = parse_age(original_text)
+        if parsed is None:
+            return [str(value_rng.randint(20, 70)) for _ in range(3)]
+        # Keep the surrounding wording ("45 years old" -> "48 years old") and only change the number.
+        base_age, start, end = parsed
+        nearby_ages = [age for age in range(base_age - 5, base_age + 6) if age != base_age and age > 0]
+        return [f"{original_text[:start]}{age}{original_text[end:]}"
+                for age in value_rng.sample(nearby_ages, min(3, len(nearby_ages)))]
 
     return [f"[{label.lower()}_replacement]" for _ in range(3)]
 
 
-# --- ChatGPT & File Generation Logic (no changes needed) ---
-def anonymize_text_with_gpt(text, level, api_key):
-    # This function remains the same as before
-    client = openai.OpenAI(api_key=api_key)
-    level_instructions = {
-        'low': "Anonymize only personal names (PERSON) and ages (AGE).",
-        'medium': "Anonymize personal names (PERSON), ages (AGE), geopolitical entities (GPE), locations (LOC), organizations (ORG), and facilities (FAC).",
-        'high': "Anonymize all personal data including names, ages, locations, organizations, dates (DATE), times (TIME), and monetary values (MONEY)."
-    }
-    prompt = f"""
+# --- ChatGPT & File Generation Logic ---
+GPT_MODEL = "gpt-4o"
+GPT_LEVEL_INSTRUCTIONS = {
+    'low': "Anonymize only personal names (PERSON), ages (AGE) and NHS numbers (NHS_NUMBER).",
+    'medium': "Anonymize personal names (PERSON), ages (AGE), NHS numbers (NHS_NUMBER), geopolitical entities (GPE), locations (LOC), organizations (ORG), and facilities (FAC).",
+    'high': "Anonymize all personal data including names, ages, locations, organizations, dates (DATE), times (TIME), and monetary values (MONEY)."
+}
+
+
+def _gpt_client_options(api_key, base_url=None, timeout=None):
+    # base_url allows any OpenAI-compatible server (e.g. a local stub); timeout is in seconds.
+    client_options = {'api_key': api_key}
+    if base_url:
+        client_options['base_url'] = base_url
+    if timeout:
+        client_options['timeout'] = timeout
+    return client_options
+
+
+def _gpt_prompt(text, level, known_replacements=None):
+    consistency = ""
+    if known_replacements:
+        consistency = f"""
+    6.  Other parts of this report are anonymized separately. Wherever one of these originals appears, use exactly the given replacement, and list it in "changes": {json.dumps(known_replacements, ensure_ascii=False)}"""
+    return f"""
     You are an expert in text anonymization. Your task is to rewrite the following report to protect identity while preserving meaning.
 
     Instructions:
     1.  Read the "Original Report" below.
-    2.  Anonymize it based on the specified "Anonymization Level": {level_instructions.get(level, "Comprehensive anonymization.")}
+    2.  Anonymize it based on the specified "Anonymization Level": {GPT_LEVEL_INSTRUCTIONS.get(level, "Comprehensive anonymization.")}
     3.  Correct any grammatical errors.
     4.  Generate realistic replacements.
-    5.  Your final output must be a single JSON object with two keys: "anonymized_text" (the full rewritten report as a string) and "changes" (a list of objects, each with "original" and "replacement" keys). Do not include any text outside this JSON object.
+    5.  Your final output must be a single JSON object with two keys: "anonymized_text" (the full rewritten report as a string) and "changes" (a list of objects, each with "original" and "replacement" keys). Do not include any text outside this JSON object.{consistency}
 
     Original Report:
     ---
@@ -240,26 +694,47 @@ def anonymize_text_with_gpt(text, level, api_key):
 
     Provide the JSON output.
     """
+
+
+def _highlight_changes(anonymized_text, changes):
+    highlighted_text = anonymized_text
+    sorted_changes = sorted(changes, key=lambda x: len(x.get('replacement', '')), reverse=True)
+    for change in sorted_changes:
+        replacement = change.get('replacement')
+        if replacement:
+            # A function, not a template: model output may contain backslashes.
+            highlighted_text = re.sub(r'\b' + re.escape(replacement) + r'\b',
+                                      lambda _: f'<mark>{replacement}</mark>', highlighted_text, 1)
+    return highlighted_text
+
+
+def anonymize_text_with_gpt(text, level, api_key, base_url=None, timeout=None,
+                            chunk_chars=0, concurrency=4, max_retries=5):
+    """
+    Anonymizes a report with GPT. Reports longer than `chunk_chars` are split
+    at paragraph boundaries and the chunks are sent concurrently (see
+    anonymize_text_with_gpt_chunked).
+    """
+    if chunk_chars and len(text) > chunk_chars:
+        return anonymize_text_with_gpt_chunked(text, level, api_key, base_url, timeout,
+                                               chunk_chars, concurrency, max_retries)
+
+    client = openai.OpenAI(**_gpt_client_options(api_key, base_url, timeout))
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.5,
-            response_format={"type": "json_object"}
-        )
+        with stage('openai'):
+            response = client.chat.completions.create(
+                model=GPT_MODEL,
+                messages=[{"role": "user", "content": _gpt_prompt(text, level)}],
+                temperature=0.5,
+                response_format={"type": "json_object"}
+            )
         response_data = json.loads(response.choices[0].message.content)
         anonymized_text = response_data.get('anonymized_text', '')
         changes = response_data.get('changes', [])
-        highlighted_text = anonymized_text
-        sorted_changes = sorted(changes, key=lambda x: len(x.get('replacement', '')), reverse=True)
-        for change in sorted_changes:
-            replacement = change.get('replacement')
-            if replacement:
-                highlighted_text = re.sub(r'\b' + re.escape(replacement) + r'\b', f'<mark>{replacement}</mark>',
-                                          highlighted_text, 1)
         return {
-            'anonymized_text_highlighted': highlighted_text,
-            'anonymized_text_clean': anonymized_text
+            'anonymized_text_highlighted': _highlight_changes(anonymized_text, changes),
+            'anonymized_text_clean': anonymized_text,
+            'changes': changes
         }
     except openai.APIConnectionError as e:
         raise ConnectionError(f"OpenAI API connection error: {e}")
@@ -270,8 +745,175 @@ def anonymize_text_with_gpt(text, level, api_key):
     except Exception as e:
         raise RuntimeError(f"An unexpected error occurred with the AI model: {e}")
 
-def generate_pdf_report(text, is_highlighted):
-    buffer = BytesIO()
+
+# --- Chunked GPT Anonymization for Long Reports ---
+def split_into_gpt_chunks(text, chunk_chars):
+    """
+    Groups whole paragraphs into chunks of at most chunk_chars (a single longer
+    paragraph is split at sentences). Returns (start, end) offsets; the text
+    between two chunks is whitespace that is kept as-is when merging.
+    """
+    chunks = []
+    for start, end in split_into_chunks(text, chunk_chars):
+        if chunks and end - chunks[-1][0] <= chunk_chars:
+            chunks[-1] = (chunks[-1][0], end)
+        else:
+            chunks.append((start, end))
+    return chunks
+
+
+def seed_gpt_replacements(text, level):
+    """
+    A quick SpaCy pass that picks one replacement per entity up front, so every
+    chunk sent to GPT replaces the same original with the same value.
+    """
+    replacements = {}
+    for entity in process_text_spacy(text, level):
+        replacement = entity['suggestions'][0] if entity['suggestions'] else None
+        if replacement:
+            for original in entity['text_to_replace']:
+                replacements.setdefault(original, replacement)
+    return replacements
+
+
+async def _anonymize_gpt_chunk(client, semaphore, chunk, level, known_replacements, max_retries):
+    async with semaphore:
+        for attempt in range(max_retries + 1):
+            try:
+                with stage('openai'):
+                    response = await client.chat.completions.create(
+                        model=GPT_MODEL,
+                        messages=[{"role": "user", "content": _gpt_prompt(chunk, level, known_replacements)}],
+                        temperature=0.5,
+                        response_format={"type": "json_object"}
+                    )
+                break
+            except openai.RateLimitError:
+                if attempt == max_retries:
+                    raise
+                # Exponential backoff with jitter: ~1s, 2s, 4s, ... capped at 30s.
+                await asyncio.sleep(min(30, 2 ** attempt) * (0.5 + random.random()))
+    response_data = json.loads(response.choices[0].message.content)
+    return response_data.get('anonymized_text', ''), response_data.get('changes', [])
+
+
+async def _anonymize_gpt_chunks(chunks, level, replacements, client_options, concurrency, max_retries):
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    async with openai.AsyncOpenAI(**client_options, max_retries=0) as client:
+        tasks = []
+        for chunk in chunks:
+            # Only send the pre-seeded replacements that occur in this chunk.
+            known = {original: replacement for original, replacement in replacements.items() if original in chunk}
+            tasks.append(_anonymize_gpt_chunk(client, semaphore, chunk, level, known, max_retries))
+        return await asyncio.gather(*tasks)
+
+
+def anonymize_text_with_gpt_chunked(text, level, api_key, base_url=None, timeout=None,
+                                    chunk_chars=12000, concurrency=4, max_retries=5):
+    """
+    Splits a long report at paragraph boundaries and anonymizes the chunks
+    concurrently with AsyncOpenAI, at most `concurrency` at a time, retrying
+    rate-limited requests with backoff. A shared original -> replacement map,
+    pre-seeded from SpaCy and extended with each chunk's changes, keeps
+    replacements consistent across chunks.
+    """
+    offsets = split_into_gpt_chunks(text, chunk_chars)
+    chunks = [text[start:end] for start, end in offsets]
+    replacements = seed_gpt_replacements(text, level)
+
+    try:
+        results = asyncio.run(_anonymize_gpt_chunks(
+            chunks, level, replacements, _gpt_client_options(api_key, base_url, timeout), concurrency, max_retries))
+    except openai.APIConnectionError as e:
+        raise ConnectionError(f"OpenAI API connection error: {e}")
+    except openai.RateLimitError as e:
+        raise ConnectionError(f"OpenAI API rate limit exceeded: {e}")
+    except openai.AuthenticationError as e:
+        raise ValueError(f"OpenAI authentication failed. Check your API key. Error: {e}")
+    except Exception as e:
+        raise RuntimeError(f"An unexpected error occurred with the AI model: {e}")
+
+    # Merge: the first replacement chosen for an original wins; if a later chunk
+    # picked something else for it, that chunk's text is rewritten to match.
+    # All of a chunk's rewrites are applied in one pass, so a rewritten value is
+    # never rewritten again by a later change (A->"John"->"Mark"->"Paul").
+    mapping = {}
+    clean_parts = []
+    highlighted_parts = []
+    for index, (anonymized_chunk, changes) in enumerate(results):
+        chunk_changes = []
+        rewrites = {}
+        for change in changes:
+            original, replacement = change.get('original'), change.get('replacement')
+            if not original or not replacement:
+                continue
+            canonical = mapping.setdefault(original, replacements.get(original, replacement))
+            if canonical != replacement:
+                rewrites.setdefault(replacement, canonical)
+            chunk_changes.append({'original': original, 'replacement': canonical})
+        if rewrites:
+            anonymized_chunk = compile_words(rewrites).sub(lambda match: rewrites[match.group(0)], anonymized_chunk)
+
+        # Whitespace before each chunk (and after the last one) is kept from the original.
+        separator = text[offsets[index - 1][1] if index else 0:offsets[index][0]]
+        clean_parts.append(separator)
+        highlighted_parts.append(separator)
+        clean_parts.append(anonymized_chunk)
+        highlighted_parts.append(_highlight_changes(anonymized_chunk, chunk_changes))
+
+    tail = text[offsets[-1][1]:] if offsets else text
+    clean_parts.append(tail)
+    highlighted_parts.append(tail)
+    return {
+        'anonymized_text_highlighted': ''.join(highlighted_parts),
+        'anonymized_text_clean': ''.join(clean_parts),
+        'changes': [{'original': original, 'replacement': replacement} for original, replacement in mapping.items()]
+    }
+
+
+# --- Report Generation ---
+_MARK_RE = re.compile(r'(<mark>.*?</mark>)')
+
+
+class _LazyParagraph(Flowable):
+    """
+    One line of the report as a ReportLab Paragraph that is only parsed when
+    the layout reaches it and released once drawn, so a long report never holds
+    every parsed paragraph at once.
+    """
+
+    def __init__(self, text, style):
+        super().__init__()
+        self.text = text
+        self.style = style
+        self._paragraph = None
+
+    def _get_paragraph(self):
+        if self._paragraph is None:
+            self._paragraph = Paragraph(self.text, self.style)
+        return self._paragraph
+
+    def wrap(self, availWidth, availHeight):
+        return self._get_paragraph().wrap(availWidth, availHeight)
+
+    def split(self, availWidth, availHeight):
+        return self._get_paragraph().split(availWidth, availHeight)
+
+    def drawOn(self, canvas, x, y, _sW=0):
+        self._get_paragraph().drawOn(canvas, x, y, _sW)
+        self._paragraph = None
+
+    def getSpaceBefore(self):
+        return self.style.spaceBefore
+
+    def getSpaceAfter(self):
+        return self.style.spaceAfter
+
+
+@timed_stage('render_pdf')
+def generate_pdf_report(text, is_highlighted, output=None):
+    """Renders the report as a PDF into `output` (a path or file object), or a new BytesIO that is returned."""
+    buffer = output if output is not None else BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=letter)
     styles = getSampleStyleSheet()
 
@@ -290,30 +932,36 @@ def generate_pdf_report(text, is_highlighted):
         # This resolves the AttributeError.
         text = text.replace('<mark>', '<font backColor="#FDFFB6">').replace('</mark>', '</font>')
 
-    # The <br/> tag is the standard way to handle newlines in ReportLab Paragraphs.
-    story = [Paragraph(line, styles['BodyText']) for line in text.replace('\n', '<br/>').split('<br/>')]
+    # One flowable per source line; each is parsed only when it is laid out.
+    story = [_LazyParagraph(line, styles['BodyText']) for line in text.split('\n')]
     doc.build(story)
 
-    buffer.seek(0)
-    return buffer
+    if output is None:
+        buffer.seek(0)
+        return buffer
+    return output
+
 
-def generate_docx_report(text, is_highlighted):
-    # This function remains the same as before
+@timed_stage('render_docx')
+def generate_docx_report(text, is_highlighted, output=None):
+    """Renders the report as a DOCX into `output` (a path or file object), or a new BytesIO that is returned."""
     document = Document()
     document.add_heading('Anonymized Report', level=1)
-    if is_highlighted:
-        segments = re.split(r'(<mark>.*?</mark>)', text)
+    # One Word paragraph per source line, like the PDF.
+    for line in text.split('\n'):
         p = document.add_paragraph()
-        for segment in segments:
-            if segment.startswith('<mark>'):
-                content = segment.replace('<mark>', '').replace('</mark>', '')
-                run = p.add_run(content)
-                run.font.highlight_color = 7  # Yellow in WD_COLOR_INDEX
-            else:
-                p.add_run(segment)
-    else:
-        document.add_paragraph(text)
-    buffer = BytesIO()
+        if is_highlighted:
+            for segment in _MARK_RE.split(line):
+                if segment.startswith('<mark>'):
+                    run = p.add_run(segment[len('<mark>'):-len('</mark>')])
+                    run.font.highlight_color = 7  # Yellow in WD_COLOR_INDEX
+                elif segment:
+                    p.add_run(segment)
+        else:
+            p.add_run(line)
+    buffer = output if output is not None else BytesIO()
     document.save(buffer)
-    buffer.seek(0)
-    return buffer
\ No newline at end of file
+    if output is None:
+        buffer.seek(0)
+        return buffer
+    return output
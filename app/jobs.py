@@ -0,0 +1,206 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+FINISHED_STATES = (DONE, FAILED)
+
+
+def _process_start(pid):
+    """The start time of process `pid` (Linux), which tells it apart from a later process with the same pid."""
+    try:
+        with open(f'/proc/{pid}/stat') as file:
+            return file.read().rsplit(')', 1)[1].split()[19]
+    except (OSError, IndexError):
+        return None
+
+
+def current_worker():
+    return {'host': socket.gethostname(), 'pid': os.getpid(), 'start': _process_start(os.getpid())}
+
+
+def worker_alive(worker):
+    """False if the process that ran a job is known to have exited; True if it is alive or on another host."""
+    if not worker or worker.get('host') != socket.gethostname():
+        return True
+    if worker.get('start') is not None:
+        return _process_start(worker['pid']) == worker['start']
+    try:
+        os.kill(worker['pid'], 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+# --- Job Stores ---
+class MemoryJobStore:
+    """Keeps job state in this process. Only suitable for a single worker."""
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def save(self, job):
+        with self._lock:
+            self._jobs[job['id']] = dict(job)
+
+    def load(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def delete(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def purge(self, before):
+        with self._lock:
+            for job_id in [job_id for job_id, job in self._jobs.items() if job['updated'] < before]:
+                del self._jobs[job_id]
+
+
+class SQLiteJobStore:
+    """
+    Keeps job status in an SQLite file, so any Gunicorn worker can answer
+    status requests. Only the status is shared: the work itself runs in the
+    worker that accepted the job.
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._path = path
+        self._local = threading.local()
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, user_id INTEGER, status TEXT NOT NULL, '
+                'result TEXT, error TEXT, created REAL NOT NULL, updated REAL NOT NULL, deadline REAL, worker TEXT)')
+            columns = [row[1] for row in connection.execute('PRAGMA table_info(jobs)')]
+            if 'worker' not in columns:
+                connection.execute('ALTER TABLE jobs ADD COLUMN worker TEXT')
+
+    def _connect(self):
+        # SQLite connections must not cross a fork, so reconnect in a new process.
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._local.connection = sqlite3.connect(self._path, timeout=10)
+            self._local.pid = os.getpid()
+        return self._local.connection
+
+    def save(self, job):
+        with self._connect() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO jobs (id, user_id, status, result, error, created, updated, deadline, worker) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (job['id'], job['user_id'], job['status'], json.dumps(job['result']), job['error'],
+                 job['created'], job['updated'], job['deadline'], json.dumps(job['worker'])))
+
+    def load(self, job_id):
+        row = self._connect().execute(
+            'SELECT id, user_id, status, result, error, created, updated, deadline, worker FROM jobs WHERE id = ?',
+            (job_id,)).fetchone()
+        if row is None:
+            return None
+        keys = ('id', 'user_id', 'status', 'result', 'error', 'created', 'updated', 'deadline', 'worker')
+        job = dict(zip(keys, row))
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        job['worker'] = json.loads(job['worker']) if job['worker'] else None
+        return job
+
+    def delete(self, job_id):
+        with self._connect() as connection:
+            connection.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+
+    def purge(self, before):
+        with self._connect() as connection:
+            connection.execute('DELETE FROM jobs WHERE updated < ?', (before,))
+
+
+# --- Job Queue ---
+class JobQueue:
+    """
+    Runs slow work (OpenAI calls) on a bounded in-process thread pool so the
+    request thread can return a job id immediately. Job status lives in a store
+    that status and event endpoints read from.
+
+    The work is not persisted (it would mean storing the report and the
+    user's API key): a job queued or running in a worker that exits is lost.
+    A job whose worker is known to have exited is reported as failed when it
+    is read, so the user can retry at once.
+
+    A thread cannot be interrupted, so `timeout` is enforced when the job is
+    read: a job still unfinished past its deadline is reported as failed. The
+    work itself should also be given a client-side timeout.
+
+    Finished jobs should be deleted once their result was delivered; any
+    others are purged `ttl` seconds after their last update.
+    """
+
+    def __init__(self, max_workers=4, timeout=300, ttl=3600, store_path=None):
+        self.configure(max_workers, timeout, ttl, store_path)
+
+    def configure(self, max_workers=4, timeout=300, ttl=3600, store_path=None):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.ttl = ttl
+        self.store = SQLiteJobStore(store_path) if store_path else MemoryJobStore()
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # Thread pools do not survive a fork, so each worker process creates its own.
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='job')
+                self._pid = os.getpid()
+            return self._executor
+
+    def submit(self, func, *args, user_id=None, **kwargs):
+        """Queues func(*args, **kwargs) and returns the new job's id."""
+        now = time.time()
+        job = {'id': uuid.uuid4().hex, 'user_id': user_id, 'status': QUEUED, 'result': None, 'error': None,
+               'created': now, 'updated': now, 'deadline': now + self.timeout, 'worker': current_worker()}
+        self.store.save(job)
+        self.store.purge(now - self.ttl)
+        self._get_executor().submit(self._run, job, func, args, kwargs)
+        return job['id']
+
+    def _run(self, job, func, args, kwargs):
+        job.update(status=RUNNING, updated=time.time())
+        self.store.save(job)
+        try:
+            job.update(status=DONE, result=func(*args, **kwargs))
+        except Exception as e:
+            job.update(status=FAILED, error=str(e))
+        job['updated'] = time.time()
+        if job['status'] == DONE and job['updated'] > job['deadline']:
+            job.update(status=FAILED, result=None, error='The job timed out.')
+        self.store.save(job)
+
+    def get(self, job_id, user_id=None):
+        """Returns the job's state, or None if it does not exist or belongs to another user."""
+        job = self.store.load(job_id)
+        if job is None or (user_id is not None and job['user_id'] != user_id):
+            return None
+        if job['status'] not in FINISHED_STATES:
+            if time.time() > job['deadline']:
+                job.update(status=FAILED, error='The job timed out.', updated=time.time())
+                self.store.save(job)
+            elif not worker_alive(job['worker']):
+                job.update(status=FAILED, error='The job was interrupted by a server restart. Please try again.',
+                           updated=time.time())
+                self.store.save(job)
+        return job
+
+    def delete(self, job_id):
+        self.store.delete(job_id)
+
+
+job_queue = JobQueue()
@@ -1,13 +1,34 @@
 import os
-from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, Response, abort
+import hmac
+import json
+import time
+import uuid
+from datetime import datetime
+from io import BytesIO
+from flask import (
+    Blueprint, render_template, request, jsonify, flash, redirect, url_for, Response, abort,
+    current_app, stream_with_context, send_file, make_response
+)
 from flask_login import login_required, current_user
+from sqlalchemy import tuple_
+from sqlalchemy.orm import undefer_group
+from werkzeug.datastructures import FileStorage
 from . import db
 from .models import ReportHistory
+from .ner_cache import ner_cache
+from .prefilter import ner_prefilter
+from .gazetteer import gazetteer
+from .suggestions import suggestion_pool
+from .metrics import metrics
+from .user_cache import user_cache
+from .sessions import wizard_sessions
+from .jobs import job_queue, DONE, FAILED, FINISHED_STATES
 from .helpers import (
-    extract_text_from_file, process_text_spacy,
-    finalize_anonymization_text, anonymize_text_with_gpt,
-    generate_pdf_report, generate_docx_report
+    extract_text_from_file, iter_text_from_file, iter_uploaded_files, process_text_spacy, process_texts_spacy,
+    finalize_anonymization_text, anonymize_text_with_gpt, LEVEL_LABELS
 )
+from .renders import render_cache, FORMATS
+from .search import search_available, search_reports
 
 main = Blueprint('main', __name__)
 
@@ -34,27 +55,178 @@ def upload_file():
     if file:
         try:
             text = extract_text_from_file(file)
-            return jsonify({'text': text})
+            # The text is kept server-side, so an unedited upload need not be sent back to /process-text.
+            session_id = wizard_sessions.create(current_user.id, original_text=text)
+            return jsonify({'text': text, 'session_id': session_id})
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         except Exception as e:
             return jsonify({'error': f'Failed to process file: {str(e)}'}), 500
     return jsonify({'error': 'File processing failed'}), 500
 
 
+def _load_wizard_session(session_id):
+    """The current user's wizard session, or a 404 JSON response if it is unknown or expired."""
+    session = wizard_sessions.get(session_id, user_id=current_user.id)
+    if session is None:
+        abort(make_response(jsonify({'error': 'Your session has expired. Please start the anonymization again.'}),
+                            404))
+    return session
+
+
 @main.route('/process-text', methods=['POST'])
 @login_required
 def process_text():
+    """
+    Starts (or restarts) a wizard session from `text`, or from the text already
+    stored under `session_id` (e.g. by /upload-file), and returns the session
+    id with the entities to review.
+    """
     data = request.get_json()
-    text = data.get('text')
     level = data.get('level')
+    session_id = data.get('session_id')
+    text = _load_wizard_session(session_id)['original_text'] if session_id else data.get('text')
     if not text or not level:
         return jsonify({'error': 'Missing text or anonymization level.'}), 400
 
     try:
         entities_to_review = process_text_spacy(text, level)
-        return jsonify(entities_to_review)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+    # With nothing to replace, the text itself is the result.
+    result = None if entities_to_review else {'anonymized_text_highlighted': text, 'anonymized_text_clean': text}
+    # gpt_run=None invalidates any Advanced AI job still running for this session, so it cannot overwrite `result`.
+    session = {'model': 'spacy', 'level': level, 'entities': entities_to_review, 'result': result, 'gpt_run': None}
+    if session_id:
+        wizard_sessions.update(session_id, current_user.id, **session)
+    else:
+        session_id = wizard_sessions.create(current_user.id, original_text=text, **session)
+    return jsonify({'session_id': session_id, 'entities': entities_to_review})
+
+
+def _iter_batch_documents(data, uploads, max_documents):
+    """
+    Yields (text, context) tuples for /process-batch from either a JSON body
+    ({"documents": [{"name": ..., "text": ...}]}) or uploaded files/zip archives.
+    Uploaded files are passed on as page/paragraph iterators rather than strings.
+    Documents rejected before extraction are passed through with empty text and an error.
+    """
+    if data is not None:
+        documents = data.get('documents') or []
+        for index, document in enumerate(documents[:max_documents]):
+            if isinstance(document, str):
+                document = {'text': document}
+            yield document.get('text') or '', {'index': index, 'name': document.get('name', f'document_{index}')}
+        return
+
+    for index, file in enumerate(iter_uploaded_files(uploads)):
+        if index >= max_documents:
+            break
+        context = {'index': index, 'name': file.filename}
+        try:
+            yield iter_text_from_file(file), context
+        except Exception as e:
+            context['error'] = f'Failed to process file: {str(e)}'
+            yield '', context
+
+
+@main.route('/process-batch', methods=['POST'])
+@login_required
+def process_batch():
+    """
+    Runs many documents through the SpaCy pipeline in one request and streams
+    each document's entity review list back as a line of NDJSON.
+    """
+    params = request.get_json() if request.is_json else request.form
+    level = params.get('level')
+    if level not in LEVEL_LABELS:
+        return jsonify({'error': 'Missing or invalid anonymization level.'}), 400
+    if not request.is_json and not request.files.getlist('files'):
+        return jsonify({'error': 'No files or documents provided.'}), 400
+
+    config = current_app.config
+    try:
+        batch_size = int(params.get('batch_size', config['NLP_BATCH_SIZE']))
+        n_process = int(params.get('n_process', config['NLP_N_PROCESS']))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'batch_size and n_process must be integers.'}), 400
+    batch_size = max(1, min(batch_size, 1000))
+    n_process = max(1, min(n_process, config['NLP_MAX_PROCESSES']))
+
+    # Uploaded files are closed when the view returns, before the stream is consumed,
+    # so keep in-memory copies for the generator.
+    data = request.get_json() if request.is_json else None
+    uploads = [FileStorage(stream=BytesIO(file.read()), filename=file.filename)
+               for file in request.files.getlist('files')]
+    documents = _iter_batch_documents(data, uploads, config['BATCH_MAX_DOCUMENTS'])
+
+    def generate():
+        try:
+            for context, entities_to_review, error in process_texts_spacy(documents, level, batch_size, n_process):
+                if error is not None:
+                    yield json.dumps({**context, 'error': f'Failed to process file: {str(error)}'}) + '\n'
+                elif 'error' in context:
+                    yield json.dumps(context) + '\n'
+                else:
+                    yield json.dumps({**context, 'entities': entities_to_review}) + '\n'
+        except Exception as e:
+            yield json.dumps({'error': str(e)}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@main.route('/ner-cache/stats')
+@login_required
+def ner_cache_stats():
+    return jsonify(ner_cache.stats())
+
+
+@main.route('/ner-prefilter/stats')
+@login_required
+def ner_prefilter_stats():
+    return jsonify(ner_prefilter.stats())
+
+
+@main.route('/metrics')
+def metrics_endpoint():
+    """
+    Prometheus metrics. Not behind the login, so scrapers can read it; they
+    need METRICS_TOKEN instead. With no token set, the endpoint is not served
+    unless METRICS_PUBLIC is on.
+    """
+    token = current_app.config['METRICS_TOKEN']
+    if not token:
+        if not current_app.config['METRICS_PUBLIC']:
+            abort(404)
+    elif not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@main.route('/gazetteer/stats')
+@login_required
+def gazetteer_stats():
+    return jsonify(gazetteer.stats())
+
+
+@main.route('/suggestions/stats')
+@login_required
+def suggestion_stats():
+    return jsonify(suggestion_pool.stats())
+
+
+@main.route('/user-cache/stats')
+@login_required
+def user_cache_stats():
+    return jsonify(user_cache.stats())
+
+
+@main.route('/renders/stats')
+@login_required
+def render_stats():
+    return jsonify(render_cache.stats())
+
 
 @main.route('/anonymize-text', methods=['POST'])
 @login_required
@@ -63,65 +235,216 @@ def anonymize_text():
     model = data.get('model')
 
     if model == 'spacy':
-        original_text = data.get('original_text')
+        session_id = data.get('session_id')
         user_choices = data.get('choices')
-        if not original_text or user_choices is None:
+        if not session_id or user_choices is None:
             return jsonify({'error': 'Missing data for SpaCy anonymization.'}), 400
-        result = finalize_anonymization_text(original_text, user_choices)
+        session = _load_wizard_session(session_id)
+        # Text edited during review no longer matches the entities' spans, so it is searched instead.
+        edited_text = data.get('original_text')
+        if edited_text and edited_text != session['original_text']:
+            result = finalize_anonymization_text(edited_text, user_choices)
+            wizard_sessions.update(session_id, current_user.id, original_text=edited_text, model='spacy',
+                                   result=result, gpt_run=None)
+        else:
+            result = finalize_anonymization_text(session['original_text'], user_choices, session.get('entities'))
+            wizard_sessions.update(session_id, current_user.id, model='spacy', result=result, gpt_run=None)
         return jsonify(result)
 
     elif model == 'chatgpt':
-        original_text = data.get('original_text')
+        session_id = data.get('session_id')
+        original_text = _load_wizard_session(session_id)['original_text'] if session_id else data.get('original_text')
         level = data.get('level')
         if not current_user.openai_api_key:
             return jsonify({'error': 'OpenAI API key is not set. Please add it in your profile.'}), 400
         if not original_text or not level:
             return jsonify({'error': 'Missing text or level for ChatGPT anonymization.'}), 400
+        # The job writes its result only if the session is still on this run (not re-run with SpaCy meanwhile).
+        run_id = uuid.uuid4().hex
+        session = {'model': 'chatgpt', 'level': level, 'entities': None, 'result': None, 'gpt_run': run_id}
+        if session_id:
+            wizard_sessions.update(session_id, current_user.id, **session)
+        else:
+            session_id = wizard_sessions.create(current_user.id, original_text=original_text, **session)
 
-        try:
-            result = anonymize_text_with_gpt(original_text, level, current_user.openai_api_key)
-            return jsonify(result)
-        except Exception as e:
-            return jsonify({'error': str(e)}), 500
+        # The OpenAI round trip can take a minute, so it runs as a background job
+        # and the client follows its progress via /jobs/<id> or /jobs/<id>/events.
+        config = current_app.config
+        job_id = job_queue.submit(_anonymize_session_with_gpt, session_id, current_user.id, run_id, original_text,
+                                  level, current_user.openai_api_key, base_url=config['OPENAI_BASE_URL'],
+                                  timeout=config['GPT_JOB_TIMEOUT'], chunk_chars=config['GPT_CHUNK_CHARS'],
+                                  concurrency=config['GPT_CHUNK_CONCURRENCY'], max_retries=config['GPT_MAX_RETRIES'],
+                                  user_id=current_user.id)
+        return jsonify({
+            'session_id': session_id,
+            'job_id': job_id,
+            'status_url': url_for('main.job_status', job_id=job_id),
+            'events_url': url_for('main.job_events', job_id=job_id)
+        }), 202
 
     return jsonify({'error': 'Invalid model selected.'}), 400
 
+
+def _anonymize_session_with_gpt(session_id, user_id, run_id, text, level, api_key, **options):
+    """
+    Job body for the AI path: the result is also stored in the wizard session
+    for /save-report, unless the session has moved on to another run. Only the
+    anonymized texts are returned, so the job store never holds the original
+    strings from the list of changes.
+    """
+    result = anonymize_text_with_gpt(text, level, api_key, **options)
+    result = {key: result[key] for key in ('anonymized_text_highlighted', 'anonymized_text_clean')}
+    wizard_sessions.update(session_id, user_id, expect={'gpt_run': run_id}, result=result)
+    return result
+
+
+def _job_payload(job):
+    payload = {'job_id': job['id'], 'status': job['status']}
+    if job['status'] == DONE:
+        payload['result'] = job['result']
+    elif job['status'] == FAILED:
+        payload['error'] = job['error']
+    return payload
+
+
+@main.route('/jobs/<string:job_id>')
+@login_required
+def job_status(job_id):
+    job = job_queue.get(job_id, user_id=current_user.id)
+    if job is None:
+        abort(404)
+    if job['status'] in FINISHED_STATES:
+        # Delivered: the result stays in the wizard session, and the job is not kept.
+        job_queue.delete(job_id)
+    return jsonify(_job_payload(job))
+
+
+@main.route('/jobs/<string:job_id>/events')
+@login_required
+def job_events(job_id):
+    """Server-Sent Events stream of a job's status, ending once it has finished."""
+    user_id = current_user.id
+    if job_queue.get(job_id, user_id=user_id) is None:
+        abort(404)
+    poll_interval = current_app.config['GPT_JOB_POLL_INTERVAL']
+
+    def generate():
+        last_status = None
+        while True:
+            job = job_queue.get(job_id, user_id=user_id)
+            if job is None:
+                yield 'event: error\ndata: {"error": "Job not found."}\n\n'
+                return
+            if job['status'] != last_status:
+                last_status = job['status']
+                yield f"event: status\ndata: {json.dumps(_job_payload(job))}\n\n"
+            if job['status'] in FINISHED_STATES:
+                job_queue.delete(job_id)
+                return
+            time.sleep(poll_interval)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 @main.route('/save-report', methods=['POST'])
 @login_required
 def save_report():
+    """Saves the finished report of a wizard session, from the server-side session state."""
     data = request.get_json()
+    session_id = data.get('session_id')
+    session = _load_wizard_session(session_id)
+    if not session.get('result'):
+        return jsonify({'success': False, 'error': 'This report has not been anonymized yet.'}), 400
     try:
         new_report = ReportHistory(
-            original_text=data['original_text'],
-            anonymized_text_highlighted=data['anonymized_text_highlighted'],
-            anonymized_text_clean=data['anonymized_text_clean'],
+            original_text=session['original_text'],
+            anonymized_text_highlighted=session['result']['anonymized_text_highlighted'],
+            anonymized_text_clean=session['result']['anonymized_text_clean'],
             user_id=current_user.id,
             # --- NEW DATA BEING SAVED ---
-            model_used=data['model'],
-            anonymization_level=data['level']
+            model_used=session['model'],
+            anonymization_level=session['level']
         )
         db.session.add(new_report)
         db.session.commit()
+        wizard_sessions.delete(session_id)
+        render_cache.prerender(new_report.id, new_report.anonymized_text_highlighted, new_report.anonymized_text_clean)
         flash('Report saved successfully!', 'success')
         return jsonify({'success': True, 'redirect_url': url_for('main.history')})
     except Exception as e:
         db.session.rollback() # Rollback in case of error
         return jsonify({'success': False, 'error': str(e)}), 500
 
+HISTORY_PAGE_SIZE = 10
+
+
+def encode_history_cursor(report):
+    return f"{report.timestamp.isoformat()}_{report.id}"
+
+
+def decode_history_cursor(cursor):
+    """Returns (timestamp, id) from a history cursor, or None if it is missing or malformed."""
+    try:
+        timestamp, _, report_id = cursor.rpartition('_')
+        return datetime.fromisoformat(timestamp), int(report_id)
+    except (AttributeError, ValueError):
+        return None
+
+
 @main.route('/history')
 @login_required
 def history():
-    page = request.args.get('page', 1, type=int)
-    per_page = 10
-    user_reports = ReportHistory.query.filter_by(user_id=current_user.id).order_by(
-        ReportHistory.timestamp.desc()).paginate(page=page, per_page=per_page, error_out=False)
-    return render_template('history.html', reports=user_reports)
+    """
+    Lists the user's reports newest first, HISTORY_PAGE_SIZE at a time. Pages
+    are addressed by keyset cursors on (timestamp, id): ?before=<cursor> for
+    older reports and ?after=<cursor> for newer ones. Only metadata and the
+    stored preview are loaded; the report texts stay deferred.
+    """
+    before = decode_history_cursor(request.args.get('before'))
+    after = None if before else decode_history_cursor(request.args.get('after'))
+    query = ReportHistory.query.filter_by(user_id=current_user.id)
+    key = tuple_(ReportHistory.timestamp, ReportHistory.id)
+    if after:
+        query = query.filter(key > after).order_by(ReportHistory.timestamp.asc(), ReportHistory.id.asc())
+    else:
+        if before:
+            query = query.filter(key < before)
+        query = query.order_by(ReportHistory.timestamp.desc(), ReportHistory.id.desc())
+
+    # One extra row tells whether there is another page in the direction of travel.
+    reports = query.limit(HISTORY_PAGE_SIZE + 1).all()
+    has_more = len(reports) > HISTORY_PAGE_SIZE
+    reports = reports[:HISTORY_PAGE_SIZE]
+    if after:
+        reports.reverse()
+    has_newer = has_more if after else before is not None
+    has_older = has_more if not after else True
+    return render_template('history.html', reports=reports,
+                           newer_cursor=encode_history_cursor(reports[0]) if reports and has_newer else None,
+                           older_cursor=encode_history_cursor(reports[-1]) if reports and has_older else None)
+
+
+@main.route('/history/search')
+@login_required
+def search_history():
+    """Full-text search over the user's anonymized reports; returns ranked, highlighted snippets as JSON."""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Missing search query.'}), 400
+    if not search_available():
+        return jsonify({'error': 'Search is only available with the SQLite database.'}), 501
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    results = search_reports(current_user.id, query, limit)
+    for result in results:
+        result['url'] = url_for('main.history_detail', report_id=result['id'])
+    return jsonify({'query': query, 'results': results})
 
 
 @main.route('/history/<int:report_id>')
 @login_required
 def history_detail(report_id):
-    report = ReportHistory.query.get_or_404(report_id)
+    report = ReportHistory.query.options(undefer_group('text')).get_or_404(report_id)
     if report.user_id != current_user.id:
         abort(403)
     return render_template('history_detail.html', report=report)
@@ -135,6 +458,7 @@ def delete_history(report_id):
         abort(403)
     db.session.delete(report)
     db.session.commit()
+    render_cache.invalidate(report_id)
     flash('History entry deleted successfully.', 'success')
     return redirect(url_for('main.history'))
 
@@ -142,20 +466,19 @@ def delete_history(report_id):
 @main.route('/download/<int:report_id>/<string:file_format>/<string:highlight>')
 @login_required
 def download_report(report_id, file_format, highlight):
-    report = ReportHistory.query.get_or_404(report_id)
+    if file_format not in FORMATS:
+        abort(404)
+    report = ReportHistory.query.options(undefer_group('text')).get_or_404(report_id)
     if report.user_id != current_user.id:
         abort(403)
 
     use_highlight = highlight == 'true'
     text_content = report.anonymized_text_highlighted if use_highlight else report.anonymized_text_clean
 
-    if file_format == 'pdf':
-        pdf_buffer = generate_pdf_report(text_content, use_highlight)
-        return Response(pdf_buffer, mimetype='application/pdf',
-                        headers={'Content-Disposition': f'attachment;filename=report_{report_id}.pdf'})
-    elif file_format == 'docx':
-        docx_buffer = generate_docx_report(text_content, use_highlight)
-        return Response(docx_buffer, mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-                        headers={'Content-Disposition': f'attachment;filename=report_{report_id}.docx'})
-    else:
-        abort(404)
\ No newline at end of file
+    # Rendered once per report version; repeat downloads are a file read or a 304.
+    path, digest = render_cache.get_or_render(report_id, file_format, use_highlight, text_content)
+    _, extension, mimetype = FORMATS[file_format]
+    response = send_file(path, mimetype=mimetype, as_attachment=True, download_name=f'report_{report_id}.{extension}',
+                         conditional=True, etag=f'{file_format}-{highlight}-{digest[:32]}')
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
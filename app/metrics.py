@@ -0,0 +1,228 @@
+import glob
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from flask import g, has_request_context, request
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+CHARS_BUCKETS = (100, 1000, 10000, 50000, 100000, 500000, 1000000, 5000000)
+COUNT_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+_SERVER_TIMING_NAME_RE = re.compile(r'[^A-Za-z0-9_-]')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+# --- Metrics Registry ---
+class Metrics:
+    """
+    A small in-process registry of counters and histograms, rendered in the
+    Prometheus text format for /metrics. Observations only take a lock and
+    update a few numbers, so instrumenting a hot path is cheap.
+
+    Every Gunicorn worker keeps its own values. With `directory` set, each
+    worker writes its values to a file there (at most every `flush_interval`
+    seconds), and /metrics adds up the files of all workers. Files of workers
+    that exited are kept, so counters never go backwards.
+
+    Collectors are callables that return (name, labels, value) samples for
+    counters read from elsewhere, such as cache hit counts, when values are
+    gathered.
+    """
+
+    def __init__(self, directory=None, flush_interval=5.0):
+        self._families = {}  # name -> (kind, help, buckets)
+        self._collectors = []
+        self.configure(directory, flush_interval)
+
+    def configure(self, directory=None, flush_interval=5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._values = {}  # (name, labels) -> [value] or [bucket counts..., sum, count]
+        self._flushed = 0.0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def counter(self, name, help_text):
+        self._families[name] = ('counter', help_text, None)
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self._families[name] = ('histogram', help_text, tuple(buckets))
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def observe(self, name, amount, **labels):
+        buckets = self._families[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            value = self._values.get(key)
+            if value is None:
+                value = self._values[key] = [0] * (len(buckets) + 2)
+            for index, bound in enumerate(buckets):
+                if amount <= bound:
+                    value[index] += 1
+            value[-2] += amount
+            value[-1] += 1
+        self._maybe_flush()
+
+    # --- Gathering and Exposition ---
+    def _local_values(self):
+        with self._lock:
+            values = {key: list(value) for key, value in self._values.items()}
+        for collector in self._collectors:
+            for name, labels, amount in collector():
+                values[(name, tuple(sorted(labels.items())))] = [amount]
+        return values
+
+    def _maybe_flush(self):
+        if self.directory and time.monotonic() - self._flushed >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Writes this worker's values to its file in `directory`."""
+        if not self.directory:
+            return
+        self._flushed = time.monotonic()
+        samples = [[name, list(labels), value] for (name, labels), value in self._local_values().items()]
+        handle, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.metrics-')
+        with os.fdopen(handle, 'w') as file:
+            json.dump(samples, file)
+        os.replace(temp_path, os.path.join(self.directory, f'metrics-{os.getpid()}.json'))
+
+    def gather(self):
+        """{(name, labels): value} for this worker, or summed over all workers with `directory` set."""
+        if not self.directory:
+            return self._local_values()
+        self.flush()
+        values = {}
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            try:
+                with open(path) as file:
+                    samples = json.load(file)
+            except (OSError, ValueError):
+                continue
+            for name, labels, value in samples:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                total = values.get(key)
+                values[key] = value if total is None else [a + b for a, b in zip(total, value)]
+        return values
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        by_name = {}
+        for (name, labels), value in self.gather().items():
+            by_name.setdefault(name, []).append((labels, value))
+        lines = []
+        for name, (kind, help_text, buckets) in self._families.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in sorted(by_name.get(name, [])):
+                if kind == 'counter':
+                    lines.append(f'{name}{_format_labels(labels)} {value[0]}')
+                    continue
+                for bound, count in zip(buckets, value):
+                    lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {count}')
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {value[-1]}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {value[-2]}')
+                lines.append(f'{name}_count{_format_labels(labels)} {value[-1]}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+metrics.histogram('anondev_stage_seconds', 'Time spent in each processing stage.')
+metrics.histogram('anondev_request_seconds', 'Time to produce a response, per endpoint (streams: until the first byte).')
+metrics.histogram('anondev_document_chars', 'Length of documents run through entity recognition.', CHARS_BUCKETS)
+metrics.histogram('anondev_document_entities', 'Entities found per document, before filtering by level.',
+                  COUNT_BUCKETS)
+metrics.counter('anondev_cache_lookups_total', 'Cache lookups by cache and result.')
+metrics.counter('anondev_prefilter_chunks_total', 'Paragraph chunks checked by the NER pre-filter, by outcome.')
+
+
+def component_samples():
+    """Counter samples read from the caches' and the pre-filter's own counts."""
+    from .ner_cache import ner_cache
+    from .prefilter import ner_prefilter
+    from .renders import render_cache
+    from .user_cache import user_cache
+    name = 'anondev_cache_lookups_total'
+    return [
+        (name, {'cache': 'ner', 'result': 'memory_hit'}, ner_cache.hits['memory']),
+        (name, {'cache': 'ner', 'result': 'disk_hit'}, ner_cache.hits['disk']),
+        (name, {'cache': 'ner', 'result': 'miss'}, ner_cache.misses),
+        (name, {'cache': 'render', 'result': 'hit'}, render_cache.hits),
+        (name, {'cache': 'render', 'result': 'miss'}, render_cache.misses),
+        (name, {'cache': 'user', 'result': 'hit'}, user_cache.hits),
+        (name, {'cache': 'user', 'result': 'miss'}, user_cache.misses),
+        ('anondev_prefilter_chunks_total', {'result': 'parsed'}, ner_prefilter.checked - ner_prefilter.skipped),
+        ('anondev_prefilter_chunks_total', {'result': 'skipped'}, ner_prefilter.skipped),
+    ]
+
+
+metrics.add_collector(component_samples)
+
+
+# --- Stage Timing ---
+@contextmanager
+def stage(name):
+    """
+    Times a block as one processing stage: observed in anondev_stage_seconds
+    and, inside a request, added to the request's Server-Timing entries.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.observe('anondev_stage_seconds', elapsed, stage=name)
+        if has_request_context():
+            timings = g.setdefault('stage_timings', {})
+            timings[name] = timings.get(name, 0.0) + elapsed
+
+
+def timed_stage(name):
+    """Decorator form of stage()."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def install_request_metrics(app, server_timing=False):
+    """Records each request's latency and, if `server_timing` is set, reports its stages in a Server-Timing header."""
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('request_started', None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        metrics.observe('anondev_request_seconds', elapsed, endpoint=request.endpoint or 'unknown',
+                        method=request.method, status=str(response.status_code))
+        if server_timing:
+            entries = [f'{_SERVER_TIMING_NAME_RE.sub("_", name)};dur={seconds * 1000:.1f}'
+                       for name, seconds in g.get('stage_timings', {}).items()]
+            entries.append(f'total;dur={elapsed * 1000:.1f}')
+            response.headers['Server-Timing'] = ', '.join(entries)
+        return response
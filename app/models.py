@@ -1,6 +1,7 @@
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from . import db
+from .storage import compress_text, decompress_text, split_highlighted, join_highlighted
 import datetime
 
 class User(UserMixin, db.Model):
@@ -16,17 +17,73 @@ class User(UserMixin, db.Model):
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+PREVIEW_CHARS = 250
+
+
 class ReportHistory(db.Model):
+    # Serves the history list: a user's reports newest first.
+    __table_args__ = (db.Index('ix_report_history_user_id_timestamp', 'user_id', 'timestamp'),)
+
     id = db.Column(db.Integer, primary_key=True)
-    original_text = db.Column(db.Text, nullable=False)
-    anonymized_text_highlighted = db.Column(db.Text, nullable=False)
-    anonymized_text_clean = db.Column(db.Text, nullable=False)
-    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.datetime.now(datetime.timezone.utc))
+    # Texts are stored zlib-compressed (see app/storage.py). The highlighted text is normally
+    # not stored at all: it is the clean text plus a list of <mark> spans.
+    # They are deferred: list queries load only metadata and the preview; views that show or
+    # render a report load them with undefer_group('text').
+    original_text_data = db.deferred(db.Column(db.LargeBinary, nullable=False), group='text')
+    clean_text_data = db.deferred(db.Column(db.LargeBinary, nullable=False), group='text')
+    highlight_spans = db.deferred(db.Column(db.LargeBinary, nullable=True), group='text')
+    # Only set when the highlighted text is not exactly the clean text plus <mark> tags.
+    highlighted_text_data = db.deferred(db.Column(db.LargeBinary, nullable=True), group='text')
+    preview = db.Column(db.String(PREVIEW_CHARS + 3), nullable=False, server_default='')
+    timestamp = db.Column(db.DateTime, nullable=False, default=lambda: datetime.datetime.now(datetime.timezone.utc))
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
     # Add a server_default to handle existing rows during migration.
     model_used = db.Column(db.String(50), nullable=False, server_default='unknown')
     anonymization_level = db.Column(db.String(50), nullable=False, server_default='unknown')
 
+    @property
+    def original_text(self):
+        return decompress_text(self.original_text_data)
+
+    @original_text.setter
+    def original_text(self, value):
+        self.original_text_data = compress_text(value)
+        self.preview = value[:PREVIEW_CHARS] + ('...' if len(value) > PREVIEW_CHARS else '')
+
+    @property
+    def anonymized_text_clean(self):
+        return decompress_text(self.clean_text_data)
+
+    @anonymized_text_clean.setter
+    def anonymized_text_clean(self, value):
+        highlighted = getattr(self, '_pending_highlighted', None)
+        if highlighted is None and self.clean_text_data is not None:
+            highlighted = self.anonymized_text_highlighted
+        self.clean_text_data = compress_text(value)
+        if highlighted is not None:
+            self._store_highlighted(highlighted, value)
+
+    @property
+    def anonymized_text_highlighted(self):
+        if self.highlighted_text_data is not None:
+            return decompress_text(self.highlighted_text_data)
+        clean = self.anonymized_text_clean
+        return join_highlighted(clean, self.highlight_spans) if self.highlight_spans is not None else clean
+
+    @anonymized_text_highlighted.setter
+    def anonymized_text_highlighted(self, value):
+        if self.clean_text_data is None:
+            # Set before the clean text (e.g. in the constructor): stored once the clean text arrives.
+            self._pending_highlighted = value
+        else:
+            self._store_highlighted(value, self.anonymized_text_clean)
+
+    def _store_highlighted(self, highlighted, clean):
+        self._pending_highlighted = None
+        spans = split_highlighted(highlighted, clean)
+        self.highlight_spans = spans
+        self.highlighted_text_data = compress_text(highlighted) if spans is None else None
+
     def __repr__(self):
         return f'<ReportHistory {self.id}>'
\ No newline at end of file
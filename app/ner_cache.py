@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict, namedtuple
+
+# A cached entity, shaped like the parts of a SpaCy Span the anonymizer reads.
+EntitySpan = namedtuple('EntitySpan', ['text', 'label_', 'start_char', 'end_char'])
+
+
+def encode_entities(entities):
+    """
+    Packs [(label, start_char, end_char), ...] into bytes: a JSON label table,
+    a NUL separator and an unsigned-int array of (label_index, start, end).
+    """
+    labels = sorted({label for label, _, _ in entities})
+    index = {label: i for i, label in enumerate(labels)}
+    values = array('I')
+    for label, start, end in entities:
+        values.extend((index[label], start, end))
+    return json.dumps(labels).encode('utf-8') + b'\0' + values.tobytes()
+
+
+def decode_entities(data):
+    header, _, body = data.partition(b'\0')
+    labels = json.loads(header)
+    values = array('I')
+    values.frombytes(body)
+    return [(labels[values[i]], values[i + 1], values[i + 2]) for i in range(0, len(values), 3)]
+
+
+# --- NER Result Cache ---
+class NerCache:
+    """
+    Content-addressed cache of NER results, keyed on the SHA-256 of the text
+    and the pipeline that produced them. Only labels and character offsets are
+    stored (never the text), with an in-memory LRU tier and an optional SQLite
+    tier shared by every worker on the machine.
+
+    Results are stored unfiltered, so one parse serves every anonymization
+    level that uses the same model.
+    """
+
+    def __init__(self, max_entries=512, path=None, max_disk_entries=100000):
+        self.configure(max_entries, path, max_disk_entries)
+
+    def configure(self, max_entries=512, path=None, max_disk_entries=100000):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._path = path
+        self._connection = None
+        self._writes = 0
+        self.hits = {'memory': 0, 'disk': 0}
+        self.misses = 0
+
+    @staticmethod
+    def key(text, fingerprint):
+        return f"{hashlib.sha256(text.encode('utf-8')).hexdigest()}:{fingerprint}"
+
+    def _disk(self):
+        if self._path and self._connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self._path)), exist_ok=True)
+            self._connection = sqlite3.connect(self._path, check_same_thread=False, timeout=5)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS ner_cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, created REAL NOT NULL)')
+            self._connection.commit()
+        return self._connection
+
+    def get(self, key):
+        """Returns [(label, start_char, end_char), ...] or None on a miss."""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.hits['memory'] += 1
+                return decode_entities(data)
+
+            connection = self._disk()
+            if connection is not None:
+                row = connection.execute('SELECT value FROM ner_cache WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    self._remember(key, row[0])
+                    self.hits['disk'] += 1
+                    return decode_entities(row[0])
+
+            self.misses += 1
+            return None
+
+    def set(self, key, entities):
+        data = encode_entities(entities)
+        with self._lock:
+            self._remember(key, data)
+            connection = self._disk()
+            if connection is not None:
+                connection.execute('INSERT OR REPLACE INTO ner_cache (key, value, created) VALUES (?, ?, ?)',
+                                   (key, data, time.time()))
+                self._writes += 1
+                if self._writes % 1000 == 0:
+                    connection.execute(
+                        'DELETE FROM ner_cache WHERE key NOT IN (SELECT key FROM ner_cache ORDER BY created DESC LIMIT ?)',
+                        (self.max_disk_entries,))
+                connection.commit()
+
+    def _remember(self, key, data):
+        self._memory[key] = data
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            connection = self._disk()
+            if connection is not None:
+                connection.execute('DELETE FROM ner_cache')
+                connection.commit()
+
+    def stats(self):
+        hits = sum(self.hits.values())
+        lookups = hits + self.misses
+        return {
+            'hits': hits,
+            'memory_hits': self.hits['memory'],
+            'disk_hits': self.hits['disk'],
+            'misses': self.misses,
+            'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+            'memory_entries': len(self._memory),
+            'disk_enabled': bool(self._path),
+        }
+
+
+ner_cache = NerCache()
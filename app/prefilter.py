@@ -0,0 +1,114 @@
+import re
+import threading
+
+from spacy.lang.en.stop_words import STOP_WORDS
+
+# The only labels the pre-filter looks for. Enable it only for levels that target nothing else.
+TARGET_LABELS = frozenset({'PERSON', 'AGE', 'NHS_NUMBER'})
+
+# Every AGE pattern of the EntityRuler contains one of these words ("45 years old", "aged 52", "23-year-old").
+_AGE_RE = re.compile(r'\b(?:aged?|years?)\b', re.IGNORECASE)
+# Ten digits, optionally grouped 3-3-4 as NHS numbers are written.
+_NHS_NUMBER_RE = re.compile(r'\b\d{3}[ -]?\d{3}[ -]?\d{4}\b')
+_CAPITALIZED_RE = re.compile(r"\b[A-Z][\w'’-]*")
+# Characters after which a capitalized word starts a sentence, list item or quote.
+_SENTENCE_OPENERS = frozenset('.!?:;"“‘(•*-–')
+# Short all-caps words are abbreviations (BP, GP, ECG, NHS), not names.
+_MAX_ABBREVIATION_CHARS = 3
+_PRONOUNS = frozenset({'I', "I'm", "I've", "I'd", "I'll", 'I’m', 'I’ve', 'I’d', 'I’ll'})
+
+
+def default_gazetteer():
+    """First names and surnames from Faker's English locales."""
+    from faker.providers.person.en_GB import Provider as BritishNames
+    from faker.providers.person.en_US import Provider as AmericanNames
+    return {name for provider in (AmericanNames, BritishNames)
+            for name in list(provider.first_names) + list(provider.last_names)}
+
+
+# --- NER Pre-Filter ---
+class ParagraphPrefilter:
+    """
+    A cheap rule-based check, run on each paragraph chunk before the SpaCy
+    pipeline, for levels that only target names, ages and NHS numbers. A
+    chunk is passed to the pipeline only if it could contain one:
+
+    - a word from the age patterns ("age", "aged", "year", "years"),
+    - ten digits that could be an NHS number,
+    - a capitalized word that does not start a sentence, ignoring "I" and
+      short abbreviations, or
+    - a sentence-initial word that is not a stop word ("The", "We", "After"),
+      or is a stop word that is also in the name gazetteer ("Will", "May").
+
+    Other chunks skip the pipeline and have no entities, so names written in
+    lower case are lost. The pre-filter is therefore off unless enabled per
+    level; benchmarks/bench_prefilter.py measures its recall against a
+    labelled corpus.
+    """
+
+    def __init__(self, levels=(), gazetteer_path=None):
+        self.configure(levels, gazetteer_path)
+
+    def configure(self, levels=(), gazetteer_path=None):
+        self.levels = frozenset(levels)
+        self.gazetteer_path = gazetteer_path
+        self._gazetteer = None
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.skipped = 0
+
+    def applies_to(self, level):
+        return level in self.levels
+
+    @property
+    def gazetteer(self):
+        """Faker's names plus, if configured, one extra name per line of `gazetteer_path`. Loaded on first use."""
+        if self._gazetteer is None:
+            with self._lock:
+                if self._gazetteer is None:
+                    names = default_gazetteer()
+                    if self.gazetteer_path:
+                        with open(self.gazetteer_path, encoding='utf-8') as file:
+                            names.update(line.strip() for line in file if line.strip())
+                    self._gazetteer = frozenset(names)
+        return self._gazetteer
+
+    def may_contain_targets(self, text):
+        """False only if `text` cannot contain a name, age or NHS number the pipeline would find."""
+        if _AGE_RE.search(text) or _NHS_NUMBER_RE.search(text):
+            return True
+        gazetteer = self.gazetteer
+        for match in _CAPITALIZED_RE.finditer(text):
+            word = match.group(0).rstrip("'’-")
+            if word in _PRONOUNS or (word.isupper() and len(word) <= _MAX_ABBREVIATION_CHARS):
+                continue
+            position = match.start() - 1
+            while position >= 0 and text[position].isspace():
+                position -= 1
+            if position >= 0 and text[position] not in _SENTENCE_OPENERS:
+                return True
+            if word.endswith(("'s", "’s")):
+                word = word[:-2]
+            if word.lower() not in STOP_WORDS or word in gazetteer:
+                return True
+        return False
+
+    def should_parse(self, text):
+        """may_contain_targets, counted for stats()."""
+        keep = self.may_contain_targets(text)
+        with self._lock:
+            self.checked += 1
+            if not keep:
+                self.skipped += 1
+        return keep
+
+    def stats(self):
+        return {
+            'levels': sorted(self.levels),
+            'checked': self.checked,
+            'skipped': self.skipped,
+            'skip_rate': round(self.skipped / self.checked, 4) if self.checked else 0.0,
+        }
+
+
+ner_prefilter = ParagraphPrefilter()
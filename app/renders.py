@@ -0,0 +1,211 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from .helpers import generate_pdf_report, generate_docx_report
+
+# Downloadable formats: renderer, file extension and MIME type.
+FORMATS = {
+    'pdf': (generate_pdf_report, 'pdf', 'application/pdf'),
+    'docx': (generate_docx_report, 'docx', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'),
+}
+
+
+# Every (format, highlighted) variant a report can be downloaded as.
+ALL_VARIANTS = [(file_format, highlighted) for file_format in FORMATS for highlighted in (True, False)]
+
+
+def parse_variants(value):
+    """Parses 'pdf:highlighted,docx:clean' (or 'all') into [(format, highlighted), ...]."""
+    if value.strip().lower() == 'all':
+        return list(ALL_VARIANTS)
+    variants = []
+    for item in filter(None, (part.strip().lower() for part in value.split(','))):
+        file_format, _, variant = item.partition(':')
+        if file_format not in FORMATS or variant not in ('highlighted', 'clean'):
+            raise ValueError(f"Invalid render variant '{item}', expected e.g. 'pdf:highlighted' or 'docx:clean'.")
+        variants.append((file_format, variant == 'highlighted'))
+    return variants
+
+
+# --- Render Cache ---
+class RenderCache:
+    """
+    Rendered PDF/DOCX downloads kept on disk, one directory per report.
+
+    A file is named after its format, highlight flag and the SHA-256 of the
+    text it was rendered from, so an edited report (or a reused report id)
+    never serves a stale file. Files are written to a temporary name and
+    renamed into place, so concurrent renders of the same file are harmless.
+
+    Saved reports can be pre-rendered on a small background thread pool, so
+    the first download is already a file read. A pre-render still running
+    when its report is deleted is discarded rather than written back. Render
+    times are recorded per format for /renders/stats.
+    """
+
+    def __init__(self, directory=None, prerender=(), max_workers=2):
+        self.configure(directory, prerender, max_workers)
+
+    def configure(self, directory=None, prerender=(), max_workers=2):
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'anondev-renders')
+        self.prerender_variants = list(prerender)
+        self.max_workers = max_workers
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._timings = {}
+        # Queued pre-renders per report, and how often a report with queued pre-renders was invalidated.
+        self._queued = Counter()
+        self._generations = {}
+        self._prerender_failures = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def content_hash(text):
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def path(self, report_id, file_format, highlighted, digest):
+        _, extension, _ = FORMATS[file_format]
+        variant = 'highlighted' if highlighted else 'clean'
+        return os.path.join(self.directory, str(report_id), f'{file_format}-{variant}-{digest[:32]}.{extension}')
+
+    def get_or_render(self, report_id, file_format, highlighted, text, generation=None):
+        """
+        Returns (path, digest) of the rendered file, rendering it first on a
+        miss. With a `generation`, the render is dropped (and None returned)
+        if the report was invalidated since that generation.
+        """
+        def is_current():
+            return generation is None or self._generations.get(report_id, 0) == generation
+
+        if not is_current():
+            return None
+        digest = self.content_hash(text)
+        path = self.path(report_id, file_format, highlighted, digest)
+        if os.path.exists(path):
+            self.hits += 1
+        else:
+            self.misses += 1
+            if not self.render(path, file_format, highlighted, text, is_current):
+                return None
+        return path, digest
+
+    def render(self, path, file_format, highlighted, text, is_current=None):
+        """
+        Renders to `path`. `is_current` is checked under the lock just before
+        the file is moved into place; if it returns False the render is
+        discarded and False returned.
+        """
+        renderer, _, _ = FORMATS[file_format]
+        started = time.perf_counter()
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        prefix = os.path.basename(path).rsplit('-', 1)[0] + '-'
+        handle, temp_path = tempfile.mkstemp(dir=directory, prefix='.' + prefix)
+        try:
+            with os.fdopen(handle, 'wb') as output:
+                renderer(text, highlighted, output)
+            # invalidate() removes the directory under the same lock, so it cannot slip in between.
+            with self._lock:
+                current = is_current is None or is_current()
+                if current:
+                    os.replace(temp_path, path)
+        except Exception:
+            _remove(temp_path)
+            raise
+        if not current:
+            # The report was deleted while rendering: leave nothing behind for it.
+            _remove(temp_path)
+            try:
+                os.rmdir(directory)
+            except OSError:
+                pass
+            return False
+        # Drop renders of earlier versions of the same text.
+        for name in os.listdir(directory):
+            if name.startswith(prefix) and os.path.join(directory, name) != path:
+                try:
+                    os.unlink(os.path.join(directory, name))
+                except FileNotFoundError:
+                    pass
+        self._record(f"{file_format}:{'highlighted' if highlighted else 'clean'}", time.perf_counter() - started)
+        return True
+
+    def _record(self, variant, seconds):
+        with self._lock:
+            timing = self._timings.setdefault(variant, {'count': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+            timing['count'] += 1
+            timing['total_seconds'] += seconds
+            timing['max_seconds'] = max(timing['max_seconds'], seconds)
+            timing['last_seconds'] = seconds
+
+    # --- Background Pre-rendering ---
+    def _get_executor(self):
+        # Thread pools do not survive a fork, so each worker process creates its own.
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='render')
+                self._pid = os.getpid()
+            return self._executor
+
+    def prerender(self, report_id, highlighted_text, clean_text):
+        """Queues the configured variants of a saved report for rendering. Does nothing if none are configured."""
+        if not self.prerender_variants:
+            return
+        executor = self._get_executor()
+        with self._lock:
+            self._queued[report_id] += len(self.prerender_variants)
+            generation = self._generations.get(report_id, 0)
+        for file_format, highlighted in self.prerender_variants:
+            text = highlighted_text if highlighted else clean_text
+            executor.submit(self._prerender, report_id, file_format, highlighted, text, generation)
+
+    def _prerender(self, report_id, file_format, highlighted, text, generation):
+        try:
+            self.get_or_render(report_id, file_format, highlighted, text, generation)
+        except Exception:
+            # A failed pre-render is retried synchronously by the first download.
+            with self._lock:
+                self._prerender_failures += 1
+        finally:
+            with self._lock:
+                self._queued[report_id] -= 1
+                if self._queued[report_id] <= 0:
+                    del self._queued[report_id]
+                    self._generations.pop(report_id, None)
+
+    def invalidate(self, report_id):
+        """Deletes a report's renders. Pre-renders of it that are still queued or running are discarded."""
+        with self._lock:
+            if report_id in self._queued:
+                self._generations[report_id] = self._generations.get(report_id, 0) + 1
+            shutil.rmtree(os.path.join(self.directory, str(report_id)), ignore_errors=True)
+
+    def stats(self):
+        with self._lock:
+            timings = {variant: {**timing, 'mean_seconds': round(timing['total_seconds'] / timing['count'], 4)}
+                       for variant, timing in self._timings.items()}
+            return {
+                'prerender': [f"{file_format}:{'highlighted' if highlighted else 'clean'}"
+                              for file_format, highlighted in self.prerender_variants],
+                'prerender_failures': self._prerender_failures,
+                'hits': self.hits,
+                'misses': self.misses,
+                'renders': timings,
+            }
+
+
+def _remove(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+render_cache = RenderCache()
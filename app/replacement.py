@@ -0,0 +1,118 @@
+import re
+
+
+# --- Single-Pass Multi-Pattern Replacement Engine ---
+def _build_trie(words):
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+    return trie
+
+
+def _trie_to_regex(node):
+    """
+    Turns a character trie into a regex fragment. Branches are ordered so that
+    longer continuations are always tried before a shorter word ends, which
+    gives "longest match first" behaviour with a single compiled pattern.
+    """
+    is_terminal = '' in node
+    branches = []
+    for char in sorted(k for k in node if k):
+        branches.append(re.escape(char) + _trie_to_regex(node[char]))
+
+    if not branches:
+        return ''
+    if len(branches) == 1:
+        body = branches[0]
+    else:
+        body = '(?:' + '|'.join(branches) + ')'
+    if is_terminal:
+        # Greedy '?' tries the longer branch first and backtracks to the shorter word.
+        return '(?:' + body + ')?'
+    return body
+
+
+def compile_words(words):
+    """A single word-bounded pattern matching any of `words`, longest match first."""
+    return re.compile(r'\b' + _trie_to_regex(_build_trie(words)) + r'\b')
+
+
+def compile_replacements(user_choices):
+    """
+    Compiles the user's choices into a single word-bounded pattern and a lookup
+    table from every original variation to its replacement.
+    Returns (pattern, mapping); pattern is None when there is nothing to replace.
+    """
+    mapping = {}
+
+    # Longer originals win when two choices claim the same variation.
+    sorted_choices = sorted(user_choices, key=lambda x: len(x['original']), reverse=True)
+    for choice in sorted_choices:
+        replacement = choice['replacement']
+        original_list = sorted(choice['original_list'], key=len, reverse=True)
+        if not replacement or not original_list or original_list[0] == replacement:
+            continue
+        for original_variation in original_list:
+            if original_variation:
+                mapping.setdefault(original_variation, replacement)
+
+    if not mapping:
+        return None, mapping
+
+    return compile_words(mapping), mapping
+
+
+def apply_replacements(text, pattern, mapping):
+    """
+    Scans the text once and builds both the highlighted and the clean output.
+    Returns a tuple (highlighted_text, clean_text).
+    """
+    if pattern is None:
+        return text, text
+
+    highlighted_parts = []
+    clean_parts = []
+    last_end = 0
+    for match in pattern.finditer(text):
+        start, end = match.span()
+        replacement = mapping[match.group(0)]
+        segment = text[last_end:start]
+        highlighted_parts.append(segment)
+        highlighted_parts.append(f'<mark>{replacement}</mark>')
+        clean_parts.append(segment)
+        clean_parts.append(replacement)
+        last_end = end
+
+    tail = text[last_end:]
+    highlighted_parts.append(tail)
+    clean_parts.append(tail)
+    return ''.join(highlighted_parts), ''.join(clean_parts)
+
+
+def apply_span_replacements(text, replacements):
+    """
+    Splices replacements into the text at known offsets in one pass.
+    `replacements` is a list of (start, end, replacement) sorted by start;
+    a span overlapping an earlier one is skipped.
+    Returns a tuple (highlighted_text, clean_text).
+    """
+    highlighted_parts = []
+    clean_parts = []
+    last_end = 0
+    for start, end, replacement in replacements:
+        if start < last_end:
+            continue
+        segment = text[last_end:start]
+        highlighted_parts.append(segment)
+        highlighted_parts.append(f'<mark>{replacement}</mark>')
+        clean_parts.append(segment)
+        clean_parts.append(replacement)
+        last_end = end
+
+    tail = text[last_end:]
+    highlighted_parts.append(tail)
+    clean_parts.append(tail)
+    return ''.join(highlighted_parts), ''.join(clean_parts)
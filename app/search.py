@@ -0,0 +1,115 @@
+import re
+import zlib
+from markupsafe import escape
+from sqlalchemy import event, inspect, text
+from . import db
+from .models import ReportHistory
+
+# FTS5 index over each report's anonymized (clean) text, keyed by report id.
+# The original text is never indexed. `owner` holds a single per-user token
+# ("u<user id>"), so the MATCH itself only visits the searching user's reports.
+CREATE_SEARCH_TABLE = ("CREATE VIRTUAL TABLE IF NOT EXISTS report_search "
+                       "USING fts5(body, owner, tokenize='unicode61 remove_diacritics 2')")
+BATCH_SIZE = 500
+
+# Snippet markers that cannot occur in report text; swapped for <mark> after HTML-escaping.
+_SNIPPET_OPEN, _SNIPPET_CLOSE = '\x02', '\x03'
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def search_available():
+    return db.engine.dialect.name == 'sqlite'
+
+
+def owner_token(user_id):
+    return f'u{user_id}'
+
+
+def create_search_index():
+    """
+    Creates the FTS5 table (SQLite only). Existing rows are indexed by the
+    migration; a table from before the owner column is rebuilt here.
+    """
+    if not search_available():
+        return
+    with db.engine.begin() as connection:
+        columns = [row[1] for row in connection.execute(text('PRAGMA table_info(report_search)'))]
+        if columns and 'owner' not in columns:
+            connection.execute(text('DROP TABLE report_search'))
+        connection.execute(text(CREATE_SEARCH_TABLE))
+        if columns and 'owner' not in columns:
+            rebuild_search_index(connection)
+
+
+def rebuild_search_index(connection):
+    """Indexes every report in id-ordered batches."""
+    last_id = 0
+    while True:
+        rows = connection.execute(text('SELECT id, user_id, clean_text_data FROM report_history WHERE id > :last_id '
+                                       'ORDER BY id LIMIT :limit'), {'last_id': last_id, 'limit': BATCH_SIZE}).fetchall()
+        if not rows:
+            break
+        connection.execute(text('INSERT OR REPLACE INTO report_search (rowid, body, owner) VALUES (:id, :body, :owner)'),
+                           [{'id': report_id, 'body': zlib.decompress(data).decode('utf-8'),
+                             'owner': owner_token(user_id)} for report_id, user_id, data in rows])
+        last_id = rows[-1][0]
+
+
+# The index is updated in the same transaction as the report row, from mapper events, so
+# every insert, edit or delete (including cascades from a deleted user) keeps it in sync.
+@event.listens_for(ReportHistory, 'after_insert')
+def index_report(mapper, connection, report):
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text('INSERT INTO report_search (rowid, body, owner) VALUES (:id, :body, :owner)'),
+                           {'id': report.id, 'body': report.anonymized_text_clean,
+                            'owner': owner_token(report.user_id)})
+
+
+@event.listens_for(ReportHistory, 'after_update')
+def reindex_report(mapper, connection, report):
+    if connection.dialect.name == 'sqlite' and inspect(report).attrs.clean_text_data.history.has_changes():
+        unindex_report(mapper, connection, report)
+        index_report(mapper, connection, report)
+
+
+@event.listens_for(ReportHistory, 'after_delete')
+def unindex_report(mapper, connection, report):
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text('DELETE FROM report_search WHERE rowid = :id'), {'id': report.id})
+
+
+def build_match_query(query, user_id):
+    """
+    Turns free text into an FTS5 query over one user's reports: every word
+    must appear in the body, and the last one may be a prefix. Words are
+    quoted, so FTS5 syntax in the input is inert.
+    """
+    terms = _TERM_RE.findall(query)
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return f'owner : "{owner_token(user_id)}" AND body : ({" ".join(quoted)})'
+
+
+def search_reports(user_id, query, limit=20):
+    """Returns the user's best-matching reports (bm25 rank) with an HTML-safe snippet of each."""
+    match = build_match_query(query, user_id)
+    if match is None:
+        return []
+    rows = db.session.execute(text(
+        'SELECT report_history.id, report_history.timestamp, report_history.model_used, '
+        'report_history.anonymization_level, '
+        'snippet(report_search, 0, :open, :close, \'…\', 16) AS snippet, report_search.rank AS rank '
+        'FROM report_search JOIN report_history ON report_history.id = report_search.rowid '
+        'WHERE report_search MATCH :match AND report_history.user_id = :user_id '
+        'ORDER BY report_search.rank LIMIT :limit'),
+        {'open': _SNIPPET_OPEN, 'close': _SNIPPET_CLOSE, 'match': match, 'user_id': user_id, 'limit': limit})
+    return [{
+        'id': row.id,
+        'timestamp': row.timestamp,
+        'model_used': row.model_used,
+        'anonymization_level': row.anonymization_level,
+        'snippet': str(escape(row.snippet)).replace(_SNIPPET_OPEN, '<mark>').replace(_SNIPPET_CLOSE, '</mark>'),
+        'rank': row.rank,
+    } for row in rows]
@@ -0,0 +1,171 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+
+
+# --- Session Stores ---
+class MemorySessionStore:
+    """Keeps sessions in this process. Only suitable for a single worker."""
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def save(self, session_id, user_id, data, expires):
+        with self._lock:
+            self._sessions[session_id] = (user_id, json.dumps(data), expires)
+
+    def load(self, session_id):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        user_id, data, expires = entry
+        return user_id, json.loads(data), expires
+
+    def modify(self, session_id, change):
+        """
+        Atomically replaces a session with change(user_id, data, expires), which
+        returns (data, expires) or None to leave it alone. Returns change's result.
+        """
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            user_id, data, expires = entry
+            result = change(user_id, json.loads(data), expires)
+            if result is not None:
+                self._sessions[session_id] = (user_id, json.dumps(result[0]), result[1])
+            return result
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def purge(self, now):
+        with self._lock:
+            for session_id in [key for key, entry in self._sessions.items() if entry[2] < now]:
+                del self._sessions[session_id]
+
+
+class SQLiteSessionStore:
+    """Keeps sessions, zlib-compressed, in an SQLite file shared by every Gunicorn worker."""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._path = path
+        self._local = threading.local()
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS wizard_sessions (id TEXT PRIMARY KEY, user_id INTEGER, '
+                               'data BLOB NOT NULL, expires REAL NOT NULL)')
+
+    def _connect(self):
+        # SQLite connections must not cross a fork, so reconnect in a new process.
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._local.connection = sqlite3.connect(self._path, timeout=10)
+            self._local.pid = os.getpid()
+        return self._local.connection
+
+    def save(self, session_id, user_id, data, expires):
+        with self._connect() as connection:
+            connection.execute('INSERT OR REPLACE INTO wizard_sessions (id, user_id, data, expires) VALUES (?, ?, ?, ?)',
+                               (session_id, user_id, zlib.compress(json.dumps(data).encode('utf-8')), expires))
+
+    def load(self, session_id):
+        row = self._connect().execute('SELECT user_id, data, expires FROM wizard_sessions WHERE id = ?',
+                                      (session_id,)).fetchone()
+        if row is None:
+            return None
+        user_id, data, expires = row
+        return user_id, json.loads(zlib.decompress(data)), expires
+
+    def modify(self, session_id, change):
+        """Like MemorySessionStore.modify, in one write transaction so concurrent workers cannot interleave."""
+        connection = self._connect()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            row = connection.execute('SELECT user_id, data, expires FROM wizard_sessions WHERE id = ?',
+                                     (session_id,)).fetchone()
+            if row is None:
+                return None
+            user_id, data, expires = row
+            result = change(user_id, json.loads(zlib.decompress(data)), expires)
+            if result is not None:
+                connection.execute('UPDATE wizard_sessions SET data = ?, expires = ? WHERE id = ?',
+                                   (zlib.compress(json.dumps(result[0]).encode('utf-8')), result[1], session_id))
+            return result
+
+    def delete(self, session_id):
+        with self._connect() as connection:
+            connection.execute('DELETE FROM wizard_sessions WHERE id = ?', (session_id,))
+
+    def purge(self, now):
+        with self._connect() as connection:
+            connection.execute('DELETE FROM wizard_sessions WHERE expires < ?', (now,))
+
+
+# --- Anonymization Wizard Sessions ---
+class WizardSessions:
+    """
+    Server-side state of one pass through the anonymization wizard: the
+    report text, the level and model, the entities found and, once finalized,
+    the anonymized result. The text is uploaded once; later steps send only the
+    session id, and /save-report persists what is stored here.
+
+    Each write extends the session's lifetime by `ttl` seconds; expired
+    sessions are purged whenever a new one is created.
+    """
+
+    def __init__(self, ttl=3600, store_path=None):
+        self.configure(ttl, store_path)
+
+    def configure(self, ttl=3600, store_path=None):
+        self.ttl = ttl
+        self.store = SQLiteSessionStore(store_path) if store_path else MemorySessionStore()
+
+    def create(self, user_id, **data):
+        """Stores a new session and returns its id."""
+        session_id = uuid.uuid4().hex
+        now = time.time()
+        self.store.purge(now)
+        self.store.save(session_id, user_id, data, now + self.ttl)
+        return session_id
+
+    def get(self, session_id, user_id=None):
+        """Returns the session's data, or None if it is unknown, expired or belongs to another user."""
+        entry = self.store.load(session_id) if session_id else None
+        if entry is None:
+            return None
+        owner, data, expires = entry
+        if expires < time.time() or (user_id is not None and owner != user_id):
+            return None
+        return data
+
+    def update(self, session_id, user_id=None, expect=None, **changes):
+        """
+        Merges `changes` into the session, atomically. With `expect`, only if the
+        session still has those values (e.g. the run that is writing its result
+        is still the current one). Returns the updated data, or None if the
+        session is gone or did not match.
+        """
+        def change(owner, data, expires):
+            if expires < time.time() or (user_id is not None and owner != user_id):
+                return None
+            if expect and any(data.get(key) != value for key, value in expect.items()):
+                return None
+            data.update(changes)
+            return data, time.time() + self.ttl
+
+        result = self.store.modify(session_id, change) if session_id else None
+        return result[0] if result else None
+
+    def delete(self, session_id):
+        self.store.delete(session_id)
+
+
+wizard_sessions = WizardSessions()
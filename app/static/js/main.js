@@ -1,6 +1,11 @@
 document.addEventListener('DOMContentLoaded', function () {
     // --- State Management ---
     let originalText = '';
+    // Server-side wizard session holding the text, entities and result (see /process-text).
+    let sessionId = null;
+    let uploadedSession = null;
+    // The text the entities' spans refer to; an edit made during review is sent along at finalization.
+    let analyzedText = '';
     let anonymizationSteps = [];
     let currentStepIndex = 0;
     let userChoices = [];
@@ -100,6 +105,7 @@ document.addEventListener('DOMContentLoaded', function () {
             if (response.ok) {
                 originalTextInput.value = data.text;
                 originalText = data.text;
+                uploadedSession = {id: data.session_id, text: data.text};
             } else {
                 showError(data.error || 'Failed to extract text.');
             }
@@ -117,23 +123,44 @@ document.addEventListener('DOMContentLoaded', function () {
             return;
         }
         resetUI();
+        sessionId = null;
         const selectedModel = modelSelect.value;
         showLoading(true, selectedModel === 'chatgpt' ? 'AI is processing your report...' : 'Analyzing text...');
         if (selectedModel === 'spacy') startSpacyProcess();
         else if (selectedModel === 'chatgpt') startGptProcess();
     }
 
+    // An unedited upload is already stored server-side, so only its session id is sent.
+    function textOrSession() {
+        if (uploadedSession && uploadedSession.text === originalText) return {session_id: uploadedSession.id};
+        return {text: originalText};
+    }
+
+    // POSTs buildBody(textOrSession()) as JSON. If the upload's session has expired (404),
+    // it is forgotten and the request is sent again with the text itself.
+    async function postTextOrSession(url, buildBody) {
+        const send = (source) => fetch(url, {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify(buildBody(source))
+        });
+        const source = textOrSession();
+        const response = await send(source);
+        if (response.status !== 404 || !source.session_id) return response;
+        uploadedSession = null;
+        return send({text: originalText});
+    }
+
     async function startSpacyProcess() {
         try {
-            const response = await fetch('/process-text', {
-                method: 'POST',
-                headers: {'Content-Type': 'application/json'},
-                body: JSON.stringify({text: originalText, level: levelSelect.value})
-            });
+            const response = await postTextOrSession('/process-text',
+                source => ({...source, level: levelSelect.value}));
             const data = await response.json();
             showLoading(false);
             if (response.ok) {
-                anonymizationSteps = data;
+                sessionId = data.session_id;
+                analyzedText = originalText;
+                anonymizationSteps = data.entities;
                 if (anonymizationSteps.length === 0) {
                     showInfo("No items found to anonymize for the selected level.");
                     displayFinalResult({
@@ -245,7 +272,8 @@ document.addEventListener('DOMContentLoaded', function () {
                 headers: {'Content-Type': 'application/json'},
                 body: JSON.stringify({
                     model: 'spacy',
-                    original_text: originalText,
+                    session_id: sessionId,
+                    original_text: originalText !== analyzedText ? originalText : undefined,
                     choices: userChoices
                 })
             });
@@ -261,21 +289,71 @@ document.addEventListener('DOMContentLoaded', function () {
 
     async function startGptProcess() {
         try {
-            const response = await fetch('/anonymize-text', {
-                method: 'POST',
-                headers: {'Content-Type': 'application/json'},
-                body: JSON.stringify({model: 'chatgpt', original_text: originalText, level: levelSelect.value})
-            });
+            const response = await postTextOrSession('/anonymize-text', source => ({
+                model: 'chatgpt',
+                session_id: source.session_id,
+                original_text: source.text,
+                level: levelSelect.value
+            }));
             const data = await response.json();
-            showLoading(false);
-            if (response.ok) displayFinalResult(data);
-            else showError(data.error || 'Failed to get response from AI.');
+            if (response.ok) {
+                sessionId = data.session_id;
+                followGptJob(data);
+            } else {
+                showLoading(false);
+                showError(data.error || 'Failed to get response from AI.');
+            }
         } catch (error) {
             showLoading(false);
             showError('An error occurred while communicating with the AI model.');
         }
     }
 
+    // The AI request runs as a background job: follow it over Server-Sent Events,
+    // falling back to polling the status endpoint if the stream is unavailable.
+    function followGptJob(job) {
+        const handleStatus = (status) => {
+            if (status.status === 'done') {
+                showLoading(false);
+                displayFinalResult(status.result);
+                return true;
+            }
+            if (status.status === 'failed') {
+                showLoading(false);
+                showError(status.error || 'Failed to get response from AI.');
+                return true;
+            }
+            return false;
+        };
+
+        if (!window.EventSource) {
+            pollGptJob(job.status_url, handleStatus);
+            return;
+        }
+        const events = new EventSource(job.events_url);
+        events.addEventListener('status', (e) => {
+            if (handleStatus(JSON.parse(e.data))) events.close();
+        });
+        events.onerror = () => {
+            events.close();
+            pollGptJob(job.status_url, handleStatus);
+        };
+    }
+
+    async function pollGptJob(statusUrl, handleStatus) {
+        try {
+            const response = await fetch(statusUrl);
+            const data = await response.json();
+            if (!response.ok) {
+                handleStatus({status: 'failed', error: data.error || 'The AI job could not be found.'});
+            } else if (!handleStatus(data)) {
+                setTimeout(() => pollGptJob(statusUrl, handleStatus), 1000);
+            }
+        } catch (error) {
+            handleStatus({status: 'failed', error: 'An error occurred while communicating with the AI model.'});
+        }
+    }
+
     function displayFinalResult(data) {
         currentFinalOutput.highlighted = data.anonymized_text_highlighted;
         currentFinalOutput.clean = data.anonymized_text_clean;
@@ -309,21 +387,16 @@ document.addEventListener('DOMContentLoaded', function () {
     }
 
     async function saveReport() {
-        if (!currentFinalOutput.clean) {
+        if (!currentFinalOutput.clean || !sessionId) {
             showError("Nothing to save.");
             return;
         }
         try {
+            // The report is saved from the server-side session; only its id is sent.
             const response = await fetch('/save-report', {
                 method: 'POST',
                 headers: {'Content-Type': 'application/json'},
-                body: JSON.stringify({
-                    original_text: originalText,
-                    anonymized_text_highlighted: currentFinalOutput.highlighted,
-                    anonymized_text_clean: currentFinalOutput.clean,
-                    model: modelSelect.value,
-                    level: levelSelect.value
-                })
+                body: JSON.stringify({session_id: sessionId})
             });
             const data = await response.json();
             if (response.ok && data.success) {
@@ -383,6 +456,7 @@ document.addEventListener('DOMContentLoaded', function () {
     clearTextBtn.addEventListener('click', () => {
         originalTextInput.value = '';
         originalText = '';
+        uploadedSession = null;
         fileUpload.value = '';
         fileNameSpan.textContent = '';
         resetUI();
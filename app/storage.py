@@ -0,0 +1,60 @@
+import zlib
+from array import array
+
+MARK_OPEN, MARK_CLOSE = '<mark>', '</mark>'
+COMPRESSION_LEVEL = 6
+
+
+# --- Compressed Report Text ---
+def compress_text(text):
+    return zlib.compress(text.encode('utf-8'), COMPRESSION_LEVEL)
+
+
+def decompress_text(data):
+    return zlib.decompress(data).decode('utf-8')
+
+
+def split_highlighted(highlighted, clean):
+    """
+    Finds the <mark> spans of `highlighted` as (start, end) offsets into `clean`.
+    Returns the packed span list, or None when `highlighted` is not exactly
+    `clean` with <mark> tags added (then it has to be stored as is).
+    """
+    spans = array('I')
+    parts = []
+    position = 0  # in highlighted
+    length = 0  # of the clean text rebuilt so far
+    while True:
+        start = highlighted.find(MARK_OPEN, position)
+        if start < 0:
+            break
+        end = highlighted.find(MARK_CLOSE, start + len(MARK_OPEN))
+        if end < 0:
+            return None
+        before = highlighted[position:start]
+        marked = highlighted[start + len(MARK_OPEN):end]
+        if MARK_OPEN in marked:
+            return None
+        parts.extend((before, marked))
+        length += len(before)
+        spans.extend((length, length + len(marked)))
+        length += len(marked)
+        position = end + len(MARK_CLOSE)
+    parts.append(highlighted[position:])
+    if MARK_CLOSE in parts[-1] or ''.join(parts) != clean:
+        return None
+    return zlib.compress(spans.tobytes(), COMPRESSION_LEVEL)
+
+
+def join_highlighted(clean, data):
+    """Rebuilds the highlighted text from the clean text and a span list from split_highlighted."""
+    spans = array('I')
+    spans.frombytes(zlib.decompress(data))
+    parts = []
+    position = 0
+    for i in range(0, len(spans), 2):
+        start, end = spans[i], spans[i + 1]
+        parts.extend((clean[position:start], MARK_OPEN, clean[start:end], MARK_CLOSE))
+        position = end
+    parts.append(clean[position:])
+    return ''.join(parts)
@@ -0,0 +1,148 @@
+import os
+import threading
+from collections import deque
+from faker import Faker
+
+FACILITY_TYPES = ['Centre', 'Building', 'Stadium', 'Clinic', 'Bridge', 'Plaza']
+
+# How a single value of each pooled kind is generated.
+GENERATORS = {
+    'name': lambda fake: fake.name(),
+    'city': lambda fake: fake.city(),
+    'country': lambda fake: fake.country(),
+    'street_address': lambda fake: fake.address().split('\n')[0],
+    'company': lambda fake: fake.company(),
+    'date': lambda fake: fake.date_this_decade().strftime('%B %d, %Y'),
+    'facility': lambda fake: f"{fake.street_name()} {fake.random_element(FACILITY_TYPES)}",
+    'time': lambda fake: fake.time(pattern="%I:%M %p"),
+}
+
+# Seed for the fixed catalogues used by deterministic (per-document) suggestions.
+CATALOGUE_SEED = 20250722
+
+
+def document_seed(digest):
+    """
+    A stable seed for a document from the SHA-256 hex digest of its text, so
+    re-processing it yields the same suggestions.
+    """
+    return int(digest[:16], 16)
+
+
+# --- Suggestion Pool ---
+class SuggestionPool:
+    """
+    Pre-generated Faker values per (locale, kind).
+
+    Faker provider calls are slow, so values are generated ahead of time by a
+    background thread and `take` only pops from a buffer. A buffer that drops
+    below the low watermark wakes the thread to refill it; an empty buffer
+    falls back to generating synchronously.
+
+    Deterministic suggestions (an `rng` passed to `take`) are sampled from a
+    fixed, seeded catalogue per (locale, kind) instead, so the same document
+    always gets the same suggestions.
+    """
+
+    def __init__(self, locales=('en_US',), size=2000, low_watermark=0.25, deterministic=False):
+        self.configure(locales, size, low_watermark, deterministic)
+
+    def configure(self, locales=('en_US',), size=2000, low_watermark=0.25, deterministic=False):
+        self.locales = list(locales)
+        self.deterministic = deterministic
+        self.default_locale = self.locales[0]
+        self.size = size
+        self.low_watermark = max(1, int(size * low_watermark))
+        self._buffers = {(locale, kind): deque() for locale in self.locales for kind in GENERATORS}
+        self._catalogues = {}
+        self._catalogue_lock = threading.Lock()
+        # Faker instances are not thread-safe: the refill thread and request threads use separate ones.
+        self._refill_fakers = {locale: Faker(locale) for locale in self.locales}
+        self._fallback_fakers = {locale: Faker(locale) for locale in self.locales}
+        self._fallback_lock = threading.Lock()
+        self._refill_needed = threading.Event()
+        self._thread = None
+        self._pid = None
+        # Values served from the buffers, generated on the spot because a buffer was empty, or seeded.
+        self.counts = {'pooled': 0, 'generated': 0, 'seeded': 0}
+
+    def start(self):
+        """Starts the background refill thread (once per process) and schedules an initial fill."""
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._refill_needed.set()
+        self._thread = threading.Thread(target=self._refill_loop, name='suggestion-pool', daemon=True)
+        self._thread.start()
+
+    def fill(self):
+        """
+        Tops up every buffer to the configured size in the calling thread, and
+        builds the seeded catalogues (first, if every document is seeded) so no
+        request has to.
+        """
+        if self.deterministic:
+            self._build_catalogues()
+        for (locale, kind), buffer in self._buffers.items():
+            fake = self._refill_fakers[locale]
+            generate = GENERATORS[kind]
+            missing = self.size - len(buffer)
+            if missing > 0:
+                buffer.extend(generate(fake) for _ in range(missing))
+        self._build_catalogues()
+
+    def _build_catalogues(self):
+        for locale, kind in self._buffers:
+            self._catalogue(locale, kind)
+
+    def _refill_loop(self):
+        while True:
+            self._refill_needed.wait()
+            self._refill_needed.clear()
+            self.fill()
+
+    def take(self, kind, count=1, locale=None, rng=None):
+        """Returns `count` values of a kind, e.g. take('name', 3)."""
+        locale = locale if locale in self.locales else self.default_locale
+        if rng is not None:
+            self.counts['seeded'] += count
+            return [rng.choice(self._catalogue(locale, kind)) for _ in range(count)]
+
+        # A process forked after start() (e.g. a Gunicorn worker) has no refill thread yet.
+        if self._pid != os.getpid():
+            self.start()
+
+        buffer = self._buffers[(locale, kind)]
+        values = []
+        for _ in range(count):
+            try:
+                values.append(buffer.popleft())
+                self.counts['pooled'] += 1
+            except IndexError:
+                with self._fallback_lock:
+                    values.append(GENERATORS[kind](self._fallback_fakers[locale]))
+                self.counts['generated'] += 1
+        if len(buffer) < self.low_watermark:
+            self._refill_needed.set()
+        return values
+
+    def _catalogue(self, locale, kind):
+        catalogue = self._catalogues.get((locale, kind))
+        if catalogue is None:
+            with self._catalogue_lock:
+                catalogue = self._catalogues.get((locale, kind))
+                if catalogue is None:
+                    fake = Faker(locale)
+                    fake.seed_instance(CATALOGUE_SEED)
+                    catalogue = self._catalogues[(locale, kind)] = [GENERATORS[kind](fake) for _ in range(self.size)]
+        return catalogue
+
+    def stats(self):
+        return {
+            'buffers': {f'{locale}:{kind}': len(buffer) for (locale, kind), buffer in self._buffers.items()},
+            'catalogues': len(self._catalogues),
+            'values': dict(self.counts),
+        }
+
+
+suggestion_pool = SuggestionPool()
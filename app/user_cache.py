@@ -0,0 +1,76 @@
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy.orm import make_transient_to_detached
+
+
+# --- User Loader Cache ---
+class UserCache:
+    """
+    A small TTL + LRU cache of User rows for Flask-Login's user_loader, so an
+    authenticated request does not need a database query just to find out who
+    is logged in.
+
+    Only column values are cached. Each hit builds a fresh User and merges it
+    into the request's session without loading it, so it behaves like a
+    queried user (relationships load lazily, changes commit normally).
+
+    Entries are invalidated by this worker when the user is changed here; other
+    workers see the change once their entry expires, after at most `ttl` seconds.
+    """
+
+    def __init__(self, ttl=60, max_entries=1024):
+        self.configure(ttl, max_entries)
+
+    def configure(self, ttl=60, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # user id -> (expires, column values)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, session, model, user_id):
+        """Returns the user with this id, attached to `session`, or None."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                values = entry[1]
+            else:
+                self._entries.pop(user_id, None)
+                self.misses += 1
+                values = None
+
+        if values is not None:
+            user = model(**values)
+            make_transient_to_detached(user)
+            return session.merge(user, load=False)
+
+        user = session.get(model, user_id)
+        if user is not None and self.ttl > 0:
+            values = {column.key: getattr(user, column.key) for column in model.__table__.columns}
+            with self._lock:
+                self._entries[user_id] = (now + self.ttl, values)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return user
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'entries': len(self._entries),
+            'ttl': self.ttl,
+        }
+
+
+user_cache = UserCache()
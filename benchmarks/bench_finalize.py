@@ -0,0 +1,122 @@
+"""
+Compares the ways finalize_anonymization_text has replaced entities: the
+original loop of two re.sub passes per entity variation, the single-pass
+pattern engine (still used for text edited after analysis), and the linear
+splice over the entity spans recorded by process_text_spacy.
+
+    python -m benchmarks.bench_finalize
+    python -m benchmarks.bench_finalize --sizes 10000,100000,1000000 --entities 10,100,500
+"""
+import argparse
+import random
+import re
+import time
+
+from faker import Faker
+
+from app.helpers import finalize_anonymization_text, add_unrecognized_spans
+from app.replacement import compile_replacements, apply_replacements
+
+
+def legacy_finalize(original_text, user_choices):
+    """The replacement loop as it was before the single-pass engine."""
+    anonymized_text = original_text
+    clean_text = original_text
+    sorted_choices = sorted(user_choices, key=lambda x: len(x['original']), reverse=True)
+    for choice in sorted_choices:
+        replacement = choice['replacement']
+        original_list = sorted(choice['original_list'], key=len, reverse=True)
+        if replacement and original_list[0] != replacement:
+            for original_variation in original_list:
+                anonymized_text = re.sub(r'\b' + re.escape(original_variation) + r'\b', f'<mark>{replacement}</mark>',
+                                         anonymized_text)
+                clean_text = re.sub(r'\b' + re.escape(original_variation) + r'\b', replacement, clean_text)
+    return anonymized_text, clean_text
+
+
+def single_pass_finalize(original_text, user_choices):
+    pattern, mapping = compile_replacements(user_choices)
+    return apply_replacements(original_text, pattern, mapping)
+
+
+def spliced_finalize(original_text, user_choices, entities):
+    result = finalize_anonymization_text(original_text, user_choices, entities)
+    return result['anonymized_text_highlighted'], result['anonymized_text_clean']
+
+
+def build_case(fake, text_size, entity_count):
+    choices = []
+    # Names never share a part and replacements never reuse an original part.
+    # The legacy loop mangles both cases (it re-replaces inside earlier output),
+    # so the outputs would not be comparable otherwise.
+    names = []
+    original_parts = set()
+    while len(names) < entity_count:
+        name = fake.name()
+        if not original_parts.intersection(name.split()):
+            names.append(name)
+            original_parts.update(name.split())
+    for name in names:
+        parts = name.split()
+        replacement = fake.name()
+        while original_parts.intersection(replacement.split()):
+            replacement = fake.name()
+        choices.append({
+            'original': name,
+            'original_list': list({name, parts[0], parts[-1]}),
+            'replacement': replacement,
+        })
+
+    words = []
+    length = 0
+    variations = [v for choice in choices for v in choice['original_list']]
+    while length < text_size:
+        word = random.choice(variations) if random.random() < 0.05 else fake.word()
+        words.append(word)
+        length += len(word) + 1
+    text = ' '.join(words)
+
+    # The review entities as process_text_spacy returns them. Every mention is
+    # given its span by the same scan that covers mentions the model missed.
+    entities = [{'text_to_replace': choice['original_list'], 'display_text': choice['original'], 'spans': []}
+                for choice in choices]
+    add_unrecognized_spans(text, entities)
+    return text, choices, entities
+
+
+def timed(func, *args, repeat=3):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10000,100000,1000000', help='Document lengths in characters.')
+    parser.add_argument('--entities', default='10,100,300', help='Number of chosen entities.')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    fake = Faker()
+    fake.seed_instance(args.seed)
+
+    print(f"{'chars':>10} {'entities':>9} {'legacy (s)':>12} {'single (s)':>12} {'spliced (s)':>12} {'speedup':>8}")
+    for size in (int(s) for s in args.sizes.split(',')):
+        for count in (int(c) for c in args.entities.split(',')):
+            text, choices, entities = build_case(fake, size, count)
+            legacy_time, legacy_result = timed(legacy_finalize, text, choices, repeat=args.repeat)
+            single_time, single_result = timed(single_pass_finalize, text, choices, repeat=args.repeat)
+            spliced_time, spliced_result = timed(spliced_finalize, text, choices, entities, repeat=args.repeat)
+            marker = '' if legacy_result == single_result == spliced_result else '  (outputs differ)'
+            print(f"{size:>10} {count:>9} {legacy_time:>12.4f} {single_time:>12.4f} {spliced_time:>12.4f} "
+                  f"{legacy_time / spliced_time:>7.1f}x{marker}")
+
+
+if __name__ == '__main__':
+    main()
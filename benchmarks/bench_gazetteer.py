@@ -0,0 +1,140 @@
+"""
+Benchmarks the gazetteer with a large synthetic term list (GP surgeries,
+wards, streets and NHS numbers): the first load, which tokenizes every term
+and writes the key cache; a warm start from that cache; and matching
+throughput on paragraphs that mention the terms. With --ruler-terms, the same
+terms are also added to an EntityRuler as token patterns for comparison.
+
+Runs on a blank English pipeline unless --model names a SpaCy model.
+
+    python -m benchmarks.bench_gazetteer
+    python -m benchmarks.bench_gazetteer --terms 100000 --ruler-terms 10000 --model en_core_web_lg
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+import spacy
+from faker import Faker
+
+from app.gazetteer import gazetteer
+from app.helpers import fake_nhs_number
+
+WARD_NAMES = ['Ward {number}{letter}, {city}', '{last_name} Ward', '{first_name} {last_name} Unit']
+SURGERY_NAMES = ['{last_name} Surgery', '{street_name} Medical Centre', '{city} Health Centre']
+
+
+def build_terms(fake, count):
+    """About `count` unique terms, split evenly across four labels."""
+    generators = {
+        'ORG': lambda: random.choice(SURGERY_NAMES).format(last_name=fake.last_name(), street_name=fake.street_name(),
+                                                           city=fake.city()),
+        'FAC': lambda: random.choice(WARD_NAMES).format(number=random.randint(1, 40), letter=random.choice('ABCD'),
+                                                        city=fake.city(), first_name=fake.first_name(),
+                                                        last_name=fake.last_name()),
+        'LOC': lambda: f"{random.randint(1, 300)} {fake.street_name()}",
+        'NHS_NUMBER': lambda: fake_nhs_number(random),
+    }
+    terms = {label: set() for label in generators}
+    for label, generate in generators.items():
+        attempts = 0
+        while len(terms[label]) < count // len(generators) and attempts < count * 4:
+            terms[label].add(generate())
+            attempts += 1
+    return {label: sorted(label_terms) for label, label_terms in terms.items()}
+
+
+def build_paragraphs(fake, terms, count, mentions=2):
+    flat = [term for label_terms in terms.values() for term in label_terms]
+    paragraphs = []
+    for _ in range(count):
+        words = fake.sentence(nb_words=30).split()
+        for _ in range(mentions):
+            words.insert(random.randrange(len(words)), random.choice(flat).lower())
+        paragraphs.append(' '.join(words))
+    return paragraphs
+
+
+def timed(func, repeat=1):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def throughput(nlp, paragraphs, repeat):
+    seconds, docs = timed(lambda: list(nlp.pipe(paragraphs)), repeat)
+    chars = sum(len(paragraph) for paragraph in paragraphs)
+    return seconds, chars / seconds, sum(len(doc.ents) for doc in docs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--terms', type=int, default=100000)
+    parser.add_argument('--paragraphs', type=int, default=2000)
+    parser.add_argument('--ruler-terms', type=int, default=0, help='Also time an EntityRuler with this many terms.')
+    parser.add_argument('--model', help='SpaCy model to add the gazetteer to (default: blank English).')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    fake = Faker('en_GB')
+    fake.seed_instance(args.seed)
+
+    def new_pipeline(component=None):
+        nlp = spacy.load(args.model) if args.model else spacy.blank('en')
+        if component:
+            nlp.add_pipe(component, before='ner' if 'ner' in nlp.pipe_names else None)
+        return nlp
+
+    terms = build_terms(fake, args.terms)
+    paragraphs = build_paragraphs(fake, terms, args.paragraphs)
+    print(f"terms: {sum(len(label_terms) for label_terms in terms.values())} "
+          f"({', '.join(f'{label} {len(label_terms)}' for label, label_terms in terms.items())})")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'gazetteer.json')
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump({'version': 'bench', 'terms': terms}, file)
+        cache_dir = os.path.join(directory, 'cache')
+
+        # First start: read the file, tokenize every term, write the key cache, build the matcher.
+        gazetteer.configure(path, cache_dir, reload_interval=0)
+        nlp = new_pipeline('gazetteer')
+        cold, _ = timed(lambda: (gazetteer.refresh(), nlp('warm up')))
+        # Later starts (or another worker): the same, reading the tokenized terms from the cache.
+        gazetteer.configure(path, cache_dir, reload_interval=0)
+        nlp = new_pipeline('gazetteer')
+        warm, _ = timed(lambda: (gazetteer.refresh(), nlp('warm up')))
+        print(f"first load (tokenize + cache): {cold:.2f} s")
+        print(f"warm start (from cache):       {warm:.2f} s")
+
+        seconds, chars_per_second, entities = throughput(nlp, paragraphs, args.repeat)
+        print(f"gazetteer pipeline: {seconds:.3f} s for {len(paragraphs)} paragraphs, "
+              f"{chars_per_second / 1e6:.2f} M chars/s, {entities} entities")
+
+        seconds, chars_per_second, _ = throughput(new_pipeline(), paragraphs, args.repeat)
+        print(f"without gazetteer:  {seconds:.3f} s, {chars_per_second / 1e6:.2f} M chars/s")
+
+    if args.ruler_terms:
+        ruler_nlp = new_pipeline('entity_ruler')
+        ruler = ruler_nlp.get_pipe('entity_ruler')
+        flat = [(label, term) for label, label_terms in terms.items() for term in label_terms]
+        flat = random.sample(flat, min(args.ruler_terms, len(flat)))
+        patterns = [{'label': label, 'pattern': [{'LOWER': token.lower_} for token in ruler_nlp.make_doc(term)]}
+                    for label, term in flat]
+        build, _ = timed(lambda: ruler.add_patterns(patterns))
+        seconds, chars_per_second, entities = throughput(ruler_nlp, paragraphs, args.repeat)
+        print(f"EntityRuler, {len(patterns)} token patterns: build {build:.2f} s, {seconds:.3f} s, "
+              f"{chars_per_second / 1e6:.2f} M chars/s, {entities} entities")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Checks that the indexed group_person_entities groups names exactly like the
+previous all-pairs implementation, then compares how both scale with the number
+of PERSON mentions.
+
+    python -m benchmarks.bench_grouping
+    python -m benchmarks.bench_grouping --trials 2000 --sizes 1000,5000,20000
+"""
+import argparse
+import random
+import time
+from collections import namedtuple
+
+from faker import Faker
+
+from app.helpers import group_person_entities
+
+Mention = namedtuple('Mention', ['text', 'label_'])
+
+
+def legacy_group_person_entities(ents):
+    """The all-pairs grouping as it was before the name-part index."""
+    persons = sorted([ent for ent in ents if ent.label_ == 'PERSON'], key=lambda x: len(x.text), reverse=True)
+    other_ents = [ent for ent in ents if ent.label_ != 'PERSON']
+    grouped_persons = {}
+    processed_texts = set()
+    for p1 in persons:
+        if p1.text in processed_texts:
+            continue
+        canonical_name = p1.text
+        variations = {p1.text}
+        processed_texts.add(p1.text)
+        name_parts = set(canonical_name.lower().split())
+        for p2 in persons:
+            if p2.text in processed_texts:
+                continue
+            p2_parts = set(p2.text.lower().split())
+            if p2_parts.issubset(name_parts):
+                variations.add(p2.text)
+                processed_texts.add(p2.text)
+        grouped_persons[canonical_name] = list(variations)
+    return grouped_persons, other_ents
+
+
+def random_mentions(rng, fake, count, pool_size):
+    """Mentions drawn from a small pool of names, their parts, reorderings and odd casing/spacing."""
+    names = [fake.name() for _ in range(pool_size)]
+    mentions = []
+    for _ in range(count):
+        name = rng.choice(names)
+        parts = name.split()
+        form = rng.random()
+        if form < 0.3:
+            text = name
+        elif form < 0.6:
+            text = rng.choice(parts)
+        elif form < 0.7:
+            text = ' '.join(reversed(parts))
+        elif form < 0.8:
+            text = name.upper() if rng.random() < 0.5 else name.lower()
+        elif form < 0.9:
+            text = '  '.join(rng.sample(parts, k=rng.randint(1, len(parts))))
+        else:
+            text = rng.choice([' ', '', fake.first_name()])
+        label = 'PERSON' if rng.random() < 0.9 else rng.choice(['ORG', 'GPE'])
+        mentions.append(Mention(text, label))
+    return mentions
+
+
+def normalise(result):
+    grouped, others = result
+    return [(name, sorted(variations)) for name, variations in grouped.items()], others
+
+
+def check_equivalence(trials, seed):
+    rng = random.Random(seed)
+    fake = Faker()
+    fake.seed_instance(seed)
+    for trial in range(trials):
+        mentions = random_mentions(rng, fake, rng.randint(0, 60), rng.randint(1, 12))
+        expected = normalise(legacy_group_person_entities(mentions))
+        actual = normalise(group_person_entities(mentions))
+        if expected != actual:
+            raise AssertionError(f"Trial {trial} differs for {mentions!r}:\n  legacy:  {expected}\n  indexed: {actual}")
+    print(f"Equivalence: {trials} random trials match the legacy grouping.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--trials', type=int, default=500, help='Random equivalence trials.')
+    parser.add_argument('--sizes', default='100,1000,5000,20000', help='PERSON mentions per document.')
+    parser.add_argument('--legacy-limit', type=int, default=5000,
+                        help='Skip the quadratic implementation above this many mentions.')
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+
+    check_equivalence(args.trials, args.seed)
+
+    rng = random.Random(args.seed)
+    fake = Faker()
+    fake.seed_instance(args.seed)
+    print(f"\n{'mentions':>9} {'legacy (s)':>12} {'indexed (s)':>12}")
+    for size in (int(s) for s in args.sizes.split(',')):
+        # Long reports and transcripts: many mentions of a growing cast of people.
+        mentions = random_mentions(rng, fake, size, max(10, size // 10))
+        start = time.perf_counter()
+        group_person_entities(mentions)
+        indexed_time = time.perf_counter() - start
+        if size <= args.legacy_limit:
+            start = time.perf_counter()
+            legacy_group_person_entities(mentions)
+            legacy = f"{time.perf_counter() - start:>12.4f}"
+        else:
+            legacy = f"{'skipped':>12}"
+        print(f"{size:>9} {legacy} {indexed_time:>12.4f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Reports startup time, memory per worker and per-document latency for the SpaCy
+pipelines used by each anonymization level. Latency is measured with the NER
+cache cleared before every document.
+
+Worker memory is measured the way Gunicorn runs the app: N children are forked
+either after the models were loaded in the parent (preload_app + SPACY_PRELOAD)
+or before (every worker loads its own copy). On Linux, PSS and private memory
+show how much of each worker is really shared. tests/test_pipelines.py checks
+that the pipelines are NER-only and that forked workers reuse preloaded ones.
+
+    python -m benchmarks.bench_pipeline
+    SPACY_MODEL_LOW=en_core_web_sm python -m benchmarks.bench_pipeline --workers 4
+"""
+import argparse
+import gc
+import json
+import os
+import time
+
+SAMPLE_TEXT = (
+    "My name is Sarah Malik and I am 45 years old. Last March I visited Dr. James Whitfield at the "
+    "Northern General Hospital in Sheffield, near the football stadium. My son, aged twelve, came with me. "
+    "We paid £40 for a taxi at 4:30 PM and the receptionist, Mrs. Okafor, told us the clinic was moving "
+    "to Rotherham in July 2024. Sarah's brother works for Sheffield City Council.\n\n"
+)
+
+
+def memory_usage():
+    """Returns RSS, PSS and private memory (MB) for the current process."""
+    usage = {}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                key, value = line.split(':', 1)
+                if key in ('Rss', 'Pss', 'Private_Clean', 'Private_Dirty'):
+                    usage[key] = int(value.split()[0]) / 1024
+        usage['Private'] = usage.pop('Private_Clean', 0) + usage.pop('Private_Dirty', 0)
+    except OSError:
+        import resource
+        usage['Rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {key.lower(): round(value, 1) for key, value in usage.items()}
+
+
+def run_worker(levels, text, load_models):
+    """Body of a forked worker: optionally load the models, process one document, report memory."""
+    from app import helpers
+    if load_models:
+        helpers.preload_pipelines()
+    for level in levels:
+        helpers.process_text_spacy(text, level)
+    return memory_usage()
+
+
+def fork_workers(count, levels, text, load_models):
+    results = []
+    children = []
+    for _ in range(count):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            try:
+                payload = json.dumps(run_worker(levels, text, load_models))
+            except Exception as e:
+                payload = json.dumps({'error': str(e)})
+            with os.fdopen(write_fd, 'w') as f:
+                f.write(payload)
+            os._exit(0)
+        os.close(write_fd)
+        children.append((pid, read_fd))
+
+    for pid, read_fd in children:
+        with os.fdopen(read_fd) as f:
+            results.append(json.loads(f.read() or '{}'))
+        os.waitpid(pid, 0)
+    return results
+
+
+def summarise(label, results):
+    keys = sorted({key for result in results for key in result if key != 'error'})
+    errors = [result['error'] for result in results if 'error' in result]
+    averages = {key: round(sum(r.get(key, 0) for r in results) / len(results), 1) for key in keys}
+    print(f"  {label}: " + ', '.join(f"{key}={value} MB" for key, value in averages.items()))
+    for error in errors:
+        print(f"    worker error: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=2, help='Number of forked workers to measure.')
+    parser.add_argument('--docs', type=int, default=20, help='Documents per level for the latency measurement.')
+    parser.add_argument('--paragraphs', type=int, default=10, help='Sample paragraphs per document.')
+    args = parser.parse_args()
+
+    text = SAMPLE_TEXT * args.paragraphs
+    levels = ['low', 'medium', 'high']
+
+    start = time.perf_counter()
+    from app import helpers
+    from app.ner_cache import ner_cache
+    helpers.configure_pipelines(os.environ.get('SPACY_MODEL'), os.environ.get('SPACY_MODEL_LOW'))
+    print(f"Import app.helpers: {time.perf_counter() - start:.3f}s (models are not loaded yet)")
+    print(f"Models per level: {helpers.LEVEL_MODELS}")
+
+    if hasattr(os, 'fork'):
+        print(f"\nWorker memory ({args.workers} workers):")
+        summarise('no preload, each worker loads its models', fork_workers(args.workers, levels, text, True))
+
+    print("\nStartup:")
+    for model_name in sorted(set(helpers.LEVEL_MODELS.values())):
+        start = time.perf_counter()
+        full = helpers.spacy.load(model_name)
+        full_time = time.perf_counter() - start
+        full_pipes = full.pipe_names
+        del full
+        gc.collect()
+
+        start = time.perf_counter()
+        helpers.get_nlp(next(level for level, name in helpers.LEVEL_MODELS.items() if name == model_name))
+        lazy_time = time.perf_counter() - start
+        print(f"  {model_name}: full pipeline {full_time:.2f}s {full_pipes}")
+        print(f"  {model_name}: NER-only     {lazy_time:.2f}s {helpers._pipelines[model_name].pipe_names}")
+    print(f"  Parent memory after loading: {memory_usage()}")
+
+    if hasattr(os, 'fork'):
+        print(f"\nWorker memory ({args.workers} workers):")
+        summarise('preloaded in parent, shared copy-on-write', fork_workers(args.workers, levels, text, False))
+
+    print(f"\nPer-document latency ({len(text)} chars, {args.docs} docs):")
+    for level in levels:
+        nlp = helpers.get_nlp(level)
+        nlp(text)  # warm up
+        start = time.perf_counter()
+        for _ in range(args.docs):
+            nlp(text)
+        nlp_time = (time.perf_counter() - start) / args.docs
+        # The same text every time, so the NER cache is cleared before each call to measure a real parse.
+        total_time = 0.0
+        for _ in range(args.docs):
+            ner_cache.clear()
+            start = time.perf_counter()
+            helpers.process_text_spacy(text, level)
+            total_time += time.perf_counter() - start
+        total_time /= args.docs
+        print(f"  {level:>6} ({helpers.LEVEL_MODELS[level]}): nlp() {nlp_time * 1000:.1f} ms, "
+              f"process_text_spacy {total_time * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
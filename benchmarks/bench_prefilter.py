@@ -0,0 +1,90 @@
+"""
+Measures the rule-based NER pre-filter on a labelled corpus of paragraphs
+(one JSON object per line: {"text": ..., "entities": [[text, label], ...]}):
+how many paragraphs skip the SpaCy pipeline, how many labelled entities are
+in the paragraphs that still reach it (recall against the labels), how many
+of the entities the full pipeline finds are in them (recall against the
+pipeline), and the time saved.
+
+    python -m benchmarks.bench_prefilter
+    python -m benchmarks.bench_prefilter --corpus notes.jsonl --show-misses
+    python -m benchmarks.bench_prefilter --no-pipeline
+"""
+import argparse
+import json
+import os
+import time
+
+from app.prefilter import ParagraphPrefilter
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), 'fixtures', 'prefilter_corpus.jsonl')
+
+
+def load_corpus(path):
+    with open(path, encoding='utf-8') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def recall(found, total):
+    return f"{found}/{total} ({found / total:.1%})" if total else 'n/a'
+
+
+def timed(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS)
+    parser.add_argument('--level', default='low')
+    parser.add_argument('--names', help='File of extra gazetteer names, one per line.')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-pipeline', action='store_true', help='Only compare against the labels.')
+    parser.add_argument('--show-misses', action='store_true', help='Print skipped paragraphs that have entities.')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    paragraphs = [item['text'] for item in corpus]
+    prefilter = ParagraphPrefilter([args.level], args.names)
+    kept = [prefilter.may_contain_targets(text) for text in paragraphs]
+    prefilter_time = timed(lambda: [prefilter.may_contain_targets(text) for text in paragraphs], args.repeat)
+
+    labelled = sum(len(item['entities']) for item in corpus)
+    labelled_kept = sum(len(item['entities']) for item, keep in zip(corpus, kept) if keep)
+    print(f"paragraphs:              {len(paragraphs)}")
+    print(f"skipped:                 {recall(kept.count(False), len(paragraphs))}")
+    print(f"recall vs labels:        {recall(labelled_kept, labelled)}")
+    print(f"pre-filter time:         {prefilter_time * 1000:.2f} ms")
+
+    misses = [('labels', item['text'], item['entities']) for item, keep in zip(corpus, kept)
+              if not keep and item['entities']]
+
+    if not args.no_pipeline:
+        from app.helpers import get_nlp, LEVEL_LABELS
+        nlp = get_nlp(args.level)
+        labels = LEVEL_LABELS[args.level]
+        found = [[(ent.text, ent.label_) for ent in doc.ents if ent.label_ in labels] for doc in nlp.pipe(paragraphs)]
+        pipeline_total = sum(len(ents) for ents in found)
+        pipeline_kept = sum(len(ents) for ents, keep in zip(found, kept) if keep)
+        kept_paragraphs = [text for text, keep in zip(paragraphs, kept) if keep]
+        full_time = timed(lambda: list(nlp.pipe(paragraphs)), args.repeat)
+        filtered_time = timed(lambda: list(nlp.pipe([text for text in paragraphs
+                                                     if prefilter.may_contain_targets(text)])), args.repeat)
+        print(f"recall vs pipeline:      {recall(pipeline_kept, pipeline_total)}")
+        print(f"full pipeline:           {full_time * 1000:.1f} ms for {len(paragraphs)} paragraphs")
+        print(f"pre-filter + pipeline:   {filtered_time * 1000:.1f} ms for {len(kept_paragraphs)} paragraphs "
+              f"({full_time / filtered_time:.1f}x)")
+        misses += [('pipeline', text, ents) for text, ents, keep in zip(paragraphs, found, kept) if not keep and ents]
+
+    if args.show_misses:
+        for source, text, entities in misses:
+            print(f"  missed ({source}) {entities}: {text}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Load test for the SQLite database under several worker processes, as with
+Gunicorn: writer processes insert and delete reports (like save_report and
+delete_history) while reader processes list recent reports (like /history).
+
+Runs once with a bare SQLAlchemy engine (the previous configuration) and once
+with the app's engine options and connection pragmas (WAL,
+synchronous=NORMAL, busy timeout, mmap), and reports operations per second
+and "database is locked" errors for each.
+
+    python -m benchmarks.bench_sqlite_concurrency
+    python -m benchmarks.bench_sqlite_concurrency --writers 4 --readers 8 --duration 10
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from app.database import engine_options, install_sqlite_pragmas
+
+REPORT_BYTES = 20000
+
+
+def make_engine(url, tuned):
+    if not tuned:
+        return create_engine(url)
+    engine = create_engine(url, **engine_options(url))
+    install_sqlite_pragmas(engine)
+    return engine
+
+
+def worker(url, tuned, role, duration, user_id, results):
+    engine = make_engine(url, tuned)
+    body = os.urandom(REPORT_BYTES)
+    operations = errors = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        try:
+            with engine.begin() as connection:
+                if role == 'writer':
+                    report_id = connection.execute(
+                        text('INSERT INTO report_history (user_id, timestamp, body) VALUES (:user_id, :now, :body)'),
+                        {'user_id': user_id, 'now': time.time(), 'body': body}).lastrowid
+                    if report_id % 3 == 0:
+                        connection.execute(text('DELETE FROM report_history WHERE id = :id'), {'id': report_id - 1})
+                else:
+                    connection.execute(text('SELECT id, timestamp FROM report_history WHERE user_id = :user_id '
+                                            'ORDER BY timestamp DESC LIMIT 10'), {'user_id': user_id}).fetchall()
+            operations += 1
+        except OperationalError:
+            errors += 1
+    results.put((role, operations, errors))
+
+
+def run(tuned, writers, readers, duration):
+    with tempfile.TemporaryDirectory() as directory:
+        url = 'sqlite:///' + os.path.join(directory, 'load.db')
+        with make_engine(url, tuned).begin() as connection:
+            connection.execute(text('CREATE TABLE report_history (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, '
+                                    'timestamp REAL NOT NULL, body BLOB NOT NULL)'))
+            connection.execute(text('CREATE INDEX ix_user_timestamp ON report_history (user_id, timestamp)'))
+
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=worker, args=(url, tuned, role, duration, number % 4, results))
+                     for number, role in enumerate(['writer'] * writers + ['reader'] * readers)]
+        for process in processes:
+            process.start()
+        totals = {'writer': [0, 0], 'reader': [0, 0]}
+        for _ in processes:
+            role, operations, errors = results.get()
+            totals[role][0] += operations
+            totals[role][1] += errors
+        for process in processes:
+            process.join()
+        return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=5.0, help='Seconds per configuration.')
+    args = parser.parse_args()
+
+    print(f"{'configuration':>14} {'writes/s':>9} {'write errors':>13} {'reads/s':>9} {'read errors':>12}")
+    for name, tuned in (('default', False), ('tuned', True)):
+        totals = run(tuned, args.writers, args.readers, args.duration)
+        (writes, write_errors), (reads, read_errors) = totals['writer'], totals['reader']
+        print(f"{name:>14} {writes / args.duration:>9.0f} {write_errors:>13} {reads / args.duration:>9.0f} "
+              f"{read_errors:>12}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Compares the compressed ReportHistory storage (zlib text, highlighted text as
+clean text plus a span list) with the previous three plain Text columns:
+bytes stored per report, SQLite file size, and the time to encode a report on
+save and decode it on read.
+
+    python -m benchmarks.bench_storage
+    python -m benchmarks.bench_storage --sizes 2000,50000,500000 --reports 200
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from faker import Faker
+
+from app.storage import compress_text, decompress_text, split_highlighted, join_highlighted
+
+
+def build_report(fake, size):
+    """An (original, highlighted, clean) triple of roughly `size` characters with names replaced."""
+    names = [fake.name() for _ in range(20)]
+    replacements = {name: fake.name() for name in names}
+    original, highlighted, clean = [], [], []
+    length = 0
+    while length < size:
+        sentence = fake.sentence(nb_words=12)
+        if random.random() < 0.3:
+            name = random.choice(names)
+            original.append(f"{name} {sentence}")
+            highlighted.append(f"<mark>{replacements[name]}</mark> {sentence}")
+            clean.append(f"{replacements[name]} {sentence}")
+        else:
+            for parts in (original, highlighted, clean):
+                parts.append(sentence)
+        length += len(original[-1]) + 1
+        if random.random() < 0.1:
+            for parts in (original, highlighted, clean):
+                parts.append('\n')
+    return ' '.join(original), ' '.join(highlighted), ' '.join(clean)
+
+
+def encode(original, highlighted, clean):
+    spans = split_highlighted(highlighted, clean)
+    return compress_text(original), compress_text(clean), spans, compress_text(highlighted) if spans is None else None
+
+
+def decode(row):
+    original, clean, spans, highlighted = row
+    clean = decompress_text(clean)
+    highlighted = decompress_text(highlighted) if highlighted is not None else join_highlighted(clean, spans)
+    return decompress_text(original), highlighted, clean
+
+
+def sqlite_size(rows, columns):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.db')
+        connection = sqlite3.connect(path)
+        connection.execute(f"CREATE TABLE report_history (id INTEGER PRIMARY KEY, {', '.join(columns)})")
+        placeholders = ', '.join('?' * len(columns))
+        connection.executemany(f"INSERT INTO report_history VALUES (NULL, {placeholders})", rows)
+        connection.commit()
+        connection.execute('VACUUM')
+        connection.close()
+        return os.path.getsize(path)
+
+
+def timed(func, items):
+    start = time.perf_counter()
+    results = [func(item) for item in items]
+    return time.perf_counter() - start, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='2000,20000,200000', help='Report lengths in characters.')
+    parser.add_argument('--reports', type=int, default=100, help='Reports per size.')
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    fake = Faker()
+    fake.seed_instance(args.seed)
+
+    print(f"{'chars':>8} {'plain KB':>10} {'stored KB':>10} {'ratio':>6} {'db plain KB':>12} {'db stored KB':>13} "
+          f"{'encode ms':>10} {'decode ms':>10}")
+    for size in (int(s) for s in args.sizes.split(',')):
+        reports = [build_report(fake, size) for _ in range(args.reports)]
+        encode_time, stored = timed(lambda report: encode(*report), reports)
+        decode_time, decoded = timed(decode, stored)
+        marker = '' if decoded == reports else '  (round trip differs)'
+
+        plain_bytes = sum(len(text.encode('utf-8')) for report in reports for text in report)
+        stored_bytes = sum(len(value) for row in stored for value in row if value is not None)
+        plain_db = sqlite_size(reports, ['original_text TEXT', 'anonymized_text_highlighted TEXT',
+                                         'anonymized_text_clean TEXT'])
+        stored_db = sqlite_size(stored, ['original_text_data BLOB', 'clean_text_data BLOB', 'highlight_spans BLOB',
+                                         'highlighted_text_data BLOB'])
+        print(f"{size:>8} {plain_bytes / 1024:>10.0f} {stored_bytes / 1024:>10.0f} {plain_bytes / stored_bytes:>5.1f}x "
+              f"{plain_db / 1024:>12.0f} {stored_db / 1024:>13.0f} "
+              f"{encode_time * 1000 / len(reports):>10.3f} {decode_time * 1000 / len(reports):>10.3f}{marker}")
+
+
+if __name__ == '__main__':
+    main()
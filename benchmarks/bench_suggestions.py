@@ -0,0 +1,57 @@
+"""
+Times get_entity_suggestions with and without a seeded rng, after the
+suggestion pool was filled: unseeded calls must pop the pre-generated
+buffers, and seeded calls sample the catalogues built by fill(), so neither
+generates Faker values on the calling thread. Exits with status 1 if an
+unseeded call was not served from the pool.
+
+    python -m benchmarks.bench_suggestions
+    python -m benchmarks.bench_suggestions --calls 20000 --locales en_US,en_GB
+"""
+import argparse
+import random
+import sys
+import time
+
+from app.helpers import get_entity_suggestions
+from app.suggestions import suggestion_pool
+
+LABELS = ['PERSON', 'GPE', 'ORG', 'DATE', 'FAC', 'TIME']
+
+
+def timed(func, calls):
+    start = time.perf_counter()
+    for index in range(calls):
+        func(LABELS[index % len(LABELS)])
+    return (time.perf_counter() - start) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=5000)
+    parser.add_argument('--size', type=int, default=2000, help='Pool size per locale and kind.')
+    parser.add_argument('--locales', default='en_US')
+    args = parser.parse_args()
+
+    suggestion_pool.configure(args.locales.split(','), args.size)
+    start = time.perf_counter()
+    suggestion_pool.fill()
+    print(f"fill (buffers and catalogues): {time.perf_counter() - start:.2f} s")
+
+    before = dict(suggestion_pool.counts)
+    # Stay within the buffers, so no value has to be generated on the spot.
+    unseeded_calls = min(args.calls, args.size // 3)
+    unseeded = timed(get_entity_suggestions, unseeded_calls)
+    pooled = suggestion_pool.counts['pooled'] - before['pooled']
+    generated = suggestion_pool.counts['generated'] - before['generated']
+    rng = random.Random(1)
+    seeded = timed(lambda label: get_entity_suggestions(label, rng=rng), args.calls)
+    print(f"unseeded: {unseeded * 1e6:.1f} us per call ({pooled} values from the pool, {generated} generated)")
+    print(f"seeded:   {seeded * 1e6:.1f} us per call")
+    if pooled == 0 or generated:
+        print("unseeded suggestions were not served from the pool", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Generates synthetic lived-experience reports: first-person paragraphs that
+mention a recurring cast of people (by full name, first name or title and
+surname), their ages, places, services, dates and NHS numbers. The size and
+the number of entity mentions per 1,000 characters are controlled, and the
+same seed always gives the same report.
+
+    python -m benchmarks.corpus --size 100KB > report.txt
+    python -m benchmarks.corpus --size 1MB --density 12 --seed 7 --output report.txt
+"""
+import argparse
+import random
+import sys
+
+from faker import Faker
+
+from app.helpers import fake_nhs_number
+
+# Sentences that mention entities, with how many mentions each one adds.
+ENTITY_TEMPLATES = [
+    ("My support worker {name} came round on {date} to go through the forms with me.", 2),
+    ("I told {first} that I was {age} years old when it all started.", 2),
+    ("{name} from {org} rang me about my appointment in {city}.", 3),
+    ("Dr {last} at {org} said the waiting list was {weeks} weeks long.", 2),
+    ("{first} was aged {age} and had just moved to {city}.", 3),
+    ("My NHS number is {nhs}, but the receptionist still could not find my records.", 1),
+    ("On {date} I went to the clinic on {street} with {first}.", 3),
+    ("{title} {last} wrote to me from {org} on {date}.", 3),
+    ("My neighbour {first} is {age} now and helps me with the shopping.", 2),
+]
+
+FILLER_SENTENCES = [
+    "I did not know who to ask for help.",
+    "Some days were better than others.",
+    "Nobody explained what would happen next.",
+    "I felt like I had to tell my story again every time.",
+    "The letters never arrived on time.",
+    "It took a long time before anyone listened.",
+    "I was anxious about going out on my own.",
+    "Things started to improve after that.",
+    "I had to wait on the phone for over an hour.",
+    "I still think about how it could have been handled differently.",
+]
+
+
+def parse_size(value):
+    """'1KB', '5MB', '2000' -> a number of bytes."""
+    value = value.strip().upper()
+    for suffix, factor in (('MB', 1024 * 1024), ('KB', 1024), ('B', 1)):
+        if value.endswith(suffix):
+            return int(float(value[:-len(suffix)]) * factor)
+    return int(value)
+
+
+def build_cast(fake, rng, count):
+    return [{'first': fake.first_name(), 'last': fake.last_name(), 'title': rng.choice(['Mr', 'Mrs', 'Ms', 'Dr'])}
+            for _ in range(count)]
+
+
+def _entity_sentence(fake, rng, cast):
+    template, mentions = rng.choice(ENTITY_TEMPLATES)
+    person = rng.choice(cast)
+    sentence = template.format(
+        name=f"{person['first']} {person['last']}", first=person['first'], last=person['last'],
+        title=person['title'], age=rng.randint(8, 90), date=fake.date(pattern='%d %B %Y'), city=fake.city(),
+        org=f"{fake.last_name()} {rng.choice(['Surgery', 'Medical Centre', 'Housing Association'])}",
+        street=fake.street_name(), weeks=rng.randint(2, 40), nhs=fake_nhs_number(rng))
+    return sentence, mentions
+
+
+def generate_report(size, density=8.0, seed=1234, locale='en_GB'):
+    """
+    A report of about `size` bytes with about `density` entity mentions per
+    1,000 characters. Returns (text, mentions).
+    """
+    rng = random.Random(seed)
+    fake = Faker(locale)
+    fake.seed_instance(seed)
+    # English filler words (the en_GB lorem provider is Latin).
+    words = Faker('en_US')
+    words.seed_instance(seed)
+    # Bigger reports have more people in them, but names still recur.
+    cast = build_cast(fake, rng, max(5, min(500, size // 20000)))
+
+    paragraphs, sentences = [], []
+    length = mentions = 0
+    while length < size:
+        if mentions < density * length / 1000:
+            sentence, count = _entity_sentence(fake, rng, cast)
+            mentions += count
+        elif rng.random() < 0.5:
+            sentence = rng.choice(FILLER_SENTENCES)
+        else:
+            sentence = words.sentence(nb_words=rng.randint(8, 18))
+        sentences.append(sentence)
+        length += len(sentence) + 1
+        if len(sentences) >= rng.randint(3, 7):
+            paragraphs.append(' '.join(sentences))
+            sentences = []
+            length += 1
+    if sentences:
+        paragraphs.append(' '.join(sentences))
+    return '\n\n'.join(paragraphs), mentions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', default='10KB', help='Report size, e.g. 1KB, 250KB, 5MB.')
+    parser.add_argument('--density', type=float, default=8.0, help='Entity mentions per 1,000 characters.')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--output', help='File to write (default: standard output).')
+    args = parser.parse_args()
+
+    text, mentions = generate_report(parse_size(args.size), args.density, args.seed)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(text)
+        print(f"{len(text)} characters, {mentions} entity mentions -> {args.output}", file=sys.stderr)
+    else:
+        sys.stdout.write(text)
+
+
+if __name__ == '__main__':
+    main()
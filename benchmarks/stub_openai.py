@@ -0,0 +1,97 @@
+"""
+A minimal OpenAI-compatible server for exercising the AI anonymization path
+without network access or an API key.
+
+It answers POST /v1/chat/completions in the JSON shape the app asks for:
+every "Firstname Lastname" pair in the report is replaced with a fixed
+pseudonym and reported in "changes". Latency and rate limiting can be
+simulated.
+
+    python -m benchmarks.stub_openai --port 8765 --delay 2
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 flask run
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+NAME_RE = re.compile(r'\b[A-Z][a-z]+ [A-Z][a-z]+\b')
+REPORT_RE = re.compile(r'---\n(.*)\n\s*---', re.S)
+
+
+def anonymize(report):
+    changes = {}
+
+    def replace(match):
+        name = match.group(0)
+        if name not in changes:
+            changes[name] = f"Person {len(changes) + 1}"
+        return changes[name]
+
+    text = NAME_RE.sub(replace, report)
+    return {'anonymized_text': text,
+            'changes': [{'original': original, 'replacement': replacement} for original, replacement in changes.items()]}
+
+
+def make_handler(delay, rate_limit_every):
+    counter = {'requests': 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            with lock:
+                counter['requests'] += 1
+                number = counter['requests']
+            if rate_limit_every and number % rate_limit_every == 0:
+                return self._send(429, {'error': {'message': 'Rate limit reached (stub).', 'type': 'requests',
+                                                  'code': 'rate_limit_exceeded'}})
+
+            time.sleep(delay)
+            prompt = body.get('messages', [{}])[-1].get('content', '')
+            match = REPORT_RE.search(prompt)
+            content = json.dumps(anonymize(match.group(1).strip() if match else prompt))
+            self._send(200, {
+                'id': f'chatcmpl-stub-{number}', 'object': 'chat.completion', 'created': int(time.time()),
+                'model': body.get('model', 'stub'),
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': content}}],
+                'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
+            })
+
+        def _send(self, status, payload):
+            data = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(port=8765, delay=0.0, rate_limit_every=0):
+    """Starts the stub in a background thread and returns the server (call .shutdown() to stop)."""
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(delay, rate_limit_every))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--delay', type=float, default=0.0, help='Seconds to wait before each response.')
+    parser.add_argument('--rate-limit-every', type=int, default=0, help='Answer every Nth request with HTTP 429.')
+    args = parser.parse_args()
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), make_handler(args.delay, args.rate_limit_every))
+    print(f"Stub OpenAI server on http://127.0.0.1:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+"""
+Times every stage of an anonymization on synthetic reports (see
+benchmarks.corpus) from 1 KB to 5 MB:
+
+    extract_txt, extract_docx, extract_pdf   extract_text_from_file on the report saved in each format
+    process_text_spacy                       entity recognition, grouping and suggestions (NER cache cleared)
+    finalize_spans, finalize_pattern         finalize_anonymization_text with the review spans / without them
+    render_pdf, render_docx                  the report generators, on the highlighted result
+
+Each stage runs up to --repeat times (fewer once --budget seconds are used up)
+and the best time per call is kept; stages that take less than 50 ms are
+called repeatedly within each run. Results are written as JSON. With --baseline, they
+are compared with an earlier results file, and the command exits with status
+1 if any stage got slower by more than --threshold.
+
+    python -m benchmarks --output results.json
+    python -m benchmarks.suite --sizes 1KB,100KB --stages process_text_spacy,finalize_spans
+    python -m benchmarks.suite --baseline baseline.json --update-baseline
+    python -m benchmarks.suite --baseline baseline.json --threshold 0.1 --output results.json
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from io import BytesIO
+
+from werkzeug.datastructures import FileStorage
+
+from app import helpers
+from app.bulk import review_choices
+from app.extraction import configure_extraction
+from app.ner_cache import ner_cache
+from benchmarks.corpus import generate_report, parse_size
+
+STAGES = ['extract_txt', 'extract_docx', 'extract_pdf', 'process_text_spacy', 'finalize_spans', 'finalize_pattern',
+          'render_pdf', 'render_docx']
+DEFAULT_SIZES = '1KB,10KB,100KB,1MB,5MB'
+
+
+def timed(func, repeat, budget, min_run=0.05):
+    """
+    (best seconds per call, runs, result) over up to `repeat` runs, stopping
+    early once `budget` seconds are spent. Fast stages are called several
+    times per run (at least `min_run` seconds), so microsecond timings are
+    not just noise.
+    """
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    number = min(1000, math.ceil(min_run / elapsed)) if 0 < elapsed < min_run else 1
+    best = elapsed
+    spent = elapsed
+    runs = 1
+    while runs < repeat and spent < budget:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        best = min(best, elapsed / number)
+        spent += elapsed
+        runs += 1
+    return best, runs, result
+
+
+def upload(data, filename):
+    return FileStorage(stream=BytesIO(data), filename=filename)
+
+
+def run_size(text, level, stages, repeat, budget):
+    """{stage: {'seconds', 'runs', 'mb_per_second'}} for one report."""
+    results = {}
+
+    def record(name, func):
+        seconds, runs, result = timed(func, repeat, budget)
+        results[name] = {'seconds': round(seconds, 6), 'runs': runs,
+                         'mb_per_second': round(len(text) / seconds / 1e6, 3) if seconds else None}
+        return result
+
+    data = {}
+    if 'extract_txt' in stages:
+        data['txt'] = text.encode('utf-8')
+    # The DOCX and PDF inputs are built from the original text, outside the timings.
+    if 'extract_docx' in stages:
+        data['docx'] = helpers.generate_docx_report(text, False).getvalue()
+    if 'extract_pdf' in stages:
+        data['pdf'] = helpers.generate_pdf_report(text, False).getvalue()
+    for extension, content in data.items():
+        extracted = record(f'extract_{extension}',
+                           lambda: helpers.extract_text_from_file(upload(content, f'report.{extension}')))
+        results[f'extract_{extension}']['bytes'] = len(content)
+        if extension == 'txt' and extracted != text:
+            raise RuntimeError('The extracted text does not match the report.')
+
+    needs_entities = stages & {'process_text_spacy', 'finalize_spans', 'finalize_pattern', 'render_pdf',
+                               'render_docx'}
+    if not needs_entities:
+        return results, None
+
+    def process():
+        ner_cache.clear()
+        return helpers.process_text_spacy(text, level)
+
+    entities = record('process_text_spacy', process) if 'process_text_spacy' in stages else process()
+    choices = review_choices(entities)
+
+    finalized = None
+    if 'finalize_spans' in stages:
+        finalized = record('finalize_spans', lambda: helpers.finalize_anonymization_text(text, choices, entities))
+    if 'finalize_pattern' in stages:
+        pattern_result = record('finalize_pattern', lambda: helpers.finalize_anonymization_text(text, choices))
+        if finalized is not None and pattern_result != finalized:
+            print('  warning: the span and pattern finalization results differ', file=sys.stderr)
+        finalized = pattern_result
+    if finalized is None:
+        finalized = helpers.finalize_anonymization_text(text, choices, entities)
+
+    highlighted = finalized['anonymized_text_highlighted']
+    if 'render_pdf' in stages:
+        record('render_pdf', lambda: helpers.generate_pdf_report(highlighted, True))
+    if 'render_docx' in stages:
+        record('render_docx', lambda: helpers.generate_docx_report(highlighted, True))
+    return results, len(entities)
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    import spacy
+    return {
+        'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'spacy': spacy.__version__,
+        'models': dict(helpers.LEVEL_MODELS),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Prints each stage's change against the baseline. Returns the (size, stage) pairs that regressed."""
+    if baseline['corpus'] != results['corpus']:
+        print(f"warning: the baseline used a different corpus ({baseline['corpus']})", file=sys.stderr)
+    regressions = []
+    print(f"\n{'size':>6} {'stage':<20} {'baseline (ms)':>14} {'current (ms)':>13} {'change':>8}")
+    for size, stages in results['sizes'].items():
+        for stage, timing in stages['stages'].items():
+            before = baseline['sizes'].get(size, {}).get('stages', {}).get(stage)
+            if before is None:
+                continue
+            change = timing['seconds'] / before['seconds'] - 1 if before['seconds'] else 0.0
+            marker = '  REGRESSION' if change > threshold else ''
+            if marker:
+                regressions.append((size, stage))
+            print(f"{size:>6} {stage:<20} {before['seconds'] * 1000:>14.3f} {timing['seconds'] * 1000:>13.3f} "
+                  f"{change:>+8.1%}{marker}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='Report sizes, e.g. 1KB,250KB,5MB.')
+    parser.add_argument('--density', type=float, default=8.0, help='Entity mentions per 1,000 characters.')
+    parser.add_argument('--level', default='medium', help='Anonymization level for process_text_spacy.')
+    parser.add_argument('--stages', default=','.join(STAGES), help='Comma-separated subset of the stages above.')
+    parser.add_argument('--repeat', type=int, default=3, help='Most runs per stage; the best is kept.')
+    parser.add_argument('--budget', type=float, default=30.0, help='No further runs of a stage after this many seconds.')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--output', help='Write the results to this JSON file.')
+    parser.add_argument('--baseline', help='Results file to compare with.')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Slowdown (as a fraction of the baseline time) that counts as a regression.')
+    parser.add_argument('--update-baseline', action='store_true', help='Write the results to --baseline instead.')
+    args = parser.parse_args()
+
+    stages = set(args.stages.split(','))
+    unknown = stages - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+    if args.update_baseline and not args.baseline:
+        parser.error('--update-baseline needs --baseline')
+
+    # Reports of any size in this suite must be accepted by the extraction limits.
+    configure_extraction(max_bytes=1024 * 1024 * 1024, max_pages=1000000)
+    ner_cache.configure(max_entries=512)
+    helpers.configure_pipelines(os.environ.get('SPACY_MODEL'), os.environ.get('SPACY_MODEL_LOW'))
+    if stages & {'process_text_spacy', 'finalize_spans', 'finalize_pattern', 'render_pdf', 'render_docx'}:
+        start = time.perf_counter()
+        helpers.get_nlp(args.level)
+        print(f"pipeline load: {time.perf_counter() - start:.2f} s")
+
+    results = {
+        'environment': environment(),
+        'corpus': {'density': args.density, 'seed': args.seed, 'level': args.level},
+        'sizes': {},
+    }
+    print(f"{'size':>6} {'stage':<20} {'ms':>10} {'runs':>5} {'MB/s':>8}")
+    for size in args.sizes.split(','):
+        text, mentions = generate_report(parse_size(size), args.density, args.seed)
+        timings, entities = run_size(text, args.level, stages, args.repeat, args.budget)
+        results['sizes'][size] = {'chars': len(text), 'mentions': mentions, 'entities': entities,
+                                  'stages': {stage: timings[stage] for stage in STAGES if stage in timings}}
+        for stage, timing in results['sizes'][size]['stages'].items():
+            print(f"{size:>6} {stage:<20} {timing['seconds'] * 1000:>10.3f} {timing['runs']:>5} "
+                  f"{timing['mb_per_second'] or 0:>8.2f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+        print(f"baseline written to {args.baseline}")
+    elif args.baseline:
+        with open(args.baseline, encoding='utf-8') as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} stage(s) slower than the baseline by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
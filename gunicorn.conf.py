@@ -0,0 +1,35 @@
+# Gunicorn configuration for production deployments:
+#
+#     SPACY_PRELOAD=1 gunicorn run:app
+#
+# With preload_app the application (and, with SPACY_PRELOAD set, every SpaCy
+# model it uses) is loaded once in the master process. Workers are forked from
+# it and share the model's memory pages copy-on-write instead of each loading
+# its own copy.
+import gc
+import glob
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count()))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+# Threaded workers, so a long-lived /jobs/<id>/events stream does not block a whole worker.
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+preload_app = True
+
+
+def pre_fork(server, worker):
+    # Move everything allocated so far into the permanent generation so the
+    # cyclic GC in a worker never writes to (and un-shares) those pages.
+    gc.freeze()
+
+
+def on_starting(server):
+    # With METRICS_DIR set, each worker writes its metrics to a file there; drop
+    # the files of a previous run so its workers are not added to this one's.
+    directory = os.environ.get('METRICS_DIR')
+    if directory:
+        for path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+            os.remove(path)
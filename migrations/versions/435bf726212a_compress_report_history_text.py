@@ -0,0 +1,140 @@
+"""Store ReportHistory texts compressed, highlighted text as clean text plus spans
+
+Revision ID: 435bf726212a
+Revises: 7adcc7d0bfeb
+Create Date: 2026-10-18 09:12:41.318204
+
+"""
+import zlib
+from array import array
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '435bf726212a'
+down_revision = '7adcc7d0bfeb'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 500
+
+# The storage format is frozen here rather than imported from app.storage,
+# so this migration keeps working if the application code changes.
+MARK_OPEN, MARK_CLOSE = '<mark>', '</mark>'
+
+
+def compress_text(text):
+    return zlib.compress(text.encode('utf-8'), 6)
+
+
+def decompress_text(data):
+    return zlib.decompress(data).decode('utf-8')
+
+
+def split_highlighted(highlighted, clean):
+    spans = array('I')
+    parts = []
+    position = length = 0
+    while True:
+        start = highlighted.find(MARK_OPEN, position)
+        if start < 0:
+            break
+        end = highlighted.find(MARK_CLOSE, start + len(MARK_OPEN))
+        if end < 0:
+            return None
+        before, marked = highlighted[position:start], highlighted[start + len(MARK_OPEN):end]
+        if MARK_OPEN in marked:
+            return None
+        parts.extend((before, marked))
+        length += len(before)
+        spans.extend((length, length + len(marked)))
+        length += len(marked)
+        position = end + len(MARK_CLOSE)
+    parts.append(highlighted[position:])
+    if MARK_CLOSE in parts[-1] or ''.join(parts) != clean:
+        return None
+    return zlib.compress(spans.tobytes(), 6)
+
+
+def join_highlighted(clean, data):
+    spans = array('I')
+    spans.frombytes(zlib.decompress(data))
+    parts = []
+    position = 0
+    for i in range(0, len(spans), 2):
+        parts.extend((clean[position:spans[i]], MARK_OPEN, clean[spans[i]:spans[i + 1]], MARK_CLOSE))
+        position = spans[i + 1]
+    parts.append(clean[position:])
+    return ''.join(parts)
+
+
+def convert_rows(select_sql, convert):
+    """Converts report_history rows in batches of BATCH_SIZE, in id order, so memory stays bounded."""
+    connection = op.get_bind()
+    last_id = 0
+    while True:
+        rows = connection.execute(sa.text(select_sql), {'last_id': last_id, 'limit': BATCH_SIZE}).fetchall()
+        if not rows:
+            break
+        for row in rows:
+            statement, values = convert(row)
+            connection.execute(sa.text(statement), {**values, 'id': row[0]})
+        last_id = rows[-1][0]
+
+
+def upgrade():
+    with op.batch_alter_table('report_history', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('original_text_data', sa.LargeBinary(), nullable=True))
+        batch_op.add_column(sa.Column('clean_text_data', sa.LargeBinary(), nullable=True))
+        batch_op.add_column(sa.Column('highlight_spans', sa.LargeBinary(), nullable=True))
+        batch_op.add_column(sa.Column('highlighted_text_data', sa.LargeBinary(), nullable=True))
+
+    def compress(row):
+        _, original, highlighted, clean = row
+        spans = split_highlighted(highlighted, clean)
+        return ('UPDATE report_history SET original_text_data = :original, clean_text_data = :clean, '
+                'highlight_spans = :spans, highlighted_text_data = :highlighted WHERE id = :id',
+                {'original': compress_text(original), 'clean': compress_text(clean), 'spans': spans,
+                 'highlighted': compress_text(highlighted) if spans is None else None})
+
+    convert_rows('SELECT id, original_text, anonymized_text_highlighted, anonymized_text_clean FROM report_history '
+                 'WHERE id > :last_id ORDER BY id LIMIT :limit', compress)
+
+    with op.batch_alter_table('report_history', schema=None) as batch_op:
+        batch_op.alter_column('original_text_data', existing_type=sa.LargeBinary(), nullable=False)
+        batch_op.alter_column('clean_text_data', existing_type=sa.LargeBinary(), nullable=False)
+        batch_op.drop_column('original_text')
+        batch_op.drop_column('anonymized_text_highlighted')
+        batch_op.drop_column('anonymized_text_clean')
+
+
+def downgrade():
+    with op.batch_alter_table('report_history', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('original_text', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('anonymized_text_highlighted', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('anonymized_text_clean', sa.Text(), nullable=True))
+
+    def decompress(row):
+        _, original, clean, spans, highlighted = row
+        clean = decompress_text(clean)
+        if highlighted is not None:
+            highlighted = decompress_text(highlighted)
+        else:
+            highlighted = join_highlighted(clean, spans) if spans is not None else clean
+        return ('UPDATE report_history SET original_text = :original, anonymized_text_highlighted = :highlighted, '
+                'anonymized_text_clean = :clean WHERE id = :id',
+                {'original': decompress_text(original), 'highlighted': highlighted, 'clean': clean})
+
+    convert_rows('SELECT id, original_text_data, clean_text_data, highlight_spans, highlighted_text_data '
+                 'FROM report_history WHERE id > :last_id ORDER BY id LIMIT :limit', decompress)
+
+    with op.batch_alter_table('report_history', schema=None) as batch_op:
+        batch_op.alter_column('original_text', existing_type=sa.Text(), nullable=False)
+        batch_op.alter_column('anonymized_text_highlighted', existing_type=sa.Text(), nullable=False)
+        batch_op.alter_column('anonymized_text_clean', existing_type=sa.Text(), nullable=False)
+        batch_op.drop_column('highlighted_text_data')
+        batch_op.drop_column('highlight_spans')
+        batch_op.drop_column('clean_text_data')
+        batch_op.drop_column('original_text_data')
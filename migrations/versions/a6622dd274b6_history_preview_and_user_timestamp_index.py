@@ -0,0 +1,48 @@
+"""Add ReportHistory preview column and (user_id, timestamp) index
+
+Revision ID: a6622dd274b6
+Revises: 435bf726212a
+Create Date: 2026-10-18 10:03:17.540921
+
+"""
+import zlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6622dd274b6'
+down_revision = '435bf726212a'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 500
+PREVIEW_CHARS = 250
+
+
+def upgrade():
+    with op.batch_alter_table('report_history', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('preview', sa.String(length=PREVIEW_CHARS + 3), server_default='', nullable=False))
+        batch_op.create_index('ix_report_history_user_id_timestamp', ['user_id', 'timestamp'], unique=False)
+
+    # Backfill previews from the compressed original text, in id-ordered batches.
+    connection = op.get_bind()
+    last_id = 0
+    while True:
+        rows = connection.execute(sa.text('SELECT id, original_text_data FROM report_history WHERE id > :last_id '
+                                          'ORDER BY id LIMIT :limit'), {'last_id': last_id, 'limit': BATCH_SIZE}).fetchall()
+        if not rows:
+            break
+        for report_id, data in rows:
+            text = zlib.decompress(data).decode('utf-8')
+            preview = text[:PREVIEW_CHARS] + ('...' if len(text) > PREVIEW_CHARS else '')
+            connection.execute(sa.text('UPDATE report_history SET preview = :preview WHERE id = :id'),
+                               {'preview': preview, 'id': report_id})
+        last_id = rows[-1][0]
+
+
+def downgrade():
+    with op.batch_alter_table('report_history', schema=None) as batch_op:
+        batch_op.drop_index('ix_report_history_user_id_timestamp')
+        batch_op.drop_column('preview')
@@ -0,0 +1,48 @@
+"""Add FTS5 search index over anonymized report text
+
+Revision ID: bda464f39cbb
+Revises: a6622dd274b6
+Create Date: 2026-10-18 10:48:52.116730
+
+"""
+import zlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'bda464f39cbb'
+down_revision = 'a6622dd274b6'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 500
+
+
+def upgrade():
+    connection = op.get_bind()
+    if connection.dialect.name != 'sqlite':
+        return
+    connection.execute(sa.text("CREATE VIRTUAL TABLE IF NOT EXISTS report_search "
+                               "USING fts5(body, owner, tokenize='unicode61 remove_diacritics 2')"))
+
+    # Index the clean (anonymized) text of existing reports in id-ordered batches. The original text is never indexed.
+    # `owner` is a per-user token ("u<user id>") that searches match on, so they only visit that user's reports.
+    last_id = 0
+    while True:
+        rows = connection.execute(sa.text('SELECT id, user_id, clean_text_data FROM report_history WHERE id > :last_id '
+                                          'ORDER BY id LIMIT :limit'), {'last_id': last_id, 'limit': BATCH_SIZE}).fetchall()
+        if not rows:
+            break
+        connection.execute(sa.text('INSERT OR REPLACE INTO report_search (rowid, body, owner) '
+                                   'VALUES (:id, :body, :owner)'),
+                           [{'id': report_id, 'body': zlib.decompress(data).decode('utf-8'), 'owner': f'u{user_id}'}
+                            for report_id, user_id, data in rows])
+        last_id = rows[-1][0]
+
+
+def downgrade():
+    connection = op.get_bind()
+    if connection.dialect.name == 'sqlite':
+        connection.execute(sa.text('DROP TABLE IF EXISTS report_search'))
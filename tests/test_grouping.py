@@ -0,0 +1,28 @@
+"""group_person_entities must group names exactly like the previous all-pairs implementation."""
+import random
+
+import pytest
+from faker import Faker
+
+from app.helpers import group_person_entities
+from benchmarks.bench_grouping import Mention, legacy_group_person_entities, normalise, random_mentions
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_matches_legacy_grouping(seed):
+    rng = random.Random(seed)
+    fake = Faker()
+    fake.seed_instance(seed)
+    for _ in range(200):
+        mentions = random_mentions(rng, fake, rng.randint(0, 60), rng.randint(1, 12))
+        assert normalise(group_person_entities(mentions)) == normalise(legacy_group_person_entities(mentions)), \
+            mentions
+
+
+def test_partial_names_join_the_full_name():
+    mentions = [Mention(text, 'PERSON') for text in ('Sarah', 'Sarah Malik', 'Malik', 'James')]
+    mentions.append(Mention('Leeds', 'GPE'))
+    grouped, others = group_person_entities(mentions)
+    assert sorted(grouped['Sarah Malik']) == ['Malik', 'Sarah', 'Sarah Malik']
+    assert grouped['James'] == ['James']
+    assert others == [Mention('Leeds', 'GPE')]
@@ -0,0 +1,64 @@
+"""The lazy pipeline loader: NER-only pipelines, one per model, shared with forked workers after a preload."""
+import os
+
+import pytest
+import spacy
+
+from app import helpers
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    """Replaces spacy.load with a blank pipeline holding every en_core_web component; returns the loaded names."""
+    loaded = []
+
+    def fake_load(name, exclude=()):
+        loaded.append(name)
+        nlp = spacy.blank('en')
+        for component in ['tok2vec', 'tagger', 'parser', 'attribute_ruler', 'lemmatizer', 'ner']:
+            if component not in exclude:
+                nlp.add_pipe(component)
+        return nlp
+
+    monkeypatch.setattr(helpers.spacy, 'load', fake_load)
+    monkeypatch.setattr(helpers, '_pipelines', {})
+    monkeypatch.setattr(helpers, 'LEVEL_MODELS', dict(helpers.LEVEL_MODELS))
+    monkeypatch.setattr(helpers.gazetteer, 'path', None)
+    return loaded
+
+
+def test_unused_components_are_excluded(loads):
+    helpers.configure_pipelines('model_a', 'model_b')
+    for level in ('low', 'medium', 'high'):
+        pipe_names = helpers.get_nlp(level).pipe_names
+        assert not set(pipe_names) & set(helpers.UNUSED_COMPONENTS)
+        assert pipe_names == ['entity_ruler', 'ner']
+
+
+def test_levels_with_the_same_model_share_one_pipeline(loads):
+    helpers.configure_pipelines('model_a', 'model_b')
+    assert helpers.get_nlp('medium') is helpers.get_nlp('high')
+    assert helpers.get_nlp('low') is not helpers.get_nlp('medium')
+    assert sorted(loads) == ['model_a', 'model_b']
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_preloaded_pipelines_are_reused_by_forked_workers(loads):
+    helpers.configure_pipelines('model_a')
+    helpers.preload_pipelines()
+    assert loads == ['model_a']
+    parent_ids = {level: id(helpers.get_nlp(level)) for level in ('low', 'medium', 'high')}
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        # Same objects (so the same copy-on-write pages) and no second load in the worker.
+        shared = all(id(helpers.get_nlp(level)) == parent_ids[level] for level in parent_ids) and len(loads) == 1
+        os.write(write_fd, b'1' if shared else b'0')
+        os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd, 'rb') as pipe:
+        result = pipe.read()
+    os.waitpid(pid, 0)
+    assert result == b'1'
@@ -0,0 +1,36 @@
+"""A pre-render that is still running when its report is deleted must not leave files behind."""
+import os
+import threading
+
+from app import renders
+
+
+def test_prerender_of_a_deleted_report_is_discarded(tmp_path, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+    renderer, extension, mimetype = renders.FORMATS['pdf']
+
+    def slow_renderer(text, highlighted, output):
+        started.set()
+        release.wait(5)
+        renderer(text, highlighted, output)
+
+    monkeypatch.setitem(renders.FORMATS, 'pdf', (slow_renderer, extension, mimetype))
+    cache = renders.RenderCache(str(tmp_path), [('pdf', True)], max_workers=1)
+    cache.prerender(7, 'Report text', 'Report text')
+    assert started.wait(5)
+
+    cache.invalidate(7)
+    release.set()
+    cache._get_executor().shutdown(wait=True)
+
+    assert not os.path.exists(tmp_path / '7')
+    assert cache.stats()['prerender_failures'] == 0
+    assert not cache._queued and not cache._generations
+
+
+def test_prerender_writes_the_configured_variants(tmp_path):
+    cache = renders.RenderCache(str(tmp_path), [('pdf', True), ('docx', False)])
+    cache.prerender(8, 'Report <mark>text</mark>', 'Report text')
+    cache._get_executor().shutdown(wait=True)
+
+    assert sorted(name.split('-')[0] for name in os.listdir(tmp_path / '8')) == ['docx', 'pdf']